@@ -0,0 +1,246 @@
+# -*- coding: utf-8
+"""Lock throughput and latency benchmarks.
+
+Each benchmark runs an operation on a set of objects, from one or several threads,
+against a lock table that already has a given number of lock tokens (a part of them
+expired). The results are reported as operations per second and latency percentiles.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import datetime
+import os
+import threading
+import time
+import warnings
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.db import connection, connections
+from django.utils import timezone
+
+import six
+from tests.models import TestModel
+
+from lock_tokens.models import LockToken, get_random_token
+from lock_tokens.sessions import check_for_session, lock_for_session, unlock_for_session
+from lock_tokens.settings import TIMEOUT
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+BATCH_SIZE = 5000
+
+
+def reset_database():
+    """Recreates the benchmark database."""
+    connections.close_all()
+    name = connection.settings_dict['NAME']
+    if os.path.exists(name):
+        os.remove(name)
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def populate(size, expired_ratio):
+    """Fills the lock table with size lock tokens on objects that are not used by the
+    benchmarks, expired_ratio of them being expired."""
+    contenttype = ContentType.objects.get_for_model(TestModel)
+    now = timezone.now()
+    expired_at = now - datetime.timedelta(seconds=TIMEOUT + 1)
+    n_expired = int(size * expired_ratio)
+    for start in range(0, size, BATCH_SIZE):
+        lock_tokens = []
+        for i in range(start, min(start + BATCH_SIZE, size)):
+            locked_at = expired_at if i < n_expired else now
+            lock_tokens.append(LockToken(
+                token_str=get_random_token(),
+                locked_object_content_type=contenttype,
+                # These ids do not clash with the ids of the objects of the benchmarks
+                locked_object_id=i + 10 ** 9,
+                locked_at=locked_at,
+                expires_at=locked_at + datetime.timedelta(seconds=TIMEOUT),
+            ))
+        LockToken.objects.bulk_create(lock_tokens)
+
+
+def create_objects(n):
+    TestModel.objects.bulk_create(TestModel(name='benchmark %d' % i) for i in range(n))
+    return list(TestModel.objects.order_by('-id')[:n])
+
+
+class Benchmark(object):
+    """An operation run once per object of each thread. ``setup`` is run for each
+    thread before the operation is timed, and returns the state given to ``run``."""
+
+    name = None
+
+    def setup(self, objs):
+        return None
+
+    def run(self, obj, index, state):
+        raise NotImplementedError
+
+
+class LockBenchmark(Benchmark):
+    name = 'lock'
+
+    def run(self, obj, index, state):
+        obj.lock()
+
+
+class RenewBenchmark(Benchmark):
+    name = 'renew'
+
+    def setup(self, objs):
+        return [obj.lock()['token'] for obj in objs]
+
+    def run(self, obj, index, tokens):
+        obj.lock(tokens[index])
+
+
+class CheckLockTokenBenchmark(RenewBenchmark):
+    name = 'check_lock_token'
+
+    def run(self, obj, index, tokens):
+        obj.check_lock_token(tokens[index])
+
+
+class IsLockedBenchmark(RenewBenchmark):
+    name = 'is_locked'
+
+    def run(self, obj, index, tokens):
+        obj.is_locked()
+
+
+class UnlockBenchmark(RenewBenchmark):
+    name = 'unlock'
+
+    def run(self, obj, index, tokens):
+        obj.unlock(tokens[index])
+
+
+class SessionBenchmark(Benchmark):
+    """Locks, checks and unlocks each object in a session."""
+    name = 'session'
+
+    def setup(self, objs):
+        return SessionStore()
+
+    def run(self, obj, index, session):
+        lock_for_session(obj, session)
+        check_for_session(obj, session)
+        unlock_for_session(obj, session)
+
+
+BENCHMARKS = [LockBenchmark(), RenewBenchmark(), CheckLockTokenBenchmark(),
+              IsLockedBenchmark(), UnlockBenchmark(), SessionBenchmark()]
+
+
+def get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    return sorted_values[int(round(percentile / 100 * (len(sorted_values) - 1)))]
+
+
+def summarize(name, size, threads, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'benchmark': name,
+        'size': size,
+        'threads': threads,
+        'operations': len(latencies),
+        'errors': errors,
+        'ops_per_sec': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': (get_percentile(latencies, 50) or 0) * 1000,
+        'p99_ms': (get_percentile(latencies, 99) or 0) * 1000,
+    }
+
+
+def run_benchmark(benchmark, objs_by_thread, size):
+    """Runs the benchmark from one thread per object list, and returns its results."""
+    states = [benchmark.setup(objs) for objs in objs_by_thread]
+    latencies = []
+    errors = []
+    barrier = threading.Barrier(len(objs_by_thread)) if hasattr(
+        threading, 'Barrier') else None
+
+    def worker(objs, state):
+        thread_latencies = []
+        thread_errors = 0
+        try:
+            if barrier is not None:
+                barrier.wait()
+            for index, obj in enumerate(objs):
+                started = _clock()
+                try:
+                    benchmark.run(obj, index, state)
+                except Exception:
+                    thread_errors += 1
+                    continue
+                thread_latencies.append(_clock() - started)
+        finally:
+            connection.close()
+        latencies.extend(thread_latencies)
+        errors.append(thread_errors)
+
+    # Django connections are per thread: close the one of the main thread so that the
+    # setup transactions are not kept open
+    connections.close_all()
+    threads = [threading.Thread(target=worker, args=(objs, state))
+               for objs, state in zip(objs_by_thread, states)]
+    started = _clock()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = _clock() - started
+    # Leave the objects unlocked for the next benchmark
+    LockToken.objects.filter(locked_object_id__lt=10 ** 9).delete()
+    return summarize(benchmark.name, size, len(objs_by_thread), latencies, sum(errors),
+                     elapsed)
+
+
+def run_remove_expired_locks(size):
+    """Times the removal of the expired lock tokens with the management command."""
+    expired = LockToken.objects.filter(expires_at__lt=timezone.now()).count()
+    started = _clock()
+    call_command('remove_expired_locks', stdout=six.StringIO())
+    elapsed = _clock() - started
+    return {
+        'benchmark': 'remove_expired_locks',
+        'size': size,
+        'threads': 1,
+        'operations': expired,
+        'errors': 0,
+        'ops_per_sec': expired / elapsed if elapsed else None,
+        'p50_ms': None,
+        'p99_ms': None,
+        'total_ms': elapsed * 1000,
+    }
+
+
+def run_benchmarks(sizes, thread_counts, operations, expired_ratio, names=None,
+                   progress=None):
+    """Runs the benchmarks for each lock table size and thread count, and returns the
+    list of their results. ``operations`` is the number of operations per thread."""
+    results = []
+    benchmarks = [b for b in BENCHMARKS if names is None or b.name in names]
+    warnings.simplefilter('ignore')
+    for size in sizes:
+        reset_database()
+        populate(size, expired_ratio)
+        objs = create_objects(operations * max(thread_counts))
+        for threads in thread_counts:
+            objs_by_thread = [objs[i * operations:(i + 1) * operations]
+                              for i in range(threads)]
+            for benchmark in benchmarks:
+                result = run_benchmark(benchmark, objs_by_thread, size)
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+        if names is None or 'remove_expired_locks' in names:
+            result = run_remove_expired_locks(size)
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return results
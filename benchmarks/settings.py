@@ -0,0 +1,23 @@
+# -*- coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import os
+import tempfile
+
+from tests.settings import *  # noqa
+
+
+# The benchmarks run against a file-backed SQLite database, which is recreated for each
+# lock table size
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("LOCK_TOKENS_BENCHMARK_DB", os.path.join(
+            tempfile.gettempdir(), "lock_tokens_benchmarks.sqlite3")),
+        "OPTIONS": {
+            "timeout": 30,
+        },
+    }
+}
+
+DEBUG = False
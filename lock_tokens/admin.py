@@ -1,21 +1,67 @@
+from django.conf.urls import url
 from django.contrib import admin, messages
-from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
-from django.db.models import Count
+from django.http import JsonResponse
+from django.template.response import TemplateResponse
 
 from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.managers import (
+    annotate_lock_status,
+    filter_locked,
+    invalidate_state_cache,
+)
+from lock_tokens.reaper import exclude_leader_token
+from lock_tokens.registry import registry
 from lock_tokens.sessions import (
     check_for_session,
-    get_session_key,
+    get_session_token,
     lock_for_session,
     unlock_for_session
 )
+from lock_tokens.stats import get_lock_stats, serialize_lock_stats
+
+
+class LockStatusFilter(admin.SimpleListFilter):
+
+    title = 'Lock status'
+    parameter_name = 'locked'
+
+    def lookups(self, request, model_admin):
+        return (('1', 'Locked'), ('0', 'Unlocked'))
+
+    def queryset(self, request, queryset):
+        if self.value() in ('0', '1'):
+            return filter_locked(queryset, locked=(self.value() == '1'))
+        return queryset
 
 
 class LockableModelAdmin(admin.ModelAdmin):
 
     change_form_template = 'admin/lock_tokens_change_form.html'
 
+    def __init__(self, model, admin_site):
+        # The admin change form uses the API to handle the lock
+        registry.register(model)
+        super(LockableModelAdmin, self).__init__(model, admin_site)
+
+    def get_queryset(self, request):
+        # The lock status of the objects is fetched with the objects
+        return annotate_lock_status(super(LockableModelAdmin, self).get_queryset(request))
+
+    def get_list_display(self, request):
+        return tuple(super(LockableModelAdmin, self).get_list_display(request)) + (
+            'lock_status',)
+
+    def get_list_filter(self, request):
+        return tuple(super(LockableModelAdmin, self).get_list_filter(request)) + (
+            LockStatusFilter,)
+
+    def lock_status(self, obj):
+        return obj.locked
+    lock_status.boolean = True
+    lock_status.short_description = 'Locked'
+    lock_status.admin_order_field = 'locked'
+
     def change_view(self, request, object_id, form_url="", extra_context=None):
         extra_context = extra_context or {}
         extra_context["already_locked"] = False
@@ -30,7 +76,7 @@ class LockableModelAdmin(admin.ModelAdmin):
             # have a valid token in session.
             force_new_session_lock = (request.method == 'GET')
             lock_for_session(obj, request.session, force_new=force_new_session_lock)
-            extra_context["lock_token"] = request.session[get_session_key(obj)]
+            extra_context["lock_token"] = get_session_token(obj, request.session)
         except AlreadyLockedError:
             messages.add_message(request, messages.ERROR, "You cannot edit this "
                                  "object, it has been locked. Come back later.")
@@ -59,8 +105,8 @@ class LockedContentTypesFilter(admin.SimpleListFilter):
     parameter_name = 'contenttype'
 
     def lookups(self, request, model_admin):
-        return ((c.id, c.name) for c in ContentType.objects.annotate(
-            nb_locks=Count('locktoken')).filter(nb_locks__gt=0))
+        # The content types that have locks are taken from the cached lock statistics
+        return ((c['id'], c['name']) for c in get_lock_stats()['content_types'])
 
     def queryset(self, request, queryset):
         contenttype_id = self.value()
@@ -72,10 +118,46 @@ class LockedContentTypesFilter(admin.SimpleListFilter):
 class LockTokenAdmin(admin.ModelAdmin):
 
     list_display = ('token_str', 'locked_object_content_type', 'locked_object_id',
-                    'locked_at', 'expired', )
+                    'locked_at', 'expires_at', 'expired', 'shared', )
     list_filter = (LockedContentTypesFilter,)
     readonly_fields = ('locked_object_content_type', 'locked_object_id',
-                       'token_str', 'locked_at',)
+                       'token_str', 'locked_at', 'expires_at', 'shared',)
+
+    change_list_template = 'admin/lock_tokens_change_list.html'
 
     def expired(self, obj):
         return obj.has_expired()
+
+    def get_queryset(self, request):
+        # The lock token of the reaper is not a lock on an object
+        return exclude_leader_token(super(LockTokenAdmin, self).get_queryset(request))
+
+    def delete_queryset(self, request, queryset):
+        # Bulk deletions do not go through LockToken.delete
+        invalidate_state_cache(queryset)
+        super(LockTokenAdmin, self).delete_queryset(request, queryset)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            url(r'^stats/$', self.admin_site.admin_view(self.stats_view),
+                name='%s_%s_stats' % info),
+            url(r'^stats/json/$', self.admin_site.admin_view(self.stats_json_view),
+                name='%s_%s_stats_json' % info),
+        ] + super(LockTokenAdmin, self).get_urls()
+
+    def stats_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title="Lock statistics",
+            stats=get_lock_stats(),
+        )
+        return TemplateResponse(request, 'admin/lock_tokens_stats.html', context)
+
+    def stats_json_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        return JsonResponse(serialize_lock_stats(get_lock_stats()))
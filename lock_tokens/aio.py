@@ -0,0 +1,207 @@
+"""Asynchronous helpers, views and decorators, for ASGI deployments.
+
+This module requires Python 3.5 and Django 3.0 or later.
+"""
+import asyncio
+import functools
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseForbidden
+
+from lock_tokens.backends import get_backend
+from lock_tokens.exceptions import AlreadyLockedError, InvalidToken
+from lock_tokens.models import LockableModel
+from lock_tokens.sessions import (
+    check_for_session,
+    get_held_session_lock,
+    lock_for_session,
+    unlock_for_session,
+)
+from lock_tokens.utils import get_lock_token_to_hold, get_object_to_lock
+from lock_tokens.views import LockTokenBatchView, LockTokenDetailView, LockTokenListView
+
+
+logger = logging.getLogger(__name__)
+
+alock_for_session = sync_to_async(lock_for_session)
+aunlock_for_session = sync_to_async(unlock_for_session)
+acheck_for_session = sync_to_async(check_for_session)
+
+
+class AsyncLockHolder(object):
+    """Holds a lock on an object from an asyncio task, by renewing its lock token every
+    ``interval`` seconds (defaults to one second before it expires) between calls to
+    start and stop. The object is locked by start if no token is given."""
+
+    def __init__(self, obj, token=None, interval=None):
+        self._obj = obj
+        self._token = token
+        self.interval = interval
+        self._lock_token = None
+        self._task = None
+
+    async def _hold(self, interval):
+        renew = sync_to_async(get_backend().renew)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await renew(self._lock_token)
+            except InvalidToken:
+                # The lock is lost
+                return
+            except Exception:
+                # Like with LockHolder, the lock is considered lost
+                logger.exception("Could not renew lock token")
+                return
+
+    def _init(self):
+        self._lock_token = get_lock_token_to_hold(self._obj, self._token)
+        if self.interval is None:
+            self.interval = max(self._lock_token.get_ttl() - 1, 1)
+
+    async def start(self):
+        if not self._lock_token:
+            await sync_to_async(self._init)()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._hold(self.interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.exception("Lock holder task failed")
+            self._task = None
+
+
+class lock_object(object):
+    """Asynchronous context manager that locks obj, optionally holding the lock, and
+    unlocks it on exit::
+
+        async with lock_object(obj) as token:
+            ...
+
+    The target of the ``as`` clause is the token dict returned by ``lock``.
+    """
+
+    def __init__(self, obj, token=None, hold=True):
+        self._obj = obj
+        self._token = token
+        self._holder = None
+        self.token = None
+        self.hold = hold
+
+    async def __aenter__(self):
+        self.token = await LockableModel.alock(self._obj, self._token)
+        if self.hold:
+            self._holder = AsyncLockHolder(self._obj, self.token['token'])
+            await self._holder.start()
+        return self.token
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self._holder is not None:
+            await self._holder.stop()
+        await LockableModel.aunlock(self._obj, self.token['token'])
+
+
+def _lock_for_session(model, object_id, existence_check, session, wait=None):
+    obj = get_object_to_lock(model, object_id, existence_check)
+    lock_for_session(obj, session, wait=wait)
+    # The lock held may be the one on an ancestor of obj
+    return obj, get_held_session_lock(obj, session)
+
+
+def alocks_object(model, get_object_id_fn, existence_check=None, wait=None):
+    """Asynchronous version of lock_tokens.decorators.locks_object, for async views."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            object_id = get_object_id_fn(request, *args, **kwargs)
+            try:
+                await sync_to_async(_lock_for_session)(model, object_id,
+                                                       existence_check, request.session,
+                                                       wait)
+            except AlreadyLockedError:
+                return HttpResponseForbidden("The object you are trying to access is "
+                                             "locked.")
+            return await view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def aholds_lock_on_object(model, get_object_id_fn, existence_check=None, wait=None):
+    """Asynchronous version of lock_tokens.decorators.holds_lock_on_object, for async
+    views. The lock is renewed from an asyncio task."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            object_id = get_object_id_fn(request, *args, **kwargs)
+            try:
+                obj, held_lock = await sync_to_async(_lock_for_session)(
+                    model, object_id, existence_check, request.session, wait)
+            except AlreadyLockedError:
+                return HttpResponseForbidden("The object you are trying to access is "
+                                             "locked.")
+            lock_holder = AsyncLockHolder(*held_lock)
+            await lock_holder.start()
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                await lock_holder.stop()
+            await aunlock_for_session(obj, request.session)
+            return response
+        return wrapped
+    return decorator
+
+
+class AsyncViewMixin(object):
+    """Makes the API views asynchronous. Each request is handled with a single
+    sync_to_async call."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncViewMixin, cls).as_view(**initkwargs)
+        if asyncio.iscoroutinefunction(view):
+            return view
+
+        # Django < 4.1 does not detect asynchronous class-based views
+        async def async_view(*args, **kwargs):
+            response = view(*args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+
+class AsyncLockTokenListView(AsyncViewMixin, LockTokenListView):
+
+    async def post(self, *args, **kwargs):
+        return await sync_to_async(super(AsyncLockTokenListView, self).post)(*args,
+                                                                             **kwargs)
+
+
+class AsyncLockTokenDetailView(AsyncViewMixin, LockTokenDetailView):
+
+    async def get(self, *args, **kwargs):
+        return await sync_to_async(super(AsyncLockTokenDetailView, self).get)(*args,
+                                                                              **kwargs)
+
+    async def patch(self, *args, **kwargs):
+        return await sync_to_async(super(AsyncLockTokenDetailView, self).patch)(*args,
+                                                                                **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await sync_to_async(super(AsyncLockTokenDetailView, self).delete)(
+            *args, **kwargs)
+
+
+class AsyncLockTokenBatchView(AsyncViewMixin, LockTokenBatchView):
+
+    async def post(self, *args, **kwargs):
+        return await sync_to_async(super(AsyncLockTokenBatchView, self).post)(*args,
+                                                                              **kwargs)
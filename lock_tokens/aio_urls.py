@@ -0,0 +1,18 @@
+from django.conf.urls import url
+
+from lock_tokens.aio import (
+    AsyncLockTokenBatchView,
+    AsyncLockTokenDetailView,
+    AsyncLockTokenListView,
+)
+
+
+app_name = 'lock_tokens'
+
+urlpatterns = [
+    url(r'^batch/$', AsyncLockTokenBatchView.as_view(), name='batch-view'),
+    url(r'^(?P<app_label>\w+)/(?P<model>\w+)/(?P<object_id>\d+)/$',
+        AsyncLockTokenListView.as_view(), name='list-view'),
+    url(r'^(?P<app_label>\w+)/(?P<model>\w+)/(?P<object_id>\d+)/(?P<token>\w+)/$',
+        AsyncLockTokenDetailView.as_view(), name='detail-view'),
+]
@@ -4,3 +4,21 @@ from django.apps import AppConfig
 
 class LockTokensConfig(AppConfig):
     name = 'lock_tokens'
+
+    def ready(self):
+        from lock_tokens.registry import registry
+        from lock_tokens.settings import METRICS_ENABLED, METRICS_SINK, REAPER_ENABLED
+        registry.autodiscover()
+
+        if METRICS_ENABLED:
+            from django.utils.module_loading import import_string
+            from lock_tokens.metrics import set_sink
+            set_sink(import_string(METRICS_SINK)())
+
+        if REAPER_ENABLED:
+            # Not started right away, so that management commands, shells and the
+            # processes forking workers do not run a reaper
+            from django.core.signals import request_started
+            from lock_tokens.reaper import start_reaper
+            request_started.connect(start_reaper,
+                                    dispatch_uid='lock_tokens_start_reaper')
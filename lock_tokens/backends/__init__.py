@@ -0,0 +1,14 @@
+from django.utils.module_loading import import_string
+
+from lock_tokens.settings import BACKEND
+
+
+_backend = None
+
+
+def get_backend():
+    """Returns the lock storage backend instance configured by the BACKEND setting."""
+    global _backend
+    if _backend is None:
+        _backend = import_string(BACKEND)()
+    return _backend
@@ -0,0 +1,164 @@
+from django.utils import timezone
+
+from lock_tokens.exceptions import AlreadyLockedError, InvalidToken
+from lock_tokens.registry import registry
+from lock_tokens.utils import (
+    check_lock_tokens,
+    check_ttl,
+    get_contenttype_lock_timeout,
+    get_lock_statuses,
+)
+
+
+class BaseLockBackend(object):
+    """Base class for lock storage backends.
+
+    Backends handle ``lock_tokens.models.LockToken`` instances, that they do not need to
+    store in the database, and raise the same exceptions as the ORM backend:
+    ``LockToken.DoesNotExist`` when there is no lock token, ``AlreadyLockedError`` when
+    an object is already locked, and ``InvalidToken`` when a token cannot be renewed.
+    """
+
+    def get_for_contenttype_and_id(self, contenttype, object_id, allow_expired=True):
+        raise NotImplementedError
+
+    def get_for_object(self, obj, allow_expired=True):
+        contenttype = registry.get_contenttype(type(obj))
+        return self.get_for_contenttype_and_id(contenttype, obj.id, allow_expired)
+
+    def get_for_objects(self, objs):
+        """Returns a dict {obj: lock_token}, with None values for objects that have
+        no lock token."""
+        raise NotImplementedError
+
+    def get_for_keys(self, keys, use_cache=True):
+        """Returns a dict {(contenttype, object_id): lock_token} for the given
+        (contenttype, object_id) pairs, without the pairs that have no lock token.
+        Backends that cache lock tokens must not use the cache if use_cache is False."""
+        from lock_tokens.models import LockToken
+        lock_tokens = {}
+        for contenttype, object_id in keys:
+            try:
+                lock_tokens[(contenttype, object_id)] = self.get_for_contenttype_and_id(
+                    contenttype, object_id)
+            except LockToken.DoesNotExist:
+                pass
+        return lock_tokens
+
+    def has_active_locks(self, contenttype, object_ids, exclude_tokens=()):
+        """Returns whether one of the objects with the given ids (which may be a
+        queryset of ids) has a valid lock token that is not in exclude_tokens."""
+        now = timezone.now()
+        lock_tokens = self.get_for_keys(
+            ((contenttype, object_id) for object_id in object_ids), use_cache=False)
+        return any(not (lock_token.has_expired(now) or lock_token.token_str in exclude_tokens)
+                   for lock_token in lock_tokens.values())
+
+    def get_locked_ids(self, contenttype, object_ids):
+        """Returns the set of the ids among object_ids of the objects that have a valid
+        lock token."""
+        now = timezone.now()
+        lock_tokens = self.get_for_keys(
+            ((contenttype, object_id) for object_id in object_ids), use_cache=False)
+        return set(object_id for (_, object_id), lock_token in lock_tokens.items()
+                   if not lock_token.has_expired(now))
+
+    def get_or_create_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        """Returns a (lock_token, created) tuple, where lock_token is the valid lock token
+        for the object if there is one, or a newly created one that expires after ttl
+        seconds (defaults to the lock timeout of the model)."""
+        raise NotImplementedError
+
+    def get_or_create_for_object(self, obj, ttl=None):
+        contenttype = registry.get_contenttype(type(obj))
+        return self.get_or_create_for_contenttype_and_id(contenttype, obj.id, ttl)
+
+    def create_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        lock_token, created = self.get_or_create_for_contenttype_and_id(contenttype,
+                                                                        object_id, ttl)
+        if not created:
+            raise AlreadyLockedError
+        return lock_token
+
+    def create_for_object(self, obj, ttl=None):
+        contenttype = registry.get_contenttype(type(obj))
+        return self.create_for_contenttype_and_id(contenttype, obj.id, ttl)
+
+    def create_shared_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        """Takes a shared lock on the object, and returns the token of the new holder.
+        Raises AlreadyLockedError if the object has a valid exclusive lock."""
+        raise NotImplementedError("%s does not support shared locks." %
+                                  type(self).__name__)
+
+    def create_shared_for_object(self, obj, ttl=None):
+        contenttype = registry.get_contenttype(type(obj))
+        return self.create_shared_for_contenttype_and_id(contenttype, obj.id, ttl)
+
+    def get_shared_token(self, contenttype, object_id, token_str):
+        """Returns the token of the holder of the shared lock on the object whose token
+        string is token_str, or None."""
+        return None
+
+    def create_many(self, objs, ttl=None):
+        """Locks all the given objects or none of them, and returns the list of
+        lock tokens, in the same order as objs."""
+        raise NotImplementedError
+
+    def renew(self, lock_token, ttl=None):
+        """Renews the lock token for ttl seconds, which defaults to the lifetime of the
+        lock token."""
+        raise NotImplementedError
+
+    def release(self, lock_token):
+        raise NotImplementedError
+
+    def renew_many(self, lock_tokens):
+        """Renews the given lock tokens, and returns the list of those that could not
+        be renewed."""
+        failed = []
+        for lock_token in lock_tokens:
+            try:
+                self.renew(lock_token)
+            except InvalidToken:
+                failed.append(lock_token)
+        return failed
+
+    def release_many(self, lock_tokens):
+        for lock_token in lock_tokens:
+            self.release(lock_token)
+
+    def renew_token(self, contenttype, object_id, token_str, ttl=None):
+        """Renews the lock on the object for ttl seconds (defaults to the lock timeout of
+        the model) if token_str is its lock token, and returns the renewed lock token.
+        Raises InvalidToken otherwise."""
+        from lock_tokens.models import LockToken
+        try:
+            lock_token = self.get_for_contenttype_and_id(contenttype, object_id)
+        except LockToken.DoesNotExist:
+            raise InvalidToken
+        if lock_token.token_str != token_str:
+            raise InvalidToken
+        if check_ttl(ttl) is None:
+            ttl = get_contenttype_lock_timeout(contenttype.id)
+        self.renew(lock_token, ttl)
+        return lock_token
+
+    def release_token(self, contenttype, object_id, token_str):
+        """Releases the lock on the object if token_str is its lock token. Returns
+        whether the lock has been released."""
+        from lock_tokens.models import LockToken
+        try:
+            lock_token = self.get_for_contenttype_and_id(contenttype, object_id)
+        except LockToken.DoesNotExist:
+            return False
+        if lock_token.token_str != token_str:
+            return False
+        self.release(lock_token)
+        return True
+
+    def is_locked_many(self, objs):
+        return get_lock_statuses(self.get_for_objects(objs))
+
+    def check_lock_tokens_many(self, tokens_by_object):
+        lock_tokens = self.get_for_objects(list(tokens_by_object.keys()))
+        return check_lock_tokens(lock_tokens, tokens_by_object)
@@ -0,0 +1,186 @@
+import datetime
+
+from django.core.cache import caches
+from django.utils import timezone
+
+from lock_tokens.backends.base import BaseLockBackend
+from lock_tokens.exceptions import AlreadyLockedError, InvalidToken
+from lock_tokens.managers import get_object_keys
+from lock_tokens.models import LockToken, get_random_token
+from lock_tokens.settings import (
+    CACHE_ALIAS,
+    CACHE_KEY_PREFIX,
+    CACHE_RECORD_TIMEOUT_MARGIN,
+    TIMEOUT,
+)
+from lock_tokens.utils import check_ttl, get_contenttype_lock_timeout
+
+
+class CacheBackend(BaseLockBackend):
+    """Stores lock tokens in a Django cache instead of the database.
+
+    Each locked object has two cache entries:
+
+    - a *lease* entry, holding the token string of the current valid lock. It is created
+      with an atomic ``add`` and expires with the cache native timeout, so that an
+      expired lock can be taken again without any cleanup.
+    - a *record* entry, holding the data of the last lock token created for the object.
+      It expires CACHE_RECORD_TIMEOUT_MARGIN seconds after the lock, so that an expired
+      token is still valid for a while as long as nobody else has locked the object,
+      like with the ORM backend, without leaving the records of abandoned locks behind.
+    """
+
+    def __init__(self, cache_alias=None):
+        self.cache = caches[cache_alias or CACHE_ALIAS]
+
+    def _get_lease_key(self, contenttype_id, object_id):
+        return "%s:lease:%s:%s" % (CACHE_KEY_PREFIX, contenttype_id, object_id)
+
+    def _get_record_key(self, contenttype_id, object_id):
+        return "%s:record:%s:%s" % (CACHE_KEY_PREFIX, contenttype_id, object_id)
+
+    def _get_lock_token(self, contenttype_id, object_id, record):
+        expires_at = record.get('expires_at')
+        if expires_at is None:
+            # Record written by a previous version
+            expires_at = record['locked_at'] + datetime.timedelta(seconds=TIMEOUT)
+        return LockToken(
+            locked_object_content_type_id=contenttype_id,
+            locked_object_id=object_id,
+            token_str=record['token_str'],
+            locked_at=record['locked_at'],
+            expires_at=expires_at,
+            created=record['created'],
+        )
+
+    def _set_record(self, lock_token):
+        # Renewals set the record again, which pushes its expiration back
+        remaining = (lock_token.expires_at - timezone.now()).total_seconds()
+        self.cache.set(
+            self._get_record_key(lock_token.locked_object_content_type_id,
+                                 lock_token.locked_object_id),
+            {
+                'token_str': lock_token.token_str,
+                'locked_at': lock_token.locked_at,
+                'expires_at': lock_token.expires_at,
+                'created': lock_token.created,
+            },
+            max(int(remaining), 0) + CACHE_RECORD_TIMEOUT_MARGIN
+        )
+
+    def _new_lock_token(self, contenttype_id, object_id, ttl=None):
+        now = timezone.now()
+        if check_ttl(ttl) is None:
+            ttl = get_contenttype_lock_timeout(contenttype_id)
+        return LockToken(
+            locked_object_content_type_id=contenttype_id,
+            locked_object_id=object_id,
+            token_str=get_random_token(),
+            locked_at=now,
+            expires_at=now + datetime.timedelta(seconds=ttl),
+            created=now,
+        )
+
+    def _acquire(self, lock_token):
+        lease_key = self._get_lease_key(lock_token.locked_object_content_type_id,
+                                        lock_token.locked_object_id)
+        return self.cache.add(lease_key, lock_token.token_str, lock_token.get_ttl())
+
+    def get_for_contenttype_and_id(self, contenttype, object_id, allow_expired=True):
+        record = self.cache.get(self._get_record_key(contenttype.id, object_id))
+        if record is None:
+            raise LockToken.DoesNotExist
+        lock_token = self._get_lock_token(contenttype.id, object_id, record)
+        if not allow_expired and lock_token.has_expired():
+            raise LockToken.DoesNotExist
+        return lock_token
+
+    def get_for_objects(self, objs):
+        keys = get_object_keys(objs)
+        records = self.cache.get_many([self._get_record_key(*key) for key in keys])
+        lock_tokens = {}
+        for obj, key in zip(objs, keys):
+            record = records.get(self._get_record_key(*key))
+            lock_tokens[obj] = self._get_lock_token(*key, record=record) if record else None
+        return lock_tokens
+
+    def get_for_keys(self, keys, use_cache=True):
+        keys = list(keys)
+        records = self.cache.get_many([
+            self._get_record_key(contenttype.id, object_id) for contenttype, object_id in keys])
+        lock_tokens = {}
+        for contenttype, object_id in keys:
+            record = records.get(self._get_record_key(contenttype.id, object_id))
+            if record:
+                lock_tokens[(contenttype, object_id)] = self._get_lock_token(
+                    contenttype.id, object_id, record)
+        return lock_tokens
+
+    def get_or_create_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        lock_token = self._new_lock_token(contenttype.id, object_id, ttl)
+        if self._acquire(lock_token):
+            self._set_record(lock_token)
+            return lock_token, True
+        try:
+            return self.get_for_contenttype_and_id(contenttype, object_id), False
+        except LockToken.DoesNotExist:
+            # The lease has been acquired by somebody else who has not written the
+            # record yet
+            raise AlreadyLockedError
+
+    def create_many(self, objs, ttl=None):
+        lock_tokens = {}
+        locked_objects = []
+        for obj, key in zip(objs, get_object_keys(objs)):
+            if key in lock_tokens:
+                continue
+            lock_token = self._new_lock_token(*key, ttl=ttl)
+            if self._acquire(lock_token):
+                lock_tokens[key] = lock_token
+            else:
+                locked_objects.append(obj)
+        if locked_objects:
+            # Give back the leases taken so far
+            for lock_token in lock_tokens.values():
+                self._release_lease(lock_token)
+            raise AlreadyLockedError(locked_objects=locked_objects)
+        for lock_token in lock_tokens.values():
+            self._set_record(lock_token)
+        return [lock_tokens[key] for key in get_object_keys(objs)]
+
+    def renew(self, lock_token, ttl=None):
+        if check_ttl(ttl) is None:
+            ttl = lock_token.get_ttl()
+        contenttype_id = lock_token.locked_object_content_type_id
+        object_id = lock_token.locked_object_id
+        record = self.cache.get(self._get_record_key(contenttype_id, object_id))
+        if record is None or record['token_str'] != lock_token.token_str:
+            raise InvalidToken
+        lease_key = self._get_lease_key(contenttype_id, object_id)
+        lease = self.cache.get(lease_key)
+        if lease is None:
+            # The lock has expired, take it back if nobody else did
+            if not self.cache.add(lease_key, lock_token.token_str, ttl):
+                raise InvalidToken
+        elif lease == lock_token.token_str:
+            self.cache.set(lease_key, lock_token.token_str, ttl)
+        else:
+            raise InvalidToken
+        lock_token.locked_at = timezone.now()
+        lock_token.expires_at = lock_token.locked_at + datetime.timedelta(seconds=ttl)
+        lock_token.created = record['created']
+        self._set_record(lock_token)
+
+    def _release_lease(self, lock_token):
+        lease_key = self._get_lease_key(lock_token.locked_object_content_type_id,
+                                        lock_token.locked_object_id)
+        if self.cache.get(lease_key) == lock_token.token_str:
+            self.cache.delete(lease_key)
+
+    def release(self, lock_token):
+        record_key = self._get_record_key(lock_token.locked_object_content_type_id,
+                                          lock_token.locked_object_id)
+        record = self.cache.get(record_key)
+        if record is not None and record['token_str'] == lock_token.token_str:
+            self._release_lease(lock_token)
+            self.cache.delete(record_key)
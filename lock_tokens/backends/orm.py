@@ -0,0 +1,131 @@
+import datetime
+
+from django.utils import timezone
+
+from lock_tokens.backends.base import BaseLockBackend
+from lock_tokens.exceptions import InvalidToken
+from lock_tokens.managers import token_in
+from lock_tokens.models import LockToken, SharedLockToken
+from lock_tokens.utils import check_lock_tokens
+
+
+class ORMBackend(BaseLockBackend):
+    """Stores lock tokens in the database, with the LockToken model."""
+
+    def get_for_contenttype_and_id(self, contenttype, object_id, allow_expired=True):
+        return LockToken.objects.get_for_contenttype_and_id(contenttype, object_id,
+                                                            allow_expired)
+
+    def get_for_object(self, obj, allow_expired=True):
+        return LockToken.objects.get_for_object(obj, allow_expired)
+
+    def get_for_objects(self, objs):
+        return LockToken.objects.get_for_objects(objs)
+
+    def get_for_keys(self, keys, use_cache=True):
+        return LockToken.objects.get_for_keys(keys, use_cache)
+
+    def has_active_locks(self, contenttype, object_ids, exclude_tokens=()):
+        return LockToken.objects.filter(
+            locked_object_content_type=contenttype, locked_object_id__in=object_ids,
+            expires_at__gte=timezone.now()
+        ).exclude(token_in(exclude_tokens)).exists()
+
+    def get_locked_ids(self, contenttype, object_ids):
+        return set(LockToken.objects.filter(
+            locked_object_content_type=contenttype, locked_object_id__in=object_ids,
+            expires_at__gte=timezone.now()
+        ).values_list('locked_object_id', flat=True))
+
+    def get_or_create_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        return LockToken.objects.get_or_create_for_contenttype_and_id(contenttype,
+                                                                      object_id, ttl)
+
+    def create_shared_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        return SharedLockToken.objects.create_for_contenttype_and_id(contenttype,
+                                                                     object_id, ttl)
+
+    def get_shared_token(self, contenttype, object_id, token_str):
+        return SharedLockToken.objects.get_for_token(contenttype, object_id, token_str)
+
+    def create_many(self, objs, ttl=None):
+        return LockToken.objects.create_many(objs, ttl)
+
+    def renew(self, lock_token, ttl=None):
+        if isinstance(lock_token, SharedLockToken):
+            return lock_token.renew(ttl)
+        renewed = LockToken.objects.renew_token(
+            lock_token.locked_object_content_type_id, lock_token.locked_object_id,
+            lock_token.token_str, lock_token.get_ttl() if ttl is None else ttl)
+        if renewed is None:
+            raise InvalidToken
+        lock_token.locked_at, lock_token.expires_at = renewed
+
+    def renew_many(self, lock_tokens):
+        lock_tokens_by_ttl = {}
+        failed = []
+        for lock_token in lock_tokens:
+            if isinstance(lock_token, SharedLockToken):
+                # Renewing a holder token also extends the shared lock
+                try:
+                    self.renew(lock_token)
+                except InvalidToken:
+                    failed.append(lock_token)
+            else:
+                lock_tokens_by_ttl.setdefault(lock_token.get_ttl(), []).append(lock_token)
+        # One UPDATE statement per distinct lifetime
+        for ttl, ttl_lock_tokens in lock_tokens_by_ttl.items():
+            locked_at, failed_token_strs = LockToken.objects.renew_many(
+                [lock_token.token_str for lock_token in ttl_lock_tokens], ttl)
+            for lock_token in ttl_lock_tokens:
+                if lock_token.token_str in failed_token_strs:
+                    failed.append(lock_token)
+                else:
+                    lock_token.locked_at = locked_at
+                    lock_token.expires_at = locked_at + datetime.timedelta(seconds=ttl)
+        return failed
+
+    def release_many(self, lock_tokens):
+        LockToken.objects.release_many([lock_token.token_str for lock_token in lock_tokens])
+
+    def release(self, lock_token):
+        self.release_token(lock_token.locked_object_content_type_id,
+                           lock_token.locked_object_id, lock_token.token_str)
+
+    def renew_token(self, contenttype, object_id, token_str, ttl=None):
+        lock_token = LockToken(locked_object_content_type=contenttype,
+                               locked_object_id=object_id, token_str=token_str)
+        try:
+            self.renew(lock_token, ttl)
+        except InvalidToken:
+            # The token may be the one of a holder of a shared lock
+            lock_token = SharedLockToken(locked_object_content_type=contenttype,
+                                         locked_object_id=object_id,
+                                         token_str=token_str)
+            renewed = SharedLockToken.objects.renew_token(contenttype, object_id,
+                                                          token_str, ttl)
+            if renewed is None:
+                raise
+            lock_token.locked_at, lock_token.expires_at = renewed
+        return lock_token
+
+    def release_token(self, contenttype, object_id, token_str):
+        if LockToken.objects.release_token(contenttype, object_id, token_str):
+            return True
+        return SharedLockToken.objects.release_token(contenttype, object_id, token_str)
+
+    def check_lock_tokens_many(self, tokens_by_object):
+        lock_tokens = self.get_for_objects(list(tokens_by_object.keys()))
+        shared_objects = dict(
+            (lock_token.token_str, obj) for obj, lock_token in lock_tokens.items()
+            if lock_token is not None and lock_token.shared
+        )
+        if shared_objects:
+            # Look up the holders of the shared locks with a single query
+            for holder in SharedLockToken.objects.filter(
+                    token_in([tokens_by_object[obj] for obj in shared_objects.values()]),
+                    lock_token_str__in=shared_objects.keys()):
+                obj = shared_objects[holder.lock_token_str]
+                if holder.token_str == tokens_by_object[obj]:
+                    lock_tokens[obj] = holder
+        return check_lock_tokens(lock_tokens, tokens_by_object)
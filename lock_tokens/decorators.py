@@ -1,17 +1,17 @@
 from django.http import HttpResponseForbidden
 
 from lock_tokens.exceptions import AlreadyLockedError
-from lock_tokens.sessions import lock_for_session, unlock_for_session
-from lock_tokens.utils import LockHolder
+from lock_tokens.sessions import get_held_session_lock, lock_for_session, unlock_for_session
+from lock_tokens.utils import LockHolder, get_object_to_lock
 
 
-def locks_object(model, get_object_id_fn):
+def locks_object(model, get_object_id_fn, existence_check=None, wait=None):
     def decorator(view):
         def wrapped(request, *args, **kwargs):
             object_id = get_object_id_fn(request, *args, **kwargs)
-            obj = model.objects.get(id=object_id)
+            obj = get_object_to_lock(model, object_id, existence_check)
             try:
-                lock_for_session(obj, request.session)
+                lock_for_session(obj, request.session, wait=wait)
             except AlreadyLockedError:
                 return HttpResponseForbidden("The object you are trying to access is "
                                              "locked.")
@@ -20,17 +20,18 @@ def locks_object(model, get_object_id_fn):
     return decorator
 
 
-def holds_lock_on_object(model, get_object_id_fn):
+def holds_lock_on_object(model, get_object_id_fn, existence_check=None, wait=None):
     def decorator(view):
         def wrapped(request, *args, **kwargs):
             object_id = get_object_id_fn(request, *args, **kwargs)
-            obj = model.objects.get(id=object_id)
+            obj = get_object_to_lock(model, object_id, existence_check)
             try:
-                lock_for_session(obj, request.session)
+                lock_for_session(obj, request.session, wait=wait)
             except AlreadyLockedError:
                 return HttpResponseForbidden("The object you are trying to access is "
                                              "locked.")
-            lock_holder = LockHolder(obj)
+            # The lock held may be the one on an ancestor of obj
+            lock_holder = LockHolder(*get_held_session_lock(obj, request.session))
             lock_holder.start()
             try:
                 response = view(request, *args, **kwargs)
@@ -1,5 +1,9 @@
 class AlreadyLockedError(IOError):
-    pass
+
+    def __init__(self, *args, **kwargs):
+        # Objects that could not be locked because somebody else holds a lock on them
+        self.locked_objects = kwargs.pop('locked_objects', [])
+        super(AlreadyLockedError, self).__init__(*args, **kwargs)
 
 
 class InvalidToken(IOError):
@@ -0,0 +1,273 @@
+"""Hierarchical locks.
+
+A model declares the foreign key to its parent object with its ``lock_parent``
+attribute. A lock on an object covers its descendants: they cannot be locked while it
+is held, and its token is valid for them. Conversely, an object cannot be locked while
+one of its descendants is locked.
+"""
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router, transaction
+from django.utils import timezone
+
+from lock_tokens.backends import get_backend
+from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.registry import registry
+from lock_tokens.settings import ESCALATION_THRESHOLD
+
+
+_child_relations = None
+
+
+def get_parent_field(model):
+    """Returns the foreign key named by the lock_parent attribute of model, or None."""
+    name = getattr(model, 'lock_parent', None)
+    return model._meta.get_field(name) if name else None
+
+
+def get_parent_fields(model):
+    """Returns the list of the lock_parent foreign keys from model up to its root
+    ancestor model."""
+    fields = []
+    seen = set([model._meta.concrete_model])
+    field = get_parent_field(model)
+    while field is not None:
+        fields.append(field)
+        model = field.related_model
+        if model._meta.concrete_model in seen:
+            raise ImproperlyConfigured(
+                "The lock_parent relations of %s form a cycle." % model.__name__)
+        seen.add(model._meta.concrete_model)
+        field = get_parent_field(model)
+    return fields
+
+
+def get_child_relations(model):
+    """Returns the list of the (child model, lock_parent field) pairs of the models whose
+    lock parent is model."""
+    global _child_relations
+    if _child_relations is None:
+        child_relations = {}
+        for child_model in apps.get_models():
+            field = get_parent_field(child_model)
+            if field is None or child_model._meta.proxy:
+                continue
+            # Fails early on cycles
+            get_parent_fields(child_model)
+            child_relations.setdefault(field.related_model._meta.concrete_model, []).append(
+                (child_model, field))
+        _child_relations = child_relations
+    return _child_relations.get(model._meta.concrete_model, [])
+
+
+def is_hierarchical(model):
+    return get_parent_field(model) is not None or bool(get_child_relations(model))
+
+
+def get_parent(obj):
+    """Returns the parent of obj, with only its id set, or None."""
+    field = get_parent_field(type(obj))
+    if field is None:
+        return None
+    parent_id = getattr(obj, field.attname)
+    return field.related_model(pk=parent_id) if parent_id is not None else None
+
+
+def _fetch_ancestor_ids(model, object_id, fields):
+    paths = ['__'.join(field.name for field in fields[:i + 1]) for i in range(len(fields))]
+    row = model._default_manager.filter(pk=object_id).values_list(*paths).first()
+    return list(row) if row is not None else []
+
+
+def get_ancestor_keys(model, object_id, obj=None):
+    """Returns the (contenttype, object_id) pairs of the ancestors of an object, the
+    nearest first. The parent id is read from obj if it is given and set, and the ids of
+    the further ancestors are fetched with a single query."""
+    fields = get_parent_fields(model)
+    if not fields:
+        return []
+    parent_id = getattr(obj, fields[0].attname) if obj is not None else None
+    if parent_id is None:
+        # The parent id may not have been loaded
+        ids = _fetch_ancestor_ids(model, object_id, fields)
+    else:
+        ids = [parent_id]
+        if len(fields) > 1:
+            ids += _fetch_ancestor_ids(fields[0].related_model, parent_id, fields[1:])
+    keys = []
+    for field, ancestor_id in zip(fields, ids):
+        if ancestor_id is None:
+            break
+        keys.append((registry.get_contenttype(field.related_model), ancestor_id))
+    return keys
+
+
+def get_ancestor_keys_many(objs):
+    """Returns a {obj: ancestor keys} dict, like get_ancestor_keys for each object, with
+    at most one query per model."""
+    objs_by_model = OrderedDict()
+    for obj in objs:
+        objs_by_model.setdefault(type(obj), []).append(obj)
+    ancestor_keys = {}
+    for model, model_objs in objs_by_model.items():
+        fields = get_parent_fields(model)
+        if len(fields) == 1 and all(getattr(obj, fields[0].attname) is not None
+                                    for obj in model_objs):
+            ids_by_pk = dict((obj.pk, [getattr(obj, fields[0].attname)])
+                             for obj in model_objs)
+        elif fields:
+            paths = ['__'.join(field.name for field in fields[:i + 1])
+                     for i in range(len(fields))]
+            ids_by_pk = dict(
+                (row[0], row[1:]) for row in model._default_manager.filter(
+                    pk__in=[obj.pk for obj in model_objs]).values_list('pk', *paths))
+        else:
+            ids_by_pk = {}
+        for obj in model_objs:
+            keys = []
+            for field, ancestor_id in zip(fields, ids_by_pk.get(obj.pk, [])):
+                if ancestor_id is None:
+                    break
+                keys.append((registry.get_contenttype(field.related_model), ancestor_id))
+            ancestor_keys[obj] = keys
+    return ancestor_keys
+
+
+def _get_descendant_ids(model, lookup, value):
+    for child_model, field in get_child_relations(model):
+        ids = child_model._default_manager.filter(
+            **{field.name + lookup: value}).values_list('pk', flat=True)
+        yield registry.get_contenttype(child_model), ids
+        for descendant_ids in _get_descendant_ids(child_model, '__in', ids):
+            yield descendant_ids
+
+
+def get_descendant_ids(model, object_id):
+    """Yields a (contenttype, ids) pair for each model whose objects may descend from
+    the object, ids being a queryset of the ids of its descendants."""
+    return _get_descendant_ids(model, '', object_id)
+
+
+def get_lock_tokens(model, contenttype, object_id, obj=None, use_cache=True):
+    """Returns the lock token of an object (or None) and the list of the lock tokens of
+    its ancestors, the nearest first, with a single lookup."""
+    keys = [(contenttype, object_id)] + get_ancestor_keys(model, object_id, obj)
+    lock_tokens = get_backend().get_for_keys(keys, use_cache)
+    return (lock_tokens.get(keys[0]),
+            [lock_tokens[key] for key in keys[1:] if key in lock_tokens])
+
+
+def _has_locked_descendants(model, object_id, exclude_tokens=()):
+    backend = get_backend()
+    return any(backend.has_active_locks(contenttype, ids, exclude_tokens)
+               for contenttype, ids in get_descendant_ids(model, object_id))
+
+
+def _get_descendant_paths(model, path=None):
+    for child_model, field in get_child_relations(model):
+        child_path = field.name + '__' + path if path else field.name
+        yield child_model, child_path
+        for descendant_path in _get_descendant_paths(child_model, child_path):
+            yield descendant_path
+
+
+def get_ids_with_locked_descendants(model, object_ids):
+    """Returns the set of the ids among object_ids of the objects of model that have a
+    descendant with a valid lock, with two lookups per descendant model."""
+    object_ids = list(object_ids)
+    backend = get_backend()
+    ids = set()
+    for descendant_model, path in _get_descendant_paths(model):
+        if not object_ids:
+            break
+        rows = list(descendant_model._default_manager.filter(
+            **{path + '__in': object_ids}).values_list('pk', path))
+        locked_ids = backend.get_locked_ids(registry.get_contenttype(descendant_model),
+                                            [pk for pk, _ in rows]) if rows else set()
+        found = set(ancestor_id for pk, ancestor_id in rows if pk in locked_ids)
+        ids.update(found)
+        # The other descendant models only matter for the objects left
+        object_ids = [object_id for object_id in object_ids if object_id not in found]
+    return ids
+
+
+def check_can_lock(model, object_id, obj=None, exclude_tokens=()):
+    """Raises AlreadyLockedError if an ancestor of the object, or one of its descendants
+    whose token is not in exclude_tokens, has a valid lock."""
+    ancestor_keys = get_ancestor_keys(model, object_id, obj)
+    if ancestor_keys:
+        now = timezone.now()
+        if any(not lock_token.has_expired(now)
+               for lock_token in get_backend().get_for_keys(ancestor_keys,
+                                                            use_cache=False).values()):
+            raise AlreadyLockedError
+    if _has_locked_descendants(model, object_id, exclude_tokens):
+        raise AlreadyLockedError
+
+
+def get_blocked_objects(objs):
+    """Returns the objects that cannot be locked because one of their ancestors or
+    descendants has a valid lock, with a bounded number of lookups per model."""
+    ancestor_keys = get_ancestor_keys_many(objs)
+    lock_tokens = get_backend().get_for_keys(
+        set(key for keys in ancestor_keys.values() for key in keys), use_cache=False)
+    now = timezone.now()
+    locked_keys = set(key for key, lock_token in lock_tokens.items()
+                      if not lock_token.has_expired(now))
+    ids_by_model = OrderedDict()
+    for obj in objs:
+        ids_by_model.setdefault(type(obj), []).append(obj.pk)
+    ids_with_locked_descendants = dict(
+        (model, get_ids_with_locked_descendants(model, ids))
+        for model, ids in ids_by_model.items())
+    blocked_objs = []
+    for obj in objs:
+        has_locked_descendants = obj.pk in ids_with_locked_descendants[type(obj)]
+        if has_locked_descendants or locked_keys.intersection(ancestor_keys[obj]):
+            blocked_objs.append(obj)
+    return blocked_objs
+
+
+def escalate_objects(objs):
+    """Replaces the objects that have more than ESCALATION_THRESHOLD siblings among objs
+    by their parent. Returns the list of the objects to lock, and the list of the
+    objects whose lock covers each of objs."""
+    parents = dict((obj, get_parent(obj)) for obj in objs)
+    counts = {}
+    for parent in parents.values():
+        if parent is not None:
+            counts[parent] = counts.get(parent, 0) + 1
+    escalated = set(parent for parent, count in counts.items()
+                    if count > ESCALATION_THRESHOLD)
+    covering_objs = [parents[obj] if parents[obj] in escalated else obj for obj in objs]
+    return list(OrderedDict.fromkeys(covering_objs)), covering_objs
+
+
+def get_child_lock_tokens(parent, child_model, tokens_by_id):
+    """Returns the lock tokens of the children of parent of the given model whose token
+    is the one given by tokens_by_id, a {object id: token} dict."""
+    field = get_parent_field(child_model)
+    child_ids = child_model._default_manager.filter(
+        **{field.name: parent.pk, 'pk__in': [int(object_id) for object_id in tokens_by_id]}
+    ).values_list('pk', flat=True)
+    contenttype = registry.get_contenttype(child_model)
+    lock_tokens = get_backend().get_for_keys(
+        ((contenttype, child_id) for child_id in child_ids), use_cache=False)
+    return [lock_token for (_, child_id), lock_token in lock_tokens.items()
+            if lock_token.token_str == tokens_by_id.get(str(child_id))]
+
+
+def escalate(parent, lock_tokens, ttl=None):
+    """Replaces the given lock tokens, held on descendants of parent, by a lock on
+    parent, and returns its lock token. Raises AlreadyLockedError, leaving the lock
+    tokens untouched, if parent cannot be locked."""
+    from lock_tokens.models import LockToken
+    with transaction.atomic(using=router.db_for_write(LockToken)):
+        check_can_lock(type(parent), parent.pk, parent, exclude_tokens=set(
+            lock_token.token_str for lock_token in lock_tokens))
+        backend = get_backend()
+        lock_token = backend.create_for_object(parent, ttl)
+        backend.release_many(lock_tokens)
+    return lock_token
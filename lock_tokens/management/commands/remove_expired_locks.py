@@ -1,15 +1,58 @@
-from django.core.management.base import BaseCommand
+import datetime
+import time
 
-from lock_tokens.models import LockToken
-from lock_tokens.utils import get_oldest_valid_tokens_datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from lock_tokens.models import LockToken, SharedLockToken
 
 
 class Command(BaseCommand):
+    help = "Removes expired lock tokens, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Maximum number of tokens removed per batch.")
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Number of seconds to wait between batches.")
+        parser.add_argument('--max-runtime', type=float, default=0,
+                            help="Stop after this number of seconds (no limit if 0).")
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help="Only count the tokens that would be removed.")
+        parser.add_argument('--older-than', type=int, default=0,
+                            help="Only remove tokens that expired more than this number "
+                                 "of seconds ago.")
 
     def handle(self, *args, **opts):
-        set_before = get_oldest_valid_tokens_datetime()
-        expired_tokens = LockToken.objects.filter(locked_at__lt=set_before)
-        n = expired_tokens.count()
-        expired_tokens.delete()
+        if opts['batch_size'] < 1:
+            raise CommandError("The batch size must be positive.")
+        if opts['older_than'] < 0:
+            raise CommandError("The --older-than delay cannot be negative.")
+        expired_before = timezone.now() - datetime.timedelta(seconds=opts['older_than'])
+
+        if opts['dry_run']:
+            n = sum(model.objects.filter(expires_at__lt=expired_before).count()
+                    for model in (LockToken, SharedLockToken))
+            self.stdout.write('%s expired tokens would be removed' % n)
+            return
+
+        started = time.time()
+        n = 0
+        batch = 0
+        while True:
+            batch += 1
+            batch_started = time.time()
+            deleted = LockToken.objects.delete_expired_batch(expired_before,
+                                                             opts['batch_size'])
+            n += deleted
+            self.stdout.write('Batch %s: removed %s tokens in %.3fs' % (
+                batch, deleted, time.time() - batch_started))
+            if deleted < opts['batch_size']:
+                break
+            if opts['max_runtime'] and time.time() - started >= opts['max_runtime']:
+                self.stdout.write('Maximum runtime reached')
+                break
+            if opts['sleep']:
+                time.sleep(opts['sleep'])
         self.stdout.write(
             self.style.SUCCESS('Successfully removed %s expired tokens' % n))
@@ -1,35 +1,673 @@
+from collections import OrderedDict
+import datetime
+import functools
+import operator
+import random
+
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Manager
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    Manager,
+    Max,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Value,
+    When,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from lock_tokens import hierarchy, state_cache
+from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.registry import registry
+from lock_tokens.utils import (
+    check_lock_tokens,
+    check_ttl,
+    get_contenttype_lock_timeout,
+    get_lock_statuses,
+    parse_token,
+    sync_to_async,
+)
+
+
+def group_objects_by_contenttype(objs):
+    """Returns an ordered mapping {contenttype: {object_id: obj}} for the given objects,
+    resolving all the content types at once."""
+    contenttypes = ContentType.objects.get_for_models(*set(type(obj) for obj in objs))
+    grouped = OrderedDict()
+    for obj in objs:
+        grouped.setdefault(contenttypes[type(obj)], OrderedDict())[obj.id] = obj
+    return grouped
+
+
+def get_object_keys(objs):
+    """Returns the list of (contenttype id, object id) pairs for the given objects."""
+    contenttypes = ContentType.objects.get_for_models(*set(type(obj) for obj in objs))
+    return [(contenttypes[type(obj)].id, obj.id) for obj in objs]
+
+
+def supports_upsert(connection):
+    """Returns whether lock tokens can be created with a single INSERT ... ON CONFLICT
+    DO UPDATE ... RETURNING statement on the given database connection."""
+    if not settings.USE_TZ:
+        return False
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def token_equals(token_str):
+    """Returns a Q object matching the token with the given token string, on the
+    indexed token_uuid column."""
+    token_uuid = parse_token(token_str)
+    # A token string that is not an hex UUID does not match anything
+    return Q(token_uuid=token_uuid) if token_uuid is not None else Q(pk__in=[])
 
-from lock_tokens.utils import get_oldest_valid_tokens_datetime
+
+def token_may_exist(token_str):
+    """Returns False if no lock token can have the given token string, that is if it
+    is not an hex UUID."""
+    return parse_token(token_str) is not None
+
+
+def token_in(token_strs):
+    """Returns a Q object matching the tokens with one of the given token strings, on
+    the indexed token_uuid column."""
+    token_uuids = [parse_token(token_str) for token_str in token_strs]
+    return Q(token_uuid__in=[token_uuid for token_uuid in token_uuids
+                             if token_uuid is not None])
+
+
+def parse_db_datetime(value):
+    if not isinstance(value, datetime.datetime):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def delete_batch(expired_tokens, batch_size):
+    rows = list(expired_tokens.order_by().values_list(
+        'pk', 'locked_object_content_type_id', 'locked_object_id')[:batch_size])
+    if not rows:
+        return 0
+    # The expiration is checked again, in case a token has been renewed meanwhile
+    deleted = expired_tokens.filter(pk__in=[row[0] for row in rows]).delete()[0]
+    state_cache.invalidate_many(row[1:] for row in rows)
+    return deleted
+
+
+def invalidate_state_cache(queryset):
+    """Removes the state cache entries of the objects of the (shared) lock tokens of the
+    queryset, with one query if the state cache is enabled."""
+    if state_cache.is_enabled():
+        state_cache.invalidate_many(queryset.values_list('locked_object_content_type_id',
+                                                         'locked_object_id'))
 
 
 class LockTokenManager(Manager):
 
+    def create(self, ttl=None, **kwargs):
+        """Creates a lock token, which expires after ttl seconds. The lifetime defaults
+        to the lock timeout of the model of the locked object."""
+        if check_ttl(ttl) is not None and 'expires_at' not in kwargs:
+            locked_at = kwargs.setdefault('locked_at', timezone.now())
+            kwargs['expires_at'] = locked_at + datetime.timedelta(seconds=ttl)
+        return super(LockTokenManager, self).create(**kwargs)
+
     def get_for_object(self, obj, allow_expired=True):
-        contenttype = ContentType.objects.get_for_model(obj)
+        contenttype = registry.get_contenttype(type(obj))
         return self.get_for_contenttype_and_id(contenttype, obj.id, allow_expired)
 
     def get_for_contenttype_and_id(self, contenttype, object_id, allow_expired=True):
+        if state_cache.is_enabled():
+            hit, lock_token = state_cache.get(contenttype, object_id)
+            if not hit:
+                lock_token = self.filter(locked_object_content_type=contenttype,
+                                         locked_object_id=object_id).first()
+                state_cache.set_many({(contenttype, object_id): lock_token})
+            if lock_token is None or (not allow_expired and lock_token.has_expired()):
+                raise self.model.DoesNotExist("%s matching query does not exist." %
+                                              self.model._meta.object_name)
+            return lock_token
+        return self._get_for_contenttype_and_id(contenttype, object_id, allow_expired)
+
+    def _get_for_contenttype_and_id(self, contenttype, object_id, allow_expired=True):
         lookup_fields = {
             'locked_object_content_type': contenttype,
             'locked_object_id': object_id
         }
         if not allow_expired:
-            lookup_fields['locked_at__gte'] = get_oldest_valid_tokens_datetime()
+            lookup_fields['expires_at__gte'] = timezone.now()
         return self.get(**lookup_fields)
 
-    def get_or_create_for_object(self, obj):
+    def get_for_objects(self, objs):
+        """Returns a dict {obj: lock_token} for the given objects, with one query per
+        content type. The value is ``None`` for objects that have no lock token."""
+        lock_tokens = {}
+        for contenttype, objs_by_id in group_objects_by_contenttype(objs).items():
+            for lock_token in self.filter(locked_object_content_type=contenttype,
+                                          locked_object_id__in=objs_by_id.keys()):
+                lock_tokens[objs_by_id[lock_token.locked_object_id]] = lock_token
+        return dict((obj, lock_tokens.get(obj)) for obj in objs)
+
+    def get_for_keys(self, keys, use_cache=True):
+        """Returns a dict {(contenttype, object_id): lock_token} for the given
+        (contenttype, object_id) pairs, with a single query. The pairs that have no
+        lock token are left out. The state cache is bypassed if use_cache is False, as
+        it should be for the lookups that decide whether an object can be locked."""
+        keys_by_id = dict(((contenttype.id, int(object_id)), (contenttype, object_id))
+                          for contenttype, object_id in keys)
+        lock_tokens = {}
+        use_cache = use_cache and state_cache.is_enabled()
+        if use_cache and keys_by_id:
+            cached = state_cache.get_many(keys_by_id.values())
+            lock_tokens.update((key, lock_token) for key, lock_token in cached.items()
+                               if lock_token is not None)
+            keys_by_id = dict((id_key, key) for id_key, key in keys_by_id.items()
+                              if key not in cached)
+        if not keys_by_id:
+            return lock_tokens
+        condition = functools.reduce(operator.or_, (
+            Q(locked_object_content_type=contenttype, locked_object_id=object_id)
+            for contenttype, object_id in keys_by_id.values()))
+        fetched = dict(
+            (keys_by_id[(lock_token.locked_object_content_type_id,
+                         lock_token.locked_object_id)], lock_token)
+            for lock_token in self.filter(condition)
+        )
+        if use_cache:
+            state_cache.set_many(dict((key, fetched.get(key))
+                                      for key in keys_by_id.values()))
+        lock_tokens.update(fetched)
+        return lock_tokens
+
+    def is_locked_many(self, objs):
+        return get_lock_statuses(self.get_for_objects(objs))
+
+    def check_lock_tokens_many(self, tokens_by_object):
+        lock_tokens = self.get_for_objects(list(tokens_by_object.keys()))
+        return check_lock_tokens(lock_tokens, tokens_by_object)
+
+    def get_or_create_for_object(self, obj, ttl=None):
+        contenttype = registry.get_contenttype(type(obj))
+        return self.get_or_create_for_contenttype_and_id(contenttype, obj.id, ttl)
+
+    def get_or_create_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        if check_ttl(ttl) is None:
+            ttl = get_contenttype_lock_timeout(contenttype.id)
+        if supports_upsert(connections[router.db_for_write(self.model)]):
+            lock_token = self._upsert(contenttype, object_id, ttl)
+            if lock_token is not None:
+                return (lock_token, True)
         try:
-            return (self.get_for_object(obj, allow_expired=False), False)
+            # Locking decisions do not rely on the state cache
+            return (self._get_for_contenttype_and_id(contenttype, object_id,
+                                                     allow_expired=False), False)
         except self.model.DoesNotExist:
-            return (self.create(locked_object=obj), True)
+            return (self.create(locked_object_content_type=contenttype,
+                                locked_object_id=object_id, ttl=ttl), True)
+
+    def _upsert(self, contenttype, object_id, ttl):
+        """Creates a lock token for the given object with a single statement, replacing
+        an existing expired token if any. The database clock is used for the lock and
+        expiration datetimes and the expiration check.
+
+        Returns the new lock token, or None if the object already has a valid lock.
+        """
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        columns = dict(
+            (name, qn(opts.get_field(name).column))
+            for name in ('id', 'created', 'token_str', 'token_uuid',
+                         'locked_object_content_type', 'locked_object_id', 'locked_at',
+                         'expires_at', 'shared')
+        )
+        if connection.vendor == 'postgresql':
+            now_sql = "STATEMENT_TIMESTAMP()"
+            expires_at_sql = "STATEMENT_TIMESTAMP() + %s * INTERVAL '1 second'"
+            expires_at_param = ttl
+        else:
+            now_sql = "STRFTIME('%%Y-%%m-%%d %%H:%%M:%%f', 'now')"
+            expires_at_sql = "STRFTIME('%%Y-%%m-%%d %%H:%%M:%%f', 'now', %s)"
+            expires_at_param = '+%s seconds' % ttl
+        sql = (
+            "INSERT INTO {table} ({created}, {token_str}, {token_uuid}, "
+            "{locked_object_content_type}, {locked_object_id}, {locked_at}, {expires_at}, "
+            "{shared}) "
+            "VALUES ({now}, %s, %s, %s, %s, {now}, {expires_at_value}, %s) "
+            "ON CONFLICT ({locked_object_content_type}, {locked_object_id}) DO UPDATE "
+            "SET {created} = excluded.{created}, {token_str} = excluded.{token_str}, "
+            "{token_uuid} = excluded.{token_uuid}, "
+            "{locked_at} = excluded.{locked_at}, {expires_at} = excluded.{expires_at}, "
+            "{shared} = excluded.{shared} "
+            "WHERE {table}.{expires_at} < {now} "
+            "RETURNING {id}, {created}, {locked_at}, {expires_at}"
+        ).format(table=qn(opts.db_table), now=now_sql, expires_at_value=expires_at_sql,
+                 **columns)
+        token_str = opts.get_field('token_str').get_default()
+        token_uuid = parse_token(token_str)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                token_str,
+                opts.get_field('token_uuid').get_db_prep_value(token_uuid, connection),
+                contenttype.id, object_id, expires_at_param, False])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        state_cache.invalidate(contenttype, object_id)
+        lock_token = self.model(
+            id=row[0], created=parse_db_datetime(row[1]), token_str=token_str,
+            token_uuid=token_uuid,
+            locked_object_content_type=contenttype, locked_object_id=object_id,
+            locked_at=parse_db_datetime(row[2]), expires_at=parse_db_datetime(row[3]),
+        )
+        lock_token._state.adding = False
+        lock_token._state.db = db
+        return lock_token
+
+    def renew_token(self, contenttype, object_id, token_str, ttl=None):
+        """Renews the lock token for ttl seconds (defaults to the lock timeout of the
+        model) with a single conditional UPDATE statement.
+
+        Returns the new (locked_at, expires_at) datetimes, or None if token_str is not
+        the token of the object lock.
+        """
+        if check_ttl(ttl) is None:
+            # contenttype may also be a content type id
+            ttl = get_contenttype_lock_timeout(getattr(contenttype, 'id', contenttype))
+        locked_at = timezone.now()
+        expires_at = locked_at + datetime.timedelta(seconds=ttl)
+        updated = self.filter(token_equals(token_str),
+                              locked_object_content_type=contenttype,
+                              locked_object_id=object_id).update(locked_at=locked_at,
+                                                                 expires_at=expires_at)
+        if not updated:
+            return None
+        state_cache.invalidate(contenttype, object_id)
+        return locked_at, expires_at
+
+    def renew_many(self, token_strs, ttl, batch_size=500):
+        """Renews the lock tokens with the given token strings for ttl seconds, with a
+        single UPDATE statement per batch_size tokens.
+
+        Returns a (locked_at, failed) tuple, where locked_at is the new lock datetime and
+        failed is the set of the token strings that could not be renewed.
+        """
+        check_ttl(ttl)
+        locked_at = timezone.now()
+        expires_at = locked_at + datetime.timedelta(seconds=ttl)
+        token_strs = list(set(token_strs))
+        failed = set()
+        for i in range(0, len(token_strs), batch_size):
+            batch = token_strs[i:i + batch_size]
+            updated = self.filter(token_in(batch)).update(locked_at=locked_at,
+                                                          expires_at=expires_at)
+            invalidate_state_cache(self.filter(token_in(batch)))
+            if updated < len(batch):
+                renewed = self.filter(token_in(batch)).values_list('token_str', flat=True)
+                failed.update(set(batch) - set(renewed))
+        return locked_at, failed
+
+    def release_token(self, contenttype, object_id, token_str):
+        """Deletes the lock token with a single conditional DELETE statement.
+
+        Returns whether token_str was the token of the object lock.
+        """
+        if not token_may_exist(token_str):
+            return False
+        queryset = self.filter(token_equals(token_str),
+                               locked_object_content_type=contenttype,
+                               locked_object_id=object_id)
+        # Nothing refers to lock tokens, so Django deletes them with a single DELETE
+        # statement (unless signal receivers are connected to the model)
+        if not queryset.delete()[0]:
+            return False
+        state_cache.invalidate(contenttype, object_id)
+        return True
+
+    def release_many(self, token_strs, batch_size=500):
+        """Deletes the lock tokens with the given token strings, with a single DELETE
+        statement per batch_size tokens."""
+        token_strs = list(token_strs)
+        for i in range(0, len(token_strs), batch_size):
+            lock_tokens = self.filter(token_in(token_strs[i:i + batch_size]))
+            invalidate_state_cache(lock_tokens)
+            lock_tokens.delete()
+
+    def delete_expired_batch(self, expired_before, batch_size):
+        """Deletes at most batch_size lock tokens and shared lock tokens that expired
+        before expired_before, by primary key. Returns the number of deleted tokens."""
+        from lock_tokens.models import SharedLockToken
+        deleted = delete_batch(self.filter(expires_at__lt=expired_before), batch_size)
+        if deleted < batch_size:
+            deleted += delete_batch(
+                SharedLockToken.objects.filter(expires_at__lt=expired_before),
+                batch_size - deleted)
+        return deleted
+
+    # Asynchronous versions of the lookup and locking methods
+
+    def aget_for_object(self, obj, allow_expired=True):
+        return sync_to_async(self.get_for_object)(obj, allow_expired)
+
+    def aget_for_objects(self, objs):
+        return sync_to_async(self.get_for_objects)(objs)
+
+    def aget_or_create_for_object(self, obj, ttl=None):
+        return sync_to_async(self.get_or_create_for_object)(obj, ttl)
 
+    def arenew_token(self, contenttype, object_id, token_str, ttl=None):
+        return sync_to_async(self.renew_token)(contenttype, object_id, token_str, ttl)
 
-class LockableModelManager(Manager):
+    def arelease_token(self, contenttype, object_id, token_str):
+        return sync_to_async(self.release_token)(contenttype, object_id, token_str)
+
+    def _get_locked_objects(self, grouped_objects):
+        locked_objects = []
+        for contenttype, objs_by_id in grouped_objects.items():
+            locked_ids = self.filter(
+                locked_object_content_type=contenttype,
+                locked_object_id__in=objs_by_id.keys()
+            ).values_list('locked_object_id', flat=True)
+            locked_objects.extend(objs_by_id[object_id] for object_id in locked_ids)
+        return locked_objects
+
+    def create_many(self, objs, ttl=None):
+        """Locks all the given objects for ttl seconds (defaults to the lock timeout of
+        their model), or none of them.
+
+        Returns the list of created tokens, in the same order as ``objs``. Raises an
+        ``AlreadyLockedError`` listing the objects that are already locked if any.
+        """
+        check_ttl(ttl)
+        grouped_objects = group_objects_by_contenttype(objs)
+        locked_at = timezone.now()
+        with transaction.atomic():
+            for contenttype, objs_by_id in grouped_objects.items():
+                # Remove existing expired tokens for the objects to be locked
+                self.filter(
+                    locked_object_content_type=contenttype,
+                    locked_object_id__in=objs_by_id.keys(),
+                    expires_at__lt=locked_at
+                ).delete()
+            locked_objects = self._get_locked_objects(grouped_objects)
+            if locked_objects:
+                raise AlreadyLockedError(locked_objects=locked_objects)
+
+            lock_tokens = []
+            for contenttype, objs_by_id in grouped_objects.items():
+                expires_at = locked_at + datetime.timedelta(seconds=(
+                    get_contenttype_lock_timeout(contenttype.id) if ttl is None else ttl))
+                lock_tokens.extend(
+                    self.model(locked_object_content_type=contenttype,
+                               locked_object_id=object_id, locked_at=locked_at,
+                               expires_at=expires_at)
+                    for object_id in objs_by_id
+                )
+            for lock_token in lock_tokens:
+                # bulk_create does not call save
+                lock_token.set_token_uuid()
+            try:
+                with transaction.atomic():
+                    self.bulk_create(lock_tokens)
+            except IntegrityError:
+                # Someone locked some of the objects in the meantime
+                raise AlreadyLockedError(
+                    locked_objects=self._get_locked_objects(grouped_objects))
+
+            if lock_tokens and lock_tokens[0].pk is None:
+                # The database backend could not return the primary keys of the
+                # inserted rows
+                lock_tokens = list(self.filter(
+                    token_in([lock_token.token_str for lock_token in lock_tokens])))
+
+        tokens_by_key = dict(
+            ((lock_token.locked_object_content_type_id, lock_token.locked_object_id),
+             lock_token)
+            for lock_token in lock_tokens
+        )
+        state_cache.invalidate_many(tokens_by_key.keys())
+        return [tokens_by_key[key] for key in get_object_keys(objs)]
+
+
+class SharedLockTokenManager(Manager):
+    """Manages the tokens of the holders of shared locks.
+
+    The shared lock on an object is a lock token with ``shared`` set, which excludes
+    the exclusive locks like any other lock token. Its expiration datetime is kept to
+    the latest expiration datetime of its holders, so that it expires with the last of
+    them.
+    """
+
+    # Number of attempts to create a shared lock token before giving up, when other
+    # lock tokens are created concurrently for the same object
+    MAX_ATTEMPTS = 3
+
+    def _get_shared_lock(self, contenttype, object_id, for_update=False):
+        from lock_tokens.models import LockToken
+        lock_tokens = LockToken.objects.filter(locked_object_content_type=contenttype,
+                                               locked_object_id=object_id)
+        if for_update:
+            lock_tokens = lock_tokens.select_for_update()
+        return lock_tokens.first()
+
+    def create_for_contenttype_and_id(self, contenttype, object_id, ttl=None):
+        """Takes a shared lock on the object for ttl seconds (defaults to the lock
+        timeout of the model), and returns the token of the new holder. Raises
+        AlreadyLockedError if the object has a valid exclusive lock."""
+        from lock_tokens.models import LockToken
+        if check_ttl(ttl) is None:
+            ttl = get_contenttype_lock_timeout(contenttype.id)
+        for attempt in range(self.MAX_ATTEMPTS):
+            locked_at = timezone.now()
+            expires_at = locked_at + datetime.timedelta(seconds=ttl)
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                lock_token = self._get_shared_lock(contenttype, object_id, for_update=True)
+                if lock_token is not None and not lock_token.shared:
+                    if not lock_token.has_expired(locked_at):
+                        raise AlreadyLockedError
+                    lock_token = None
+                if lock_token is None:
+                    try:
+                        lock_token = LockToken.objects.create(
+                            locked_object_content_type=contenttype,
+                            locked_object_id=object_id, locked_at=locked_at,
+                            expires_at=expires_at, shared=True)
+                    except AlreadyLockedError:
+                        # The object has been locked in the meantime
+                        continue
+                elif lock_token.expires_at < expires_at:
+                    LockToken.objects.filter(pk=lock_token.pk).update(
+                        expires_at=expires_at)
+                    state_cache.invalidate(contenttype, object_id)
+                return self.create(lock_token_str=lock_token.token_str,
+                                   locked_object_content_type=contenttype,
+                                   locked_object_id=object_id, locked_at=locked_at,
+                                   expires_at=expires_at)
+        raise AlreadyLockedError
+
+    def create_for_object(self, obj, ttl=None):
+        contenttype = registry.get_contenttype(type(obj))
+        return self.create_for_contenttype_and_id(contenttype, obj.id, ttl)
+
+    def _get_shared_lock_token_strs(self, contenttype, object_id):
+        from lock_tokens.models import LockToken
+        return LockToken.objects.filter(locked_object_content_type=contenttype,
+                                        locked_object_id=object_id,
+                                        shared=True).values('token_str')
+
+    def get_for_token(self, contenttype, object_id, token_str):
+        """Returns the holder of the shared lock on the object with the given token, or
+        None, with a single query."""
+        return self.filter(token_equals(token_str), lock_token_str__in=(
+            self._get_shared_lock_token_strs(contenttype, object_id))).first()
+
+    def renew_token(self, contenttype, object_id, token_str, ttl=None):
+        """Renews the token of a holder of the shared lock on the object for ttl seconds
+        (defaults to the lock timeout of the model), extending the shared lock if
+        needed.
+
+        Returns the new (locked_at, expires_at) datetimes, or None if token_str is not
+        the token of a holder of the shared lock.
+        """
+        from lock_tokens.models import LockToken
+        if check_ttl(ttl) is None:
+            # contenttype may also be a content type id
+            ttl = get_contenttype_lock_timeout(getattr(contenttype, 'id', contenttype))
+        locked_at = timezone.now()
+        expires_at = locked_at + datetime.timedelta(seconds=ttl)
+        updated = self.filter(token_equals(token_str), lock_token_str__in=(
+            self._get_shared_lock_token_strs(contenttype, object_id))).update(
+                locked_at=locked_at, expires_at=expires_at)
+        if not updated:
+            return None
+        if LockToken.objects.filter(locked_object_content_type=contenttype,
+                                    locked_object_id=object_id, shared=True,
+                                    expires_at__lt=expires_at).update(expires_at=expires_at):
+            state_cache.invalidate(contenttype, object_id)
+        return locked_at, expires_at
+
+    def release_token(self, contenttype, object_id, token_str):
+        """Removes a holder of the shared lock on the object. The shared lock then
+        expires with the last remaining holder, or is released if there is none.
+
+        Returns whether token_str was the token of a holder of the shared lock.
+        """
+        if not token_may_exist(token_str):
+            return False
+        db = router.db_for_write(self.model)
+        holders = self.filter(token_equals(token_str), lock_token_str__in=(
+            self._get_shared_lock_token_strs(contenttype, object_id)))
+        # Nothing refers to (shared) lock tokens, so Django deletes them with a single
+        # DELETE statement (unless signal receivers are connected to the model)
+        if not holders.delete()[0]:
+            return False
+        with transaction.atomic(using=db):
+            lock_token = self._get_shared_lock(contenttype, object_id, for_update=True)
+            if lock_token is None or not lock_token.shared:
+                # The shared lock has been released in the meantime
+                return True
+            expires_at = self.filter(lock_token_str=lock_token.token_str).aggregate(
+                expires_at=Max('expires_at'))['expires_at']
+            lock_tokens = type(lock_token).objects.filter(pk=lock_token.pk)
+            if expires_at is None:
+                # That was the last holder
+                lock_tokens.delete()
+            else:
+                lock_tokens.update(expires_at=expires_at)
+        state_cache.invalidate(contenttype, object_id)
+        return True
+
+
+def _get_lock_tokens(model):
+    from lock_tokens.models import LockToken
+    contenttype = registry.get_contenttype(model)
+    return LockToken.objects.filter(locked_object_content_type=contenttype)
+
+
+def _get_locked_condition(model, now):
+    """Returns a Q object matching the objects of model that have a valid lock, or one
+    of whose ancestors has one, with one subquery per level of the hierarchy."""
+    condition = Q(pk__in=_get_lock_tokens(model).filter(
+        expires_at__gte=now).values('locked_object_id'))
+    path = []
+    for field in hierarchy.get_parent_fields(model):
+        path.append(field.name)
+        condition |= Q(**{'__'.join(path) + '__in': _get_lock_tokens(
+            field.related_model).filter(expires_at__gte=now).values('locked_object_id')})
+    return condition
+
+
+def annotate_lock_status(queryset):
+    """Annotates each object of the queryset with whether it is ``locked`` (by its own
+    lock or by the lock of an ancestor) and the expiration datetime of its own last lock
+    token (``lock_expires_at``, or None), in the same query."""
+    now = timezone.now()
+    lock_tokens = _get_lock_tokens(queryset.model).filter(locked_object_id=OuterRef('pk'))
+    if hierarchy.get_parent_field(queryset.model) is None:
+        locked = Exists(lock_tokens.filter(expires_at__gte=now))
+    else:
+        locked = Case(When(_get_locked_condition(queryset.model, now), then=Value(True)),
+                      default=Value(False), output_field=BooleanField())
+    return queryset.annotate(
+        locked=locked,
+        lock_expires_at=Subquery(
+            lock_tokens.order_by('-expires_at').values('expires_at')[:1]),
+    )
+
+
+def filter_locked(queryset, locked=True):
+    """Filters the queryset on whether the objects are locked, by their own lock or by
+    the lock of an ancestor, with one subquery per level of the hierarchy."""
+    condition = _get_locked_condition(queryset.model, timezone.now())
+    if locked:
+        return queryset.filter(condition)
+    return queryset.exclude(condition)
+
+
+class LockableQuerySet(QuerySet):
+
+    def with_lock_status(self):
+        return annotate_lock_status(self)
+
+    def locked(self):
+        return filter_locked(self)
+
+    def unlocked(self):
+        return filter_locked(self, locked=False)
+
+
+class LockableModelManager(Manager.from_queryset(LockableQuerySet)):
 
     def get_and_lock(self, *args, **kwargs):
         from lock_tokens.models import LockToken
         obj = super(LockableModelManager, self).get(*args, **kwargs)
         lock_token = LockToken.objects.create(obj)
         return obj, lock_token.serialize()
+
+    def _get_claim_candidates(self, queryset, n, connection):
+        candidates = filter_locked(queryset, locked=False)
+        if getattr(connection.features, 'has_select_for_update_skip_locked', False):
+            # Concurrent workers skip the rows being claimed by each other
+            return list(candidates.select_for_update(skip_locked=True)[:n])
+        # Without row locks, start at a random offset so that concurrent workers are
+        # unlikely to pick the same rows
+        offset = random.randint(0, max(candidates.count() - n, 0))
+        return list(candidates[offset:offset + n])
+
+    def claim(self, queryset=None, n=1, ttl=None):
+        """Locks up to n objects of the queryset (defaults to all the objects) that are
+        not locked, for ttl seconds, and returns a list of (obj, token) pairs. The
+        objects locked by somebody else in the meantime are skipped."""
+        from lock_tokens.backends import get_backend
+        queryset = self.all() if queryset is None else queryset
+        using = router.db_for_write(queryset.model)
+        with transaction.atomic(using=using):
+            objs = self._get_claim_candidates(queryset.using(using), n, connections[using])
+            while objs:
+                if hierarchy.is_hierarchical(queryset.model):
+                    # Like lock, skip the objects whose ancestors or descendants are
+                    # locked
+                    blocked_objs = hierarchy.get_blocked_objects(objs)
+                    objs = [obj for obj in objs if obj not in blocked_objs]
+                    if not objs:
+                        break
+                try:
+                    lock_tokens = get_backend().create_many(objs, ttl)
+                except AlreadyLockedError as e:
+                    objs = [obj for obj in objs if obj not in e.locked_objects]
+                else:
+                    return [(obj, lock_token.serialize())
+                            for obj, lock_token in zip(objs, lock_tokens)]
+        return []
@@ -0,0 +1,195 @@
+"""Lock lifecycle metrics.
+
+When the METRICS_ENABLED setting is set, counters and latency histograms are sent to
+the sink given by the METRICS_SINK setting, the in-process ``MetricsRegistry`` by
+default. Otherwise, the functions of this module return right away.
+"""
+import bisect
+import numbers
+import threading
+import time
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+HOLD_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200, 14400)
+
+_sink = None
+
+
+class BaseMetricsSink(object):
+    """Receives the lock metrics. Label values are strings."""
+
+    def inc(self, name, labels, value=1):
+        raise NotImplementedError
+
+    def observe(self, name, labels, value, buckets):
+        raise NotImplementedError
+
+
+class MetricsRegistry(BaseMetricsSink):
+    """Keeps the metrics in memory, and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0,
+                    'count': 0}
+            index = bisect.bisect_left(histogram['buckets'], value)
+            if index < len(histogram['counts']):
+                histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def get_counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_histogram(self, name, **labels):
+        """Returns a (count, sum) tuple."""
+        with self._lock:
+            histogram = self._histograms.get((name, tuple(sorted(labels.items()))))
+            return (histogram['count'], histogram['sum']) if histogram else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(histogram, counts=list(histogram['counts'])))
+                                for key, histogram in self._histograms.items())
+        lines = []
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append("# TYPE %s counter" % name)
+                last_name = name
+            lines.append("%s%s %s" % (name, _format_labels(labels), value))
+        for (name, labels), histogram in histograms:
+            if name != last_name:
+                lines.append("# TYPE %s histogram" % name)
+                last_name = name
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append("%s_bucket%s %s" % (
+                    name, _format_labels(labels + (('le', repr(float(bound))),)),
+                    cumulative))
+            lines.append("%s_bucket%s %s" % (
+                name, _format_labels(labels + (('le', '+Inf'),)), histogram['count']))
+            lines.append("%s_sum%s %r" % (name, _format_labels(labels), histogram['sum']))
+            lines.append("%s_count%s %s" % (name, _format_labels(labels),
+                                            histogram['count']))
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, value.replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n'))
+        for key, value in labels)
+
+
+def get_contenttype_label(contenttype):
+    """Returns the "app_label.model" label of a content type, content type id, or
+    label."""
+    from django.contrib.contenttypes.models import ContentType
+    if isinstance(contenttype, numbers.Integral):
+        contenttype = ContentType.objects.get_for_id(contenttype)
+    if isinstance(contenttype, ContentType):
+        return "%s.%s" % (contenttype.app_label, contenttype.model)
+    return contenttype or ""
+
+
+def get_sink():
+    return _sink
+
+
+def set_sink(sink):
+    """Sends the metrics to the given sink, or disables them if sink is None."""
+    global _sink
+    _sink = sink
+
+
+def is_enabled():
+    return _sink is not None
+
+
+def _get_labels(contenttype, labels):
+    labels = dict((key, str(value)) for key, value in labels.items())
+    labels['content_type'] = get_contenttype_label(contenttype)
+    return labels
+
+
+def inc(name, contenttype=None, **labels):
+    if _sink is None:
+        return
+    _sink.inc(name, _get_labels(contenttype, labels))
+
+
+def observe(name, value, contenttype=None, buckets=LATENCY_BUCKETS, **labels):
+    if _sink is None:
+        return
+    _sink.observe(name, _get_labels(contenttype, labels), value, buckets)
+
+
+def start_timer():
+    """Returns a value to give to observe_since, or None if the metrics are disabled."""
+    return _clock() if _sink is not None else None
+
+
+def observe_since(name, start, contenttype=None, buckets=LATENCY_BUCKETS, **labels):
+    if start is None or _sink is None:
+        return
+    observe(name, _clock() - start, contenttype, buckets, **labels)
+
+
+class track(object):
+    """Context manager that counts the executions of a block in ``<name>_total`` by
+    result, and measures their duration in ``<name>_seconds``. The result is the one
+    set on the tracker (``"ok"`` by default), or the one given in ``errors`` (a list of
+    (exception class, result) pairs) for the exception raised by the block, or
+    ``"error"``."""
+
+    def __init__(self, name, contenttype=None, errors=(), **labels):
+        self.name = name
+        self.contenttype = contenttype
+        self.errors = errors
+        self.labels = labels
+        self.result = 'ok'
+        self._start = None
+
+    def __enter__(self):
+        self._start = start_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._start is None or _sink is None:
+            return False
+        if exc_type is not None:
+            self.result = 'error'
+            for error_type, result in self.errors:
+                if issubclass(exc_type, error_type):
+                    self.result = result
+                    break
+        inc(self.name + '_total', self.contenttype, result=self.result, **self.labels)
+        observe_since(self.name + '_seconds', self._start, self.contenttype, **self.labels)
+        return False
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import F
+
+from lock_tokens.settings import TIMEOUT
+
+
+def set_expires_at(apps, schema_editor):
+    LockToken = apps.get_model('lock_tokens', 'LockToken')
+    LockToken.objects.using(schema_editor.connection.alias).update(
+        expires_at=F('locked_at') + datetime.timedelta(seconds=TIMEOUT))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lock_tokens', '0003_locktoken_locked_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locktoken',
+            name='expires_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_expires_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='locktoken',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import lock_tokens.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('lock_tokens', '0004_locktoken_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locktoken',
+            name='shared',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SharedLockToken',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('lock_token_str', models.CharField(max_length=32, editable=False, db_index=True)),
+                ('token_str', models.CharField(default=lock_tokens.models.get_random_token, unique=True, max_length=32, editable=False)),
+                ('locked_object_id', models.PositiveIntegerField()),
+                ('locked_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('expires_at', models.DateTimeField(editable=False, db_index=True)),
+                ('locked_object_content_type', models.ForeignKey(to='contenttypes.ContentType', on_delete=models.CASCADE)),
+            ],
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from lock_tokens.utils import parse_token
+
+
+BATCH_SIZE = 1000
+
+
+def set_token_uuids(apps, schema_editor):
+    # One UPDATE statement per batch of tokens
+    for model_name in ('LockToken', 'SharedLockToken'):
+        model = apps.get_model('lock_tokens', model_name)
+        tokens = model.objects.using(schema_editor.connection.alias)
+        rows = list(tokens.values_list('pk', 'token_str'))
+        for i in range(0, len(rows), BATCH_SIZE):
+            token_uuids = dict((pk, parse_token(token_str))
+                               for pk, token_str in rows[i:i + BATCH_SIZE])
+            whens = [models.When(pk=pk, then=models.Value(token_uuid,
+                                                          output_field=models.UUIDField()))
+                     for pk, token_uuid in token_uuids.items() if token_uuid is not None]
+            if whens:
+                tokens.filter(pk__in=list(token_uuids)).update(
+                    token_uuid=models.Case(*whens, output_field=models.UUIDField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lock_tokens', '0005_shared_locks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locktoken',
+            name='token_uuid',
+            field=models.UUIDField(unique=True, null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sharedlocktoken',
+            name='token_uuid',
+            field=models.UUIDField(unique=True, null=True, editable=False),
+        ),
+        migrations.RunPython(set_token_uuids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import lock_tokens.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lock_tokens', '0006_token_uuid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='locktoken',
+            name='token_str',
+            field=models.CharField(default=lock_tokens.models.get_random_token, max_length=32, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='sharedlocktoken',
+            name='token_str',
+            field=models.CharField(default=lock_tokens.models.get_random_token, max_length=32, editable=False),
+        ),
+    ]
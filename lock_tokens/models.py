@@ -1,64 +1,104 @@
 import datetime
 from uuid import uuid4
-import warnings
 
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 
-from lock_tokens.exceptions import (
-    AlreadyLockedError,
-    InvalidToken,
-    LockExpiredWarning,
-    NoLockWarning,
-    UnlockForbiddenError,
+from lock_tokens import hierarchy, metrics, signing, state_cache
+from lock_tokens.backends import get_backend
+from lock_tokens.exceptions import AlreadyLockedError, InvalidToken, UnlockForbiddenError
+from lock_tokens.managers import (
+    LockableModelManager,
+    LockTokenManager,
+    SharedLockTokenManager,
 )
-from lock_tokens.managers import LockableModelManager, LockTokenManager
-from lock_tokens.settings import DATEFORMAT, TIMEOUT
-from lock_tokens.utils import class_or_bound_method, get_oldest_valid_tokens_datetime
+from lock_tokens.registry import registry
+from lock_tokens.settings import DATEFORMAT
+from lock_tokens.utils import (
+    check_lock_token,
+    class_or_bound_method,
+    get_contenttype_lock_timeout,
+    parse_token,
+    sync_to_async,
+)
+from lock_tokens.waiters import notify_released, wait_for_lock
 
 
 def get_random_token():
     return uuid4().hex
 
 
-class LockToken(models.Model):
+class TokenMixin(object):
+    """Methods shared by the lock tokens and the shared lock tokens."""
+
+    def set_token_uuid(self):
+        """Copies the token string to the compact token column."""
+        if self.token_uuid is None:
+            self.token_uuid = parse_token(self.token_str)
+
+    def save(self, *args, **kwargs):
+        self.set_token_uuid()
+        return super(TokenMixin, self).save(*args, **kwargs)
+
+    def has_expired(self, now=None):
+        return self.expires_at < (now or timezone.now())
+
+    def get_expiration_datetime(self):
+        return self.expires_at
+
+    def get_ttl(self):
+        """Returns the lifetime of the lock token in seconds, which defaults to the lock
+        timeout of the model of the locked object."""
+        if self.expires_at is not None:
+            return int(round((self.expires_at - self.locked_at).total_seconds()))
+        return get_contenttype_lock_timeout(self.locked_object_content_type_id)
+
+    def serialize(self):
+        return {
+            "token": signing.sign_token(self),
+            "expires": datetime.datetime.strftime(
+                self.get_expiration_datetime(), DATEFORMAT
+            ),
+        }
+
+
+class LockToken(TokenMixin, models.Model):
     created = models.DateTimeField(auto_now_add=True, editable=False)
-    token_str = models.CharField(
-        max_length=32, unique=True, editable=False, default=get_random_token
-    )
+    token_str = models.CharField(max_length=32, editable=False, default=get_random_token)
+    # The token as a native UUID, the only indexed token column, used for the lookups
+    # by token
+    token_uuid = models.UUIDField(unique=True, null=True, editable=False)
     locked_object_content_type = models.ForeignKey(
         ContentType, on_delete=models.CASCADE
     )
     locked_object_id = models.PositiveIntegerField()
     locked_object = GenericForeignKey("locked_object_content_type", "locked_object_id")
     locked_at = models.DateTimeField(editable=False, default=timezone.now)
+    expires_at = models.DateTimeField(editable=False, db_index=True)
+    # A shared lock token is not given to anybody: it stands for all the holders of the
+    # shared lock on the object (the SharedLockToken instances), and expires with the
+    # last of them
+    shared = models.BooleanField(default=False, editable=False)
 
     objects = LockTokenManager()
 
     def __unicode__(self):
         return self.token_str
 
-    def has_expired(self):
-        return self.locked_at < get_oldest_valid_tokens_datetime()
-
-    def get_expiration_datetime(self):
-        return self.locked_at + datetime.timedelta(seconds=TIMEOUT)
+    def renew(self, ttl=None):
+        with metrics.track('lock_tokens_renew', self.locked_object_content_type_id,
+                           errors=((InvalidToken, 'invalid_token'),)):
+            get_backend().renew(self, ttl)
 
-    def renew(self):
-        self.locked_at = timezone.now()
-        self.save()
-
-    def serialize(self):
-        return {
-            "token": self.token_str,
-            "expires": datetime.datetime.strftime(
-                self.get_expiration_datetime(), DATEFORMAT
-            ),
-        }
+    def release(self):
+        get_backend().release(self)
 
     def save(self, *args, **opts):
+        if self.expires_at is None:
+            self.expires_at = self.locked_at + datetime.timedelta(
+                seconds=self.get_ttl())
         try:
             with transaction.atomic():
                 if not self.pk:
@@ -67,66 +107,225 @@ class LockToken(models.Model):
                     LockToken.objects.filter(
                         locked_object_id=self.locked_object_id,
                         locked_object_content_type=self.locked_object_content_type,
-                        locked_at__lte=self.locked_at
-                        - datetime.timedelta(seconds=TIMEOUT),
+                        expires_at__lt=self.locked_at,
                     ).delete()
-                return super(LockToken, self).save(*args, **opts)
+                saved = super(LockToken, self).save(*args, **opts)
         except IntegrityError:
             raise AlreadyLockedError
+        state_cache.invalidate(self.locked_object_content_type_id, self.locked_object_id)
+        return saved
+
+    def delete(self, *args, **kwargs):
+        deleted = super(LockToken, self).delete(*args, **kwargs)
+        state_cache.invalidate(self.locked_object_content_type_id, self.locked_object_id)
+        return deleted
 
     class Meta:
         unique_together = (("locked_object_content_type", "locked_object_id"),)
 
 
+class SharedLockToken(TokenMixin, models.Model):
+    """The token of one of the holders of a shared lock. It is valid as long as the
+    shared lock token of the object, whose token string is ``lock_token_str``, exists."""
+    lock_token_str = models.CharField(max_length=32, editable=False, db_index=True)
+    token_str = models.CharField(max_length=32, editable=False, default=get_random_token)
+    token_uuid = models.UUIDField(unique=True, null=True, editable=False)
+    locked_object_content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE
+    )
+    locked_object_id = models.PositiveIntegerField()
+    locked_at = models.DateTimeField(editable=False, default=timezone.now)
+    expires_at = models.DateTimeField(editable=False, db_index=True)
+
+    objects = SharedLockTokenManager()
+
+    def __unicode__(self):
+        return self.token_str
+
+    def renew(self, ttl=None):
+        with metrics.track('lock_tokens_renew', self.locked_object_content_type_id,
+                           errors=((InvalidToken, 'invalid_token'),)):
+            renewed = SharedLockToken.objects.renew_token(
+                self.locked_object_content_type_id, self.locked_object_id,
+                self.token_str, self.get_ttl() if ttl is None else ttl)
+            if renewed is None:
+                raise InvalidToken
+            self.locked_at, self.expires_at = renewed
+
+    def release(self):
+        SharedLockToken.objects.release_token(self.locked_object_content_type_id,
+                                              self.locked_object_id, self.token_str)
+
+
 class LockableModel(models.Model):
 
+    # The default lifetime in seconds of the locks on the instances of the model. The
+    # TIMEOUT setting is used if it is not set.
+    lock_timeout = None
+
+    # The name of the foreign key to the parent of the instances of the model, whose
+    # locks cover them (see lock_tokens.hierarchy)
+    lock_parent = None
+
     objects = LockableModelManager()
 
     @staticmethod
-    def _lock(obj, token=None):
-        # Token renewing attempt
-        if token is not None:
-            try:
-                lock_token = LockToken.objects.get_for_object(obj)
-            except LockToken.DoesNotExist:
-                raise InvalidToken
-            else:
-                if not lock_token.token_str == token:
-                    raise InvalidToken
-                lock_token.renew()
-                return lock_token
+    def _lock_contenttype_and_id(contenttype, object_id, token=None, ttl=None,
+                                 wait=None, shared=False, obj=None):
+        if token is None and wait:
+            return wait_for_lock(
+                lambda: LockableModel._lock_contenttype_and_id(
+                    contenttype, object_id, ttl=ttl, shared=shared, obj=obj),
+                contenttype.id, object_id, wait)
+        backend = get_backend()
+        with metrics.track('lock_tokens_acquire', contenttype, errors=(
+                (AlreadyLockedError, 'already_locked'), (InvalidToken, 'invalid_token'))
+        ) as tracker:
+            # Token renewing attempt
+            if token is not None:
+                tracker.result = 'renewed'
+                token = signing.check_token(token, contenttype, object_id,
+                                            allow_expired=True)
+                try:
+                    return backend.renew_token(contenttype, object_id, token, ttl)
+                except InvalidToken:
+                    # The token may be the one of a lock on an ancestor of the object
+                    lock_token = LockableModel._get_ancestor_lock_token(
+                        contenttype, object_id, token, obj)
+                    if lock_token is None:
+                        raise
+                    return backend.renew_token(
+                        ContentType.objects.get_for_id(
+                            lock_token.locked_object_content_type_id),
+                        lock_token.locked_object_id, token, ttl)
 
-        # Token creation attempt
-        lock_token, created = LockToken.objects.get_or_create_for_object(obj)
-        if not created:
-            raise AlreadyLockedError
-        return lock_token
+            # Token creation attempt
+            tracker.result = 'created'
+            model = contenttype.model_class()
+            if model is not None and hierarchy.is_hierarchical(model):
+                hierarchy.check_can_lock(model, object_id, obj)
+            if shared:
+                return backend.create_shared_for_contenttype_and_id(contenttype,
+                                                                    object_id, ttl)
+            return backend.create_for_contenttype_and_id(contenttype, object_id, ttl)
 
     @staticmethod
-    def _check_and_get_lock_token(obj, token):
+    def _lock(obj, token=None, ttl=None, wait=None, shared=False):
+        contenttype = registry.get_contenttype(type(obj))
+        return LockableModel._lock_contenttype_and_id(contenttype, obj.id, token, ttl,
+                                                      wait, shared, obj)
+
+    @staticmethod
+    def _get_lock_tokens(contenttype, object_id, obj=None, use_cache=True):
+        """Returns the lock token of the object (or None), and the list of the lock
+        tokens of its ancestors."""
+        model = contenttype.model_class()
+        if hierarchy.get_parent_field(model) is not None:
+            return hierarchy.get_lock_tokens(model, contenttype, object_id, obj, use_cache)
         try:
-            lock_token = LockToken.objects.get_for_object(obj)
+            return get_backend().get_for_contenttype_and_id(contenttype, object_id), []
         except LockToken.DoesNotExist:
-            warnings.warn("This object is not locked.", NoLockWarning)
+            return None, []
+
+    @staticmethod
+    def _get_ancestor_lock_token(contenttype, object_id, token, obj=None):
+        if hierarchy.get_parent_field(contenttype.model_class()) is None:
+            return None
+        ancestor_lock_tokens = LockableModel._get_lock_tokens(contenttype, object_id,
+                                                              obj, use_cache=False)[1]
+        for lock_token in ancestor_lock_tokens:
+            if lock_token.token_str == token:
+                return lock_token
+        return None
+
+    @staticmethod
+    def _check_and_get_lock_token_for_contenttype_and_id(contenttype, object_id, token,
+                                                         obj=None, allow_expired=False):
+        try:
+            token = signing.check_token(token, contenttype, object_id, allow_expired)
+        except InvalidToken:
+            # A forged, mismatched or expired signed token is rejected without any query
+            if metrics.is_enabled():
+                metrics.inc('lock_tokens_checks_total', contenttype, result='invalid')
             return False, None
-        if token == lock_token.token_str:
-            if lock_token.has_expired():
-                warnings.warn("Lock has expired", LockExpiredWarning)
+        backend = get_backend()
+        lock_token, ancestor_lock_tokens = LockableModel._get_lock_tokens(
+            contenttype, object_id, obj)
+        if lock_token is not None and lock_token.shared:
+            # The token may be the one of a holder of the shared lock
+            lock_token = backend.get_shared_token(contenttype, object_id,
+                                                  token) or lock_token
+        if ancestor_lock_tokens and (lock_token is None or lock_token.token_str != token):
+            # The object is covered by the locks of its ancestors
+            lock_token = next((ancestor_lock_token
+                               for ancestor_lock_token in ancestor_lock_tokens
+                               if ancestor_lock_token.token_str == token),
+                              lock_token or ancestor_lock_tokens[0])
+        valid = check_lock_token(lock_token, token)
+        if metrics.is_enabled():
+            metrics.inc('lock_tokens_checks_total', contenttype,
+                        result='valid' if valid else 'invalid')
+            if lock_token is None:
+                metrics.inc('lock_tokens_warnings_total', contenttype, warning='no_lock')
+            elif valid and lock_token.has_expired():
+                metrics.inc('lock_tokens_warnings_total', contenttype,
+                            warning='lock_expired')
+        if valid:
             return True, lock_token
         return False, None
 
+    @staticmethod
+    def _check_and_get_lock_token(obj, token, allow_expired=False):
+        contenttype = registry.get_contenttype(type(obj))
+        return LockableModel._check_and_get_lock_token_for_contenttype_and_id(
+            contenttype, obj.id, token, obj, allow_expired)
+
+    @staticmethod
+    def _unlock_contenttype_and_id(contenttype, object_id, token):
+        with metrics.track('lock_tokens_release', contenttype,
+                           errors=((UnlockForbiddenError, 'forbidden'),)):
+            try:
+                token = signing.check_token(token, contenttype, object_id,
+                                            allow_expired=True)
+            except InvalidToken:
+                raise UnlockForbiddenError
+            if not get_backend().release_token(contenttype, object_id, token):
+                raise UnlockForbiddenError
+        notify_released(contenttype.id, object_id)
+
+    @staticmethod
+    def _is_contenttype_and_id_locked(contenttype, object_id, obj=None):
+        lock_token, ancestor_lock_tokens = LockableModel._get_lock_tokens(
+            contenttype, object_id, obj)
+        now = timezone.now()
+        return any(not lock_token.has_expired(now)
+                   for lock_token in [lock_token] + ancestor_lock_tokens
+                   if lock_token is not None)
+
+    @classmethod
+    def _get_model_contenttype(cls, model=None):
+        model = model or cls
+        if model._meta.abstract:
+            raise TypeError("The model of the object to lock must be given.")
+        return registry.get_contenttype(model)
+
     @class_or_bound_method
-    def lock(cls, obj, token=None):
-        lock_token = cls._lock(obj, token)
+    def lock(cls, obj, token=None, ttl=None, wait=None, shared=False):
+        lock_token = cls._lock(obj, token, ttl, wait, shared)
         return lock_token.serialize()
 
+    @classmethod
+    def lock_many(cls, objs, ttl=None):
+        objs_to_lock, covering_objs = hierarchy.escalate_objects(objs)
+        blocked_objs = hierarchy.get_blocked_objects(objs_to_lock)
+        if blocked_objs:
+            raise AlreadyLockedError(locked_objects=blocked_objs)
+        lock_tokens = dict(zip(objs_to_lock, get_backend().create_many(objs_to_lock, ttl)))
+        return [lock_tokens[obj].serialize() for obj in covering_objs]
+
     @class_or_bound_method
     def unlock(cls, obj, token):
-        allowed, lock_token = cls._check_and_get_lock_token(obj, token)
-        if not allowed:
-            raise UnlockForbiddenError
-        if lock_token:
-            lock_token.delete()
+        cls._unlock_contenttype_and_id(registry.get_contenttype(type(obj)), obj.id, token)
 
     @class_or_bound_method
     def check_lock_token(cls, obj, token):
@@ -134,11 +333,75 @@ class LockableModel(models.Model):
 
     @class_or_bound_method
     def is_locked(cls, obj):
-        try:
-            lock_token = LockToken.objects.get_for_object(obj)
-        except LockToken.DoesNotExist:
-            return False
-        return not lock_token.has_expired()
+        return cls._is_contenttype_and_id_locked(registry.get_contenttype(type(obj)),
+                                                 obj.id, obj)
+
+    # The following methods take an object id instead of an object, so that the
+    # object does not have to be fetched from the database. When they are not called
+    # on a LockableModel subclass, the model of the object must be given.
+
+    @classmethod
+    def lock_by_id(cls, object_id, token=None, model=None, ttl=None, wait=None,
+                   shared=False):
+        contenttype = cls._get_model_contenttype(model)
+        return cls._lock_contenttype_and_id(contenttype, object_id, token, ttl,
+                                            wait, shared).serialize()
+
+    @classmethod
+    def unlock_by_id(cls, object_id, token, model=None):
+        cls._unlock_contenttype_and_id(cls._get_model_contenttype(model), object_id, token)
+
+    @classmethod
+    def check_lock_token_by_id(cls, object_id, token, model=None):
+        return cls._check_and_get_lock_token_for_contenttype_and_id(
+            cls._get_model_contenttype(model), object_id, token)[0]
+
+    @classmethod
+    def is_locked_by_id(cls, object_id, model=None):
+        return cls._is_contenttype_and_id_locked(cls._get_model_contenttype(model),
+                                                 object_id)
+
+    @classmethod
+    def is_locked_many(cls, objs):
+        return get_backend().is_locked_many(objs)
+
+    @classmethod
+    def check_lock_tokens_many(cls, tokens_by_object):
+        results = {}
+        token_strs_by_object = {}
+        for obj, token in tokens_by_object.items():
+            try:
+                token_strs_by_object[obj] = signing.check_token(
+                    token, registry.get_contenttype(type(obj)), obj.pk)
+            except InvalidToken:
+                results[obj] = False
+        if token_strs_by_object:
+            results.update(get_backend().check_lock_tokens_many(token_strs_by_object))
+        return results
+
+    # Asynchronous versions of the methods above. Each of them runs the database
+    # queries of the synchronous method in a single sync_to_async call, like the
+    # asynchronous queryset methods of Django do.
+
+    @class_or_bound_method
+    def alock(cls, obj, token=None, ttl=None, wait=None, shared=False):
+        return sync_to_async(cls.lock)(obj, token, ttl, wait, shared)
+
+    @classmethod
+    def alock_many(cls, objs, ttl=None):
+        return sync_to_async(cls.lock_many)(objs, ttl)
+
+    @class_or_bound_method
+    def aunlock(cls, obj, token):
+        return sync_to_async(cls.unlock)(obj, token)
+
+    @class_or_bound_method
+    def acheck_lock_token(cls, obj, token):
+        return sync_to_async(cls.check_lock_token)(obj, token)
+
+    @class_or_bound_method
+    def ais_locked(cls, obj):
+        return sync_to_async(cls.is_locked)(obj)
 
     class Meta:
         abstract = True
@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+
+from django.db import connections
+from django.utils import timezone
+
+from lock_tokens.settings import (
+    REAPER_BATCH_SIZE,
+    REAPER_MAX_INTERVAL,
+    REAPER_MIN_INTERVAL,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# The id of the lock token that elects the process running the reaper, among the lock
+# tokens locking lock tokens
+LEADER_OBJECT_ID = 0
+
+
+def exclude_leader_token(queryset):
+    """Excludes the lock token that elects the leader from a LockToken queryset, without
+    any additional query."""
+    from lock_tokens.models import LockToken
+
+    return queryset.exclude(
+        locked_object_content_type__app_label=LockToken._meta.app_label,
+        locked_object_content_type__model=LockToken._meta.model_name,
+        locked_object_id=LEADER_OBJECT_ID)
+
+
+class Reaper(object):
+    """Removes expired lock tokens from a background thread.
+
+    Only one process per database removes tokens at a time: the leader, which holds a
+    lock token on the LockToken model itself, that expires after twice ``max_interval``
+    seconds so that the other processes take over when the leader stops. Each run removes at most ``max_batches``
+    batches of ``batch_size`` tokens. The delay between runs is halved when a run
+    removes a full batch or more, and doubled when it removes less than a tenth of a
+    batch, between ``min_interval`` and ``max_interval`` seconds.
+    """
+
+    max_batches = 10
+
+    def __init__(self, batch_size=None, min_interval=None, max_interval=None):
+        self.batch_size = batch_size or REAPER_BATCH_SIZE
+        self.min_interval = min_interval or REAPER_MIN_INTERVAL
+        self.max_interval = max_interval or REAPER_MAX_INTERVAL
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._token = None
+        self.interval = self.min_interval
+        self.is_leader = False
+        self.last_run = None
+        self.last_duration = None
+        self.last_reclaimed = 0
+        self.total_reclaimed = 0
+
+    def ensure_started(self):
+        """Starts the reaper thread if it is not running in the current process."""
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run,
+                                                name='lock_tokens-reaper')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _elect(self):
+        from django.contrib.contenttypes.models import ContentType
+        from lock_tokens.models import LockToken
+
+        contenttype = ContentType.objects.get_for_model(LockToken)
+        # The leader runs at least every max_interval seconds
+        ttl = 2 * self.max_interval
+        if self._token is not None:
+            if LockToken.objects.renew_token(contenttype, LEADER_OBJECT_ID,
+                                             self._token, ttl) is not None:
+                return True
+        lock_token, created = LockToken.objects.get_or_create_for_contenttype_and_id(
+            contenttype, LEADER_OBJECT_ID, ttl)
+        self._token = lock_token.token_str if created else None
+        return created
+
+    def run_once(self):
+        """Removes expired tokens if the current process is the leader, and returns the
+        number of removed tokens (None if the process is not the leader)."""
+        from lock_tokens.models import LockToken
+
+        started = time.time()
+        self.is_leader = self._elect()
+        if not self.is_leader:
+            # Check every now and then whether the leader is still alive
+            self.interval = self.max_interval
+            return None
+
+        expired_before = timezone.now()
+        reclaimed = 0
+        for _ in range(self.max_batches):
+            deleted = LockToken.objects.delete_expired_batch(expired_before,
+                                                             self.batch_size)
+            reclaimed += deleted
+            if deleted < self.batch_size:
+                break
+
+        self.last_run = timezone.now()
+        self.last_duration = time.time() - started
+        self.last_reclaimed = reclaimed
+        self.total_reclaimed += reclaimed
+        if reclaimed >= self.batch_size:
+            self.interval = max(self.interval / 2.0, self.min_interval)
+        elif reclaimed < self.batch_size / 10.0:
+            self.interval = min(self.interval * 2.0, self.max_interval)
+        return reclaimed
+
+    def stats(self):
+        """Returns a dict with the last run datetime ("last_run"), its duration in
+        seconds ("last_duration"), the number of tokens it removed ("last_reclaimed"),
+        the number of tokens removed so far ("total_reclaimed"), the current delay
+        between runs ("interval") and whether the process is the leader ("is_leader")."""
+        return {
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'last_reclaimed': self.last_reclaimed,
+            'total_reclaimed': self.total_reclaimed,
+            'interval': self.interval,
+            'is_leader': self.is_leader,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Could not remove expired lock tokens")
+                self.interval = self.max_interval
+            finally:
+                connections.close_all()
+            self._stop.wait(self.interval)
+
+
+_reaper = None
+
+
+def get_reaper():
+    global _reaper
+    if _reaper is None:
+        _reaper = Reaper()
+    return _reaper
+
+
+def start_reaper(**kwargs):
+    """Starts the reaper in the current process, if it is not running. With the
+    REAPER_ENABLED setting, it is connected to the request_started signal, so that the
+    reaper starts with the first request handled by each process."""
+    get_reaper().ensure_started()
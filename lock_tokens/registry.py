@@ -0,0 +1,56 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+
+
+class LockableModelRegistry(object):
+    """Registry of the models that can be locked through the API.
+
+    It contains the ``LockableModel`` subclasses (registered when the application is
+    ready), the models managed by a ``LockableModelAdmin``, and the models explicitly
+    registered with ``lock_tokens.registry.register``.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._session_key_prefixes = {}
+
+    def _get_key(self, model):
+        opts = model._meta.concrete_model._meta
+        return (opts.app_label, opts.model_name)
+
+    def register(self, model):
+        key = self._get_key(model)
+        self._models[key] = model._meta.concrete_model
+        self._session_key_prefixes[key] = "_".join(key)
+        return model
+
+    def autodiscover(self):
+        from lock_tokens.models import LockableModel
+        for model in apps.get_models():
+            if issubclass(model, LockableModel):
+                self.register(model)
+
+    def is_registered(self, model):
+        return self._get_key(model) in self._models
+
+    def get_model(self, app_label, model_name):
+        """Returns the registered model with the given natural key, or None."""
+        return self._models.get((app_label, model_name.lower()))
+
+    def get_contenttype(self, model):
+        # ContentType.objects.get_for_model caches the content types once fetched
+        return ContentType.objects.get_for_model(model)
+
+    def get_session_key_prefix(self, model):
+        key = self._get_key(model)
+        prefix = self._session_key_prefixes.get(key)
+        return prefix if prefix is not None else "_".join(key)
+
+
+registry = LockableModelRegistry()
+
+
+def register(model):
+    """Makes the given model lockable through the API. Can be used as a class
+    decorator."""
+    return registry.register(model)
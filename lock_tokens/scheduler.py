@@ -0,0 +1,188 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from django.db import connections
+
+from lock_tokens import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class _Entry(object):
+    def __init__(self, lock_token):
+        self.lock_token = lock_token
+        self.active = True
+
+
+class RenewalScheduler(object):
+    """Renews held lock tokens from a single daemon thread.
+
+    Held lock tokens are kept in a heap ordered by renewal deadline. When the earliest
+    deadline is reached, every lock token due within the next ``tick`` seconds is
+    renewed with a single call to the backend ``renew_many`` method. The database
+    connections opened by the thread are closed after each renewal.
+
+    The scheduler is fork-safe: when it is used in a process forked from the one that
+    started it, it forgets the lock tokens held by the parent process and starts its own
+    thread.
+    """
+
+    def __init__(self, interval=None, tick=1.0):
+        # When no interval is given, each lock token is renewed one second before it
+        # expires
+        self.interval = interval
+        self.tick = tick
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._heap = []
+        self._entries = set()
+        self._renewing = set()
+        self._counter = itertools.count()
+        self._thread = None
+        self._renewals = 0
+        self._failures = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _start_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run,
+                                            name='lock_tokens-renewal-scheduler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _get_interval(self, lock_token):
+        if self.interval is not None:
+            return self.interval
+        return max(lock_token.get_ttl() - 1, 1)
+
+    def _push(self, entry, deadline):
+        heapq.heappush(self._heap, (deadline, next(self._counter), entry))
+
+    def add(self, lock_token):
+        """Starts holding the lock token, which is renewed right away and then every
+        ``interval`` seconds (or one second before it expires) until ``remove`` is
+        called or a renewal fails. Returns an
+        opaque handle to be given to ``remove``."""
+        self._check_pid()
+        entry = _Entry(lock_token)
+        with self._condition:
+            self._entries.add(entry)
+            self._push(entry, _clock())
+            self._start_thread()
+            self._condition.notify()
+        return entry
+
+    def remove(self, entry):
+        """Stops holding the lock token. Once this returns, the lock token will not be
+        renewed anymore."""
+        self._check_pid()
+        with self._condition:
+            entry.active = False
+            self._entries.discard(entry)
+            while entry in self._renewing:
+                self._condition.wait()
+
+    def stats(self):
+        """Returns a dict with the number of held lock tokens ("held"), the number of
+        renewals and failed renewals so far ("renewals", "failures"), and how late the
+        last and the latest renewals were in seconds ("last_lag", "max_lag")."""
+        self._check_pid()
+        with self._condition:
+            return {
+                'held': len(self._entries),
+                'renewals': self._renewals,
+                'failures': self._failures,
+                'last_lag': self._last_lag,
+                'max_lag': self._max_lag,
+            }
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now + self.tick:
+            deadline, _, entry = heapq.heappop(self._heap)
+            if entry.active:
+                due.append((deadline, entry))
+        return due
+
+    def renew_due(self, now=None):
+        """Renews the lock tokens that are due, and returns the delay in seconds until
+        the next deadline (or None if no lock token is held)."""
+        from lock_tokens.backends import get_backend
+
+        now = _clock() if now is None else now
+        with self._condition:
+            due = self._pop_due(now)
+            self._renewing.update(entry for _, entry in due)
+        if due:
+            lock_tokens = [entry.lock_token for _, entry in due]
+            try:
+                failed = get_backend().renew_many(lock_tokens)
+            except Exception:
+                logger.exception("Could not renew lock tokens")
+                failed = lock_tokens
+            failed = set(id(lock_token) for lock_token in failed)
+            lag = max(now - deadline for deadline, _ in due)
+            if metrics.is_enabled():
+                for lock_token in lock_tokens:
+                    metrics.inc('lock_tokens_scheduled_renewals_total',
+                                lock_token.locked_object_content_type_id,
+                                result='failed' if id(lock_token) in failed else 'ok')
+        with self._condition:
+            if due:
+                now = _clock()
+                for _, entry in due:
+                    self._renewing.discard(entry)
+                    if id(entry.lock_token) in failed:
+                        # The lock is lost, stop holding it
+                        entry.active = False
+                        self._entries.discard(entry)
+                    elif entry.active:
+                        self._push(entry, now + self._get_interval(entry.lock_token))
+                self._renewals += len(due) - len(failed)
+                self._failures += len(failed)
+                self._last_lag = max(lag, 0.0)
+                self._max_lag = max(self._max_lag, self._last_lag)
+                self._condition.notify_all()
+            return self._get_next_delay()
+
+    def _get_next_delay(self):
+        while self._heap and not self._heap[0][2].active:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - _clock(), 0.0)
+
+    def _run(self):
+        while True:
+            if self.renew_due() == 0.0:
+                continue
+            connections.close_all()
+            with self._condition:
+                delay = self._get_next_delay()
+                if delay != 0.0:
+                    self._condition.wait(delay)
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RenewalScheduler()
+    return _scheduler
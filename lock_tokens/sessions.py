@@ -1,32 +1,177 @@
 from django.contrib.contenttypes.models import ContentType
 
+from lock_tokens import hierarchy, signing
+from lock_tokens.backends import get_backend
+from lock_tokens.exceptions import AlreadyLockedError
 from lock_tokens.models import LockableModel
+from lock_tokens.registry import registry
+from lock_tokens.settings import ESCALATION_THRESHOLD
+
+
+# The lock tokens held by a session are stored in a single session entry, as a
+# {contenttype id: {object id: token}} dict (with string keys, so that it can be
+# serialized as JSON)
+SESSION_KEY = '_lock_tokens'
 
 
 def get_session_key(obj):
-    contenttype = ContentType.objects.get_for_model(obj)
-    return "_".join([contenttype.app_label, contenttype.model, str(obj.id)])
+    """Returns the session key where the token of obj was stored by previous versions."""
+    return "_".join([registry.get_session_key_prefix(type(obj)), str(obj.id)])
+
+
+def _get_keys(obj):
+    return str(registry.get_contenttype(type(obj)).id), str(obj.id)
+
+
+def _set_session_token(session, contenttype_id, object_id, token):
+    """Stores the token of an object in the session, or removes it if token is None.
+    The session is only modified if the token changes."""
+    tokens = session.get(SESSION_KEY, {})
+    tokens_by_id = tokens.get(contenttype_id, {})
+    if tokens_by_id.get(object_id) == token:
+        return
+    if token is None:
+        del tokens_by_id[object_id]
+        if not tokens_by_id:
+            del tokens[contenttype_id]
+    else:
+        tokens.setdefault(contenttype_id, tokens_by_id)[object_id] = token
+    session[SESSION_KEY] = tokens
+
+
+def get_session_token(obj, session):
+    """Returns the token of obj held by the session, or None."""
+    contenttype_id, object_id = _get_keys(obj)
+    token = session.get(SESSION_KEY, {}).get(contenttype_id, {}).get(object_id)
+    if token is None:
+        legacy_key = get_session_key(obj)
+        token = session.get(legacy_key)
+        if token is not None:
+            # Move the token stored by a previous version to the session entry
+            del session[legacy_key]
+            _set_session_token(session, contenttype_id, object_id, token)
+    return token
+
+
+def _get_ancestor_session_lock(obj, session):
+    tokens = session.get(SESSION_KEY)
+    if not tokens or hierarchy.get_parent_field(type(obj)) is None:
+        return None, None
+    for contenttype, ancestor_id in hierarchy.get_ancestor_keys(type(obj), obj.id, obj):
+        token = tokens.get(str(contenttype.id), {}).get(str(ancestor_id))
+        if token is not None:
+            return contenttype.model_class()(pk=ancestor_id), token
+    return None, None
+
+
+def get_ancestor_session_token(obj, session):
+    """Returns the token of the lock held by the session on the nearest ancestor of obj,
+    which covers obj, or None."""
+    return _get_ancestor_session_lock(obj, session)[1]
+
+
+def get_held_session_lock(obj, session):
+    """Returns an (object, token) pair for the lock held by the session that covers
+    obj: its own lock, or else the lock on its nearest ancestor, the object being the
+    ancestor (with only its id set). The token is None if the session holds none."""
+    token = get_session_token(obj, session)
+    if token is None:
+        ancestor, token = _get_ancestor_session_lock(obj, session)
+        if token is not None:
+            return ancestor, token
+    return obj, token
+
+
+def escalate_for_session(obj, session, ttl=None):
+    """Replaces the locks held by the session on obj and its siblings by a lock on their
+    parent, if there are more than ESCALATION_THRESHOLD of them and the parent can be
+    locked."""
+    parent = hierarchy.get_parent(obj)
+    if parent is None:
+        return
+    contenttype_id, object_id = _get_keys(obj)
+    tokens_by_id = session.get(SESSION_KEY, {}).get(contenttype_id, {})
+    if len(tokens_by_id) <= ESCALATION_THRESHOLD:
+        return
+    tokens_by_id = dict((object_id, signing.get_token_str(token))
+                        for object_id, token in tokens_by_id.items())
+    lock_tokens = hierarchy.get_child_lock_tokens(parent, type(obj), tokens_by_id)
+    if len(lock_tokens) <= ESCALATION_THRESHOLD:
+        return
+    try:
+        parent_lock_token = hierarchy.escalate(parent, lock_tokens, ttl)
+    except AlreadyLockedError:
+        # The session keeps the locks on the children
+        return
+    for lock_token in lock_tokens:
+        _set_session_token(session, contenttype_id, str(lock_token.locked_object_id), None)
+    _set_session_token(session, *_get_keys(parent),
+                       token=signing.sign_token(parent_lock_token))
+
+
+def prune_session(session):
+    """Removes from the session the tokens of the locks that have been released or
+    replaced (including the expired locks removed from the database), with one query
+    per content type. The tokens of the objects with a shared lock are kept."""
+    tokens = session.get(SESSION_KEY)
+    if not tokens:
+        return
+    objs = []
+    session_tokens = {}
+    for contenttype_id, tokens_by_id in tokens.items():
+        model = ContentType.objects.get_for_id(int(contenttype_id)).model_class()
+        for object_id, token in tokens_by_id.items():
+            if model is not None:
+                obj = model(id=int(object_id))
+                objs.append(obj)
+                session_tokens[obj] = (contenttype_id, object_id, token)
+    lock_tokens = get_backend().get_for_objects(objs) if objs else {}
+    pruned = dict((contenttype_id, {}) for contenttype_id in tokens)
+    for obj, lock_token in lock_tokens.items():
+        contenttype_id, object_id, token = session_tokens[obj]
+        token_str = signing.get_token_str(token)
+        if lock_token is not None and (lock_token.shared or lock_token.token_str == token_str):
+            pruned[contenttype_id][object_id] = token
+    pruned = dict((contenttype_id, tokens_by_id)
+                  for contenttype_id, tokens_by_id in pruned.items() if tokens_by_id)
+    if pruned != tokens:
+        session[SESSION_KEY] = pruned
 
 
-def lock_for_session(obj, session, force_new=False):
-    session_key = get_session_key(obj)
-    token = session.get(session_key)
-    if token and force_new:
-      del session[session_key]
-      token = None
-    lock_token = LockableModel.lock(obj, token)
-    session[session_key] = lock_token['token']
+def lock_for_session(obj, session, force_new=False, ttl=None, wait=None, shared=False):
+    contenttype_id, object_id = _get_keys(obj)
+    token = None
+    if not force_new:
+        token = get_session_token(obj, session)
+        if not token:
+            token = get_ancestor_session_token(obj, session)
+    lock_token = LockableModel.lock(obj, token, ttl, wait, shared)
+    if signing.get_token_str(lock_token['token']) != signing.get_token_str(token):
+        # The session is written anyway, take the opportunity to remove the tokens
+        # that are not valid anymore
+        prune_session(session)
+        _set_session_token(session, contenttype_id, object_id, lock_token['token'])
+        escalate_for_session(obj, session, ttl)
+    elif lock_token['token'] != token:
+        # The renewed signed token carries the new expiration time of the lock, which
+        # may be held on an ancestor of obj
+        signed_token = signing.unsign_token(lock_token['token'])
+        _set_session_token(session, str(signed_token.contenttype_id),
+                           signed_token.object_id, lock_token['token'])
 
 
 def unlock_for_session(obj, session):
-    session_key = get_session_key(obj)
-    token = session.get(session_key)
+    token = get_session_token(obj, session)
+    if token is None and get_ancestor_session_token(obj, session) is not None:
+        # The object is covered by the lock of one of its ancestors
+        return
     LockableModel.unlock(obj, token)
     if token:
-        del session[session_key]
+        _set_session_token(session, *_get_keys(obj), token=None)
 
 
 def check_for_session(obj, session):
-    session_key = get_session_key(obj)
-    token = session.get(session_key)
-    return LockableModel.check_lock_token(obj, token)
+    token = get_session_token(obj, session) or get_ancestor_session_token(obj, session)
+    # The expiration time carried by a signed token is not checked, the lock may have
+    # been renewed without updating the session (by a LockHolder for instance)
+    return LockableModel._check_and_get_lock_token(obj, token, allow_expired=True)[0]
@@ -5,3 +5,23 @@ lock_tokens_settings = getattr(settings, 'LOCK_TOKENS', {})
 TIMEOUT = lock_tokens_settings.get('TIMEOUT', 3600)
 DATEFORMAT = lock_tokens_settings.get('DATEFORMAT', "%Y-%m-%d %H:%M:%S %Z")
 API_CSRF_EXEMPT = lock_tokens_settings.get('API_CSRF_EXEMPT', False)
+API_BATCH_MAX_OPERATIONS = lock_tokens_settings.get('API_BATCH_MAX_OPERATIONS', 100)
+BACKEND = lock_tokens_settings.get('BACKEND', 'lock_tokens.backends.orm.ORMBackend')
+CACHE_ALIAS = lock_tokens_settings.get('CACHE_ALIAS', 'default')
+CACHE_KEY_PREFIX = lock_tokens_settings.get('CACHE_KEY_PREFIX', 'lock_tokens')
+CACHE_RECORD_TIMEOUT_MARGIN = lock_tokens_settings.get('CACHE_RECORD_TIMEOUT_MARGIN', 3600)
+OBJECT_EXISTENCE_CHECK = lock_tokens_settings.get('OBJECT_EXISTENCE_CHECK', 'exists')
+REAPER_ENABLED = lock_tokens_settings.get('REAPER_ENABLED', False)
+REAPER_BATCH_SIZE = lock_tokens_settings.get('REAPER_BATCH_SIZE', 500)
+REAPER_MIN_INTERVAL = lock_tokens_settings.get('REAPER_MIN_INTERVAL', 10)
+REAPER_MAX_INTERVAL = lock_tokens_settings.get('REAPER_MAX_INTERVAL', 600)
+STATS_CACHE_TIMEOUT = lock_tokens_settings.get('STATS_CACHE_TIMEOUT', 60)
+METRICS_ENABLED = lock_tokens_settings.get('METRICS_ENABLED', False)
+METRICS_SINK = lock_tokens_settings.get('METRICS_SINK', 'lock_tokens.metrics.MetricsRegistry')
+ESCALATION_THRESHOLD = lock_tokens_settings.get('ESCALATION_THRESHOLD', 100)
+SIGNED_TOKENS = lock_tokens_settings.get('SIGNED_TOKENS', False)
+STATE_CACHE_ENABLED = lock_tokens_settings.get('STATE_CACHE_ENABLED', False)
+STATE_CACHE_TIMEOUT = lock_tokens_settings.get('STATE_CACHE_TIMEOUT', 60)
+STATE_CACHE_NEGATIVE_TIMEOUT = lock_tokens_settings.get('STATE_CACHE_NEGATIVE_TIMEOUT', 5)
+STATE_CACHE_INVALIDATION_TIMEOUT = lock_tokens_settings.get('STATE_CACHE_INVALIDATION_TIMEOUT',
+                                                            10)
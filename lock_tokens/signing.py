@@ -0,0 +1,102 @@
+"""Signed tokens.
+
+When the SIGNED_TOKENS setting is set, the token given for a lock is not its bare token
+string: it also carries the content type and the id of the locked object, and the issue
+and expiration times of the lock, signed with the SECRET_KEY setting. The tokens that
+are forged, that are not the ones of a lock on the object or that have expired are
+rejected without any query. The other ones are still checked against the stored lock
+tokens, so that a released lock cannot be used anymore.
+"""
+import calendar
+from collections import namedtuple
+
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import base36_to_int, int_to_base36
+
+from lock_tokens import hierarchy
+from lock_tokens.exceptions import InvalidToken
+from lock_tokens.registry import registry
+from lock_tokens.settings import SIGNED_TOKENS
+
+
+# The fields of a signed token are separated by underscores, so that it matches the
+# token pattern of the API URLs
+SEPARATOR = '_'
+KEY_SALT = 'lock_tokens.signing'
+
+SignedToken = namedtuple('SignedToken', ['token_str', 'contenttype_id', 'object_id',
+                                         'issued_at', 'expires_at'])
+
+
+def _get_timestamp(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+def _get_signature(value):
+    return salted_hmac(KEY_SALT, value).hexdigest()
+
+
+def sign_token(lock_token):
+    """Returns the token to give for lock_token: its signed token if the SIGNED_TOKENS
+    setting is set, its token string otherwise."""
+    if not SIGNED_TOKENS:
+        return lock_token.token_str
+    value = SEPARATOR.join([
+        lock_token.token_str,
+        str(lock_token.locked_object_content_type_id),
+        str(lock_token.locked_object_id),
+        int_to_base36(_get_timestamp(lock_token.locked_at)),
+        int_to_base36(_get_timestamp(lock_token.expires_at)),
+    ])
+    return SEPARATOR.join([value, _get_signature(value)])
+
+
+def unsign_token(token):
+    """Returns the SignedToken of a signed token, or None if it is malformed or if its
+    signature is wrong."""
+    try:
+        value, signature = token.rsplit(SEPARATOR, 1)
+    except (AttributeError, ValueError):
+        return None
+    if not constant_time_compare(signature, _get_signature(value)):
+        return None
+    token_str, contenttype_id, object_id, issued_at, expires_at = value.split(SEPARATOR)
+    return SignedToken(token_str, int(contenttype_id), object_id,
+                       base36_to_int(issued_at), base36_to_int(expires_at))
+
+
+def get_token_str(token):
+    """Returns the token string of token, without checking it."""
+    if SIGNED_TOKENS:
+        signed_token = unsign_token(token)
+        if signed_token is not None:
+            return signed_token.token_str
+    return token
+
+
+def _get_ancestor_contenttype_ids(contenttype):
+    model = contenttype.model_class()
+    if model is None:
+        return []
+    return [registry.get_contenttype(field.related_model).id
+            for field in hierarchy.get_parent_fields(model)]
+
+
+def check_token(token, contenttype, object_id, allow_expired=False):
+    """Returns the token string of token, to be checked against the lock tokens of the
+    object. If the SIGNED_TOKENS setting is set, raises InvalidToken if token is not a
+    signed token of a lock on the object (or on one of its ancestors) or, unless
+    allow_expired is True, if the expiration time it carries has passed."""
+    if not SIGNED_TOKENS or token is None:
+        return token
+    signed_token = unsign_token(token)
+    if signed_token is None:
+        raise InvalidToken
+    if (signed_token.contenttype_id, signed_token.object_id) != (contenttype.id,
+                                                                 str(object_id)):
+        if signed_token.contenttype_id not in _get_ancestor_contenttype_ids(contenttype):
+            raise InvalidToken
+    if not allow_expired and signed_token.expires_at < _get_timestamp(timezone.now()):
+        raise InvalidToken
+    return signed_token.token_str
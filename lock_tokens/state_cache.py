@@ -0,0 +1,135 @@
+"""Read-through cache of the lock tokens of the objects.
+
+When the STATE_CACHE_ENABLED setting is set, the lock token of an object looked up by
+``LockToken.objects.get_for_contenttype_and_id`` (and so by ``get_for_object``,
+``is_locked`` and ``check_lock_token``) or ``get_for_keys`` is kept in the cache given
+by the CACHE_ALIAS setting for STATE_CACHE_TIMEOUT seconds, and the absence of lock
+token for STATE_CACHE_NEGATIVE_TIMEOUT seconds. Every lock, renewal, release and
+deletion of lock tokens made by lock_tokens replaces the cache entries of the objects
+involved by an *invalidated* marker for STATE_CACHE_INVALIDATION_TIMEOUT seconds, again
+when the transaction commits. The lookups only fill missing entries (with ``add``), so
+that a lookup that raced with a change cannot cache the state it read before the change.
+Otherwise, the functions of this module return right away.
+"""
+import threading
+
+from django.core.cache import caches
+from django.db import router, transaction
+
+from lock_tokens import metrics
+from lock_tokens.settings import (
+    CACHE_ALIAS,
+    CACHE_KEY_PREFIX,
+    STATE_CACHE_ENABLED,
+    STATE_CACHE_INVALIDATION_TIMEOUT,
+    STATE_CACHE_NEGATIVE_TIMEOUT,
+    STATE_CACHE_TIMEOUT,
+)
+
+
+# Cached for the objects that have no lock token, as the cache cannot tell a cached None
+# from a missing entry
+NO_LOCK_TOKEN = 0
+# Cached for the objects whose lock token has just changed, until the change is committed
+# and the lookups made before it are over
+INVALIDATED = -1
+
+_counters_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def is_enabled():
+    return STATE_CACHE_ENABLED
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_key(contenttype, object_id):
+    # contenttype may also be a content type id
+    return "%s:state:%s:%s" % (CACHE_KEY_PREFIX, getattr(contenttype, 'id', contenttype),
+                               object_id)
+
+
+def _count(contenttype, hit):
+    with _counters_lock:
+        _counters['hits' if hit else 'misses'] += 1
+    metrics.inc('lock_tokens_state_cache_lookups_total', contenttype,
+                result='hit' if hit else 'miss')
+
+
+def get_counters():
+    """Returns the numbers of cache hits and misses of the process, as a
+    {'hits': n, 'misses': n} dict."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset_counters():
+    with _counters_lock:
+        _counters['hits'] = _counters['misses'] = 0
+
+
+def _is_hit(value):
+    return value is not None and not (isinstance(value, int) and value == INVALIDATED)
+
+
+def get(contenttype, object_id):
+    """Returns a (hit, lock_token) tuple, lock_token being the cached lock token of the
+    object, or None if it is cached that the object has no lock token."""
+    value = get_cache().get(get_key(contenttype, object_id))
+    hit = _is_hit(value)
+    _count(contenttype, hit)
+    return hit, (value or None) if hit else None
+
+
+def get_many(keys):
+    """Returns a {(contenttype, object_id): lock_token} dict for the given pairs whose
+    lock token (or None, for no lock token) is cached, with a single cache lookup."""
+    keys_by_cache_key = dict((get_key(*key), key) for key in keys)
+    values = dict((cache_key, value) for cache_key, value in get_cache().get_many(
+        list(keys_by_cache_key.keys())).items() if _is_hit(value))
+    for cache_key, key in keys_by_cache_key.items():
+        _count(key[0], cache_key in values)
+    return dict((keys_by_cache_key[cache_key], value or None)
+                for cache_key, value in values.items())
+
+
+def set_many(lock_tokens):
+    """Caches the lock tokens of a {(contenttype, object_id): lock_token} dict, whose
+    values are None for the objects that have no lock token, unless their entries have
+    been invalidated in the meantime."""
+    if not is_enabled():
+        return
+    cache = get_cache()
+    for key, lock_token in lock_tokens.items():
+        if lock_token is None:
+            cache.add(get_key(*key), NO_LOCK_TOKEN, STATE_CACHE_NEGATIVE_TIMEOUT)
+        else:
+            cache.add(get_key(*key), lock_token, STATE_CACHE_TIMEOUT)
+
+
+def _mark_invalidated(cache_keys):
+    get_cache().set_many(dict((cache_key, INVALIDATED) for cache_key in cache_keys),
+                         STATE_CACHE_INVALIDATION_TIMEOUT)
+
+
+def invalidate_many(keys):
+    """Invalidates the cache entries of the given (contenttype, object_id) pairs, now
+    and when the current transaction commits."""
+    if not is_enabled():
+        return
+    from lock_tokens.models import LockToken
+    cache_keys = [get_key(*key) for key in keys]
+    if not cache_keys:
+        return
+    _mark_invalidated(cache_keys)
+    using = router.db_for_write(LockToken)
+    if transaction.get_connection(using).in_atomic_block:
+        # The lookups made before the commit may still read the previous state
+        transaction.on_commit(lambda: _mark_invalidated(cache_keys), using=using)
+
+
+def invalidate(contenttype, object_id):
+    invalidate_many([(contenttype, object_id)])
@@ -13,6 +13,9 @@ lock_tokens.Token = function (app_label, model, object_id, token, expiration_dat
 lock_tokens.Token.prototype.get_token = function () {
   return this.token_;
 };
+lock_tokens.Token.prototype.set_token = function (token) {
+  this.token_ = token;
+};
 lock_tokens.Token.prototype.get_expiration_date = function () {
   return this.expiration_date_;
 };
@@ -22,13 +25,19 @@ lock_tokens.Token.prototype.set_expiration_date = function (expiration_date_str)
 
 
 /* API Client class*/
-lock_tokens.APIClient = function (base_api_url, csrf_token, csrf_header_name) {
+lock_tokens.APIClient = function (base_api_url, csrf_token, csrf_header_name, batch, batch_max_operations) {
   this.base_api_url = base_api_url;
   this.csrf_token = csrf_token;
   this.csrf_header_name = csrf_header_name;
   this.async_call_ = true;
+  // Operations issued during the same tick are sent in a single batch request
+  this.batch_ = batch !== false;
+  // The server rejects the batch requests with more operations (API_BATCH_MAX_OPERATIONS)
+  this.batch_max_operations_ = batch_max_operations || 100;
+  this.pending_operations_ = [];
+  this.grouping_ = false;
 };
-lock_tokens.APIClient.prototype.api_call_ = function (uri, http_method, callback) {
+lock_tokens.APIClient.prototype.api_call_ = function (uri, http_method, callback, body) {
   var r = new XMLHttpRequest();
   r.open(http_method, this.base_api_url + uri, this.async_call_);
   r.onreadystatechange = function () {
@@ -39,12 +48,91 @@ lock_tokens.APIClient.prototype.api_call_ = function (uri, http_method, callback
   if (!is_safe && this.csrf_token) {
     r.setRequestHeader(this.csrf_header_name, this.csrf_token);
   }
-  r.send();
+  if (body === undefined) {
+    r.send();
+  } else {
+    r.setRequestHeader('Content-Type', 'application/json');
+    r.send(JSON.stringify(body));
+  }
+};
+lock_tokens.APIClient.METHODS_ = {lock: 'POST', get: 'GET', renew: 'PATCH', release: 'DELETE'};
+lock_tokens.APIClient.prototype.single_operation_ = function (operation, callback) {
+  var uri_parts = [operation.app_label, operation.model, operation.object_id];
+  if (operation.action !== 'lock') {
+    uri_parts.push(operation.token);
+  }
+  this.api_call_(uri_parts.join('/') + '/', lock_tokens.APIClient.METHODS_[operation.action], function (http_status, text) {
+    var data = null;
+    try {
+      data = JSON.parse(text);
+    } catch (ignore) {}
+    callback(http_status, data);
+  });
+};
+lock_tokens.APIClient.prototype.batch = function (operations, callback) {
+  this.api_call_('batch/', 'POST', function (http_status, text) {
+    if (http_status === 200) {
+      callback(JSON.parse(text).results);
+    } else {
+      console.error('Could not run batch operations. HTTP status: ' + http_status);
+      callback(null);
+    }
+  }, {operations: operations});
+};
+lock_tokens.APIClient.prototype.flush_chunk_ = function (pending) {
+  if (pending.length === 1) {
+    this.single_operation_(pending[0].operation, pending[0].callback);
+    return;
+  }
+  var operations = pending.map(function (p) { return p.operation; });
+  this.batch(operations, function (results) {
+    pending.forEach(function (p, i) {
+      if (results) {
+        p.callback(results[i].status, results[i]);
+      } else {
+        p.callback(0, null);
+      }
+    });
+  });
+};
+lock_tokens.APIClient.prototype.flush_operations_ = function () {
+  var pending = this.pending_operations_;
+  var i;
+  this.pending_operations_ = [];
+  for (i = 0; i < pending.length; i += this.batch_max_operations_) {
+    this.flush_chunk_(pending.slice(i, i + this.batch_max_operations_));
+  }
+};
+// Sends the operations issued by issue_operations in batch requests right after it
+// returns, which also works for synchronous calls (e.g. when the page is unloading)
+lock_tokens.APIClient.prototype.group_operations_ = function (issue_operations) {
+  this.grouping_ = true;
+  try {
+    issue_operations();
+  } finally {
+    this.grouping_ = false;
+  }
+  this.flush_operations_();
+};
+lock_tokens.APIClient.prototype.operation_ = function (action, app_label, model, object_id, token_str, callback) {
+  var operation = {action: action, app_label: app_label, model: model, object_id: object_id};
+  if (token_str) {
+    operation.token = token_str;
+  }
+  // Synchronous calls (e.g. when the page is unloading) cannot wait for the next tick
+  if (!this.batch_ || (!this.async_call_ && !this.grouping_)) {
+    this.single_operation_(operation, callback);
+    return;
+  }
+  var client = this;
+  client.pending_operations_.push({operation: operation, callback: callback});
+  if (!client.grouping_ && client.pending_operations_.length === 1) {
+    setTimeout(function () { client.flush_operations_(); }, 0);
+  }
 };
 lock_tokens.APIClient.prototype.lock_resource = function (app_label, model, object_id, callback) {
-  this.api_call_([app_label, model, object_id].join('/') + '/', 'POST', function (http_status, text) {
+  this.operation_('lock', app_label, model, object_id, null, function (http_status, api_response) {
     if (http_status === 201) {
-      var api_response = JSON.parse(text);
       callback(api_response);
     } else {
       console.error('Could not lock resource. HTTP status: ' + http_status);
@@ -53,9 +141,8 @@ lock_tokens.APIClient.prototype.lock_resource = function (app_label, model, obje
   });
 };
 lock_tokens.APIClient.prototype.get_existing_lock_token = function (app_label, model, object_id, token_str, callback) {
-  this.api_call_([app_label, model, object_id, token_str].join('/') + '/', 'GET', function (http_status, text) {
+  this.operation_('get', app_label, model, object_id, token_str, function (http_status, api_response) {
     if (http_status === 200) {
-      var api_response = JSON.parse(text);
       callback(api_response);
     } else {
       console.error('Could not get lock token. HTTP status: ' + http_status);
@@ -64,9 +151,8 @@ lock_tokens.APIClient.prototype.get_existing_lock_token = function (app_label, m
   });
 };
 lock_tokens.APIClient.prototype.renew_lock_token = function (app_label, model, object_id, token_str, callback) {
-  this.api_call_([app_label, model, object_id, token_str].join('/') + '/', 'PATCH', function (http_status, text) {
+  this.operation_('renew', app_label, model, object_id, token_str, function (http_status, api_response) {
     if (http_status === 200) {
-      var api_response = JSON.parse(text);
       callback(api_response);
     } else {
       console.error('Could not renew lock. HTTP status: ' + http_status);
@@ -75,7 +161,7 @@ lock_tokens.APIClient.prototype.renew_lock_token = function (app_label, model, o
   });
 };
 lock_tokens.APIClient.prototype.remove_lock_token = function (app_label, model, object_id, token_str, callback) {
-  this.api_call_([app_label, model, object_id, token_str].join('/') + '/', 'DELETE', function (http_status) {
+  this.operation_('release', app_label, model, object_id, token_str, function (http_status) {
     if (http_status === 204) {
       callback(true);
     } else {
@@ -92,9 +178,15 @@ lock_tokens.LockTokens = function (options) {
   var base_api_url = options.base_api_url || '/lock_tokens/';
   var csrf_token = options.csrf_token || null;
   var csrf_header_name = options.csrf_header_name || 'X-CSRFToken';
-  this.api_client_ = new lock_tokens.APIClient(base_api_url, csrf_token, csrf_header_name);
+  this.api_client_ = new lock_tokens.APIClient(base_api_url, csrf_token, csrf_header_name, options.batch,
+                                               options.batch_max_operations);
   this.registry_ = {};
   this.with_alerts_ = options.with_alerts || false;
+  // Held locks are renewed this long before they expire
+  this.renew_margin_ = 2000;
+  // Held locks that are due for renewal within this delay are renewed together
+  this.renew_window_ = options.renew_window || 5000;
+  this.renew_timeout_ = null;
 };
 lock_tokens.LockTokens.prototype.get_registry_key_ = function (app_label, model, object_id) {
   return [app_label, model, object_id].join('_');
@@ -152,7 +244,7 @@ lock_tokens.LockTokens.prototype.unlock = function(app_label, model, object_id,
     if (callback) { callback(false); }
     return;
   }
-  if (token.timeout) { clearTimeout(token.timeout); }
+  token.held = false;
   LT.api_client_.remove_lock_token(app_label, model, object_id, token.get_token(), function (success) {
     if (success) {
       LT.remove_token_from_registry_(app_label, model, object_id);
@@ -177,6 +269,8 @@ lock_tokens.LockTokens.prototype.renew_lock = function (app_label, model, object
   }
   LT.api_client_.renew_lock_token(app_label, model, object_id, token.get_token(), function (token_dict) {
     if (token_dict) {
+      // Signed tokens change when they are renewed
+      token.set_token(token_dict.token);
       token.set_expiration_date(token_dict.expires);
       if (callback) { callback(token); }
       return;
@@ -187,25 +281,67 @@ lock_tokens.LockTokens.prototype.renew_lock = function (app_label, model, object
     if (callback) { callback(false); }
   });
 };
+lock_tokens.LockTokens.prototype.get_renew_time_ = function (token) {
+  return token.get_expiration_date().getTime() - this.renew_margin_;
+};
+lock_tokens.LockTokens.prototype.schedule_renewals_ = function () {
+  var LT = this;
+  var key, token, renew_time, next_renew_time = null;
+  if (LT.renew_timeout_) {
+    clearTimeout(LT.renew_timeout_);
+    LT.renew_timeout_ = null;
+  }
+  for (key in LT.registry_) {
+    if (LT.registry_.hasOwnProperty(key)) {
+      token = LT.registry_[key];
+      if (token.held) {
+        renew_time = LT.get_renew_time_(token);
+        if (next_renew_time === null || renew_time < next_renew_time) {
+          next_renew_time = renew_time;
+        }
+      }
+    }
+  }
+  if (next_renew_time === null) { return; }
+  LT.renew_timeout_ = setTimeout(function () {
+    LT.renew_timeout_ = null;
+    LT.renew_held_locks_();
+  }, Math.max(next_renew_time - new Date().getTime(), 10));
+};
+lock_tokens.LockTokens.prototype.renew_held_locks_ = function () {
+  var LT = this;
+  var key, token;
+  var deadline = new Date().getTime() + LT.renew_window_;
+  var pending = 0;
+  var renewed = function (token) {
+    return function (t) {
+      if (!t) { token.held = false; }
+      pending--;
+      if (pending === 0) { LT.schedule_renewals_(); }
+    };
+  };
+  // All the renewals are issued during the same tick, so they are sent together
+  for (key in LT.registry_) {
+    if (LT.registry_.hasOwnProperty(key)) {
+      token = LT.registry_[key];
+      if (token.held && LT.get_renew_time_(token) <= deadline) {
+        pending++;
+        LT.renew_lock(token.app_label, token.model, token.object_id, renewed(token));
+      }
+    }
+  }
+  if (pending === 0) { LT.schedule_renewals_(); }
+};
 lock_tokens.LockTokens.prototype.hold_lock = function (app_label, model, object_id) {
   var LT = this;
   var token = LT.get_token_from_registry_(app_label, model, object_id);
-  var set_renew_lock_timeout = function () {
-    var delay = token.get_expiration_date().getTime() - new Date().getTime();
-    if (delay < 0) {
+  if (token) {
+    if (token.get_expiration_date().getTime() < new Date().getTime()) {
       console.error('The token seems to have expired already. If you just set it, check your time settings (timezone, expiration timeout, etc.)');
-      return null;
+      return;
     }
-    return setTimeout(function () {
-      LT.renew_lock(app_label, model, object_id, function (t) {
-        if (t) {
-          token.timeout = set_renew_lock_timeout();
-        }
-      });
-    }, Math.max(delay - 2000, 10));
-  };
-  if (token) {
-    token.timeout = set_renew_lock_timeout();
+    token.held = true;
+    LT.schedule_renewals_();
   } else {
     LT.lock(app_label, model, object_id, function (t) {
       if (t) { LT.hold_lock(app_label, model, object_id); }
@@ -224,12 +360,15 @@ lock_tokens.LockTokens.prototype.clear_all_locks = function (callback) {
     }
   };
   if (size === 0) { callback(); }
-  for (key in registry) {
-    if (registry.hasOwnProperty(key)) {
-      token = registry[key];
-      LT.unlock(token.app_label, token.model, token.object_id, cb);
+  // The releases are sent together even when the calls are synchronous
+  LT.api_client_.group_operations_(function () {
+    for (key in registry) {
+      if (registry.hasOwnProperty(key)) {
+        token = registry[key];
+        LT.unlock(token.app_label, token.model, token.object_id, cb);
+      }
     }
-  }
+  });
 };
 
 lock_tokens.emit_event = function (event_name) {
@@ -0,0 +1,88 @@
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db.models import Case, Count, IntegerField, Min, When
+from django.utils import timezone
+
+from lock_tokens.reaper import exclude_leader_token
+from lock_tokens.settings import (
+    CACHE_ALIAS,
+    CACHE_KEY_PREFIX,
+    DATEFORMAT,
+    STATS_CACHE_TIMEOUT,
+)
+
+
+def _get_age(now, created):
+    if created is None:
+        return None
+    return int((now - created).total_seconds())
+
+
+def compute_lock_stats():
+    """Computes the lock statistics with a single query grouped by content type. The
+    lock token of the reaper is left out."""
+    from lock_tokens.models import LockToken
+    now = timezone.now()
+    rows = exclude_leader_token(LockToken.objects.order_by()).values(
+        'locked_object_content_type',
+        'locked_object_content_type__app_label',
+        'locked_object_content_type__model',
+    ).annotate(
+        total=Count('id'),
+        active=Count(Case(When(expires_at__gte=now, then=1), output_field=IntegerField())),
+        # locked_at is moved forward when a lock is renewed
+        oldest_locked_at=Min('created'),
+    )
+    content_types = []
+    for row in rows:
+        contenttype = ContentType(id=row['locked_object_content_type'],
+                                  app_label=row['locked_object_content_type__app_label'],
+                                  model=row['locked_object_content_type__model'])
+        content_types.append({
+            'id': contenttype.id,
+            'app_label': contenttype.app_label,
+            'model': contenttype.model,
+            'name': contenttype.name,
+            'total': row['total'],
+            'active': row['active'],
+            'expired': row['total'] - row['active'],
+            'oldest_locked_at': row['oldest_locked_at'],
+            'oldest_lock_age': _get_age(now, row['oldest_locked_at']),
+        })
+    # The content types with the most active locks come first
+    content_types.sort(key=lambda c: (-c['active'], -c['total'], c['name']))
+    oldest_locked_at = min([c['oldest_locked_at'] for c in content_types] or [None])
+    return {
+        'computed_at': now,
+        'total': sum(c['total'] for c in content_types),
+        'active': sum(c['active'] for c in content_types),
+        'expired': sum(c['expired'] for c in content_types),
+        'oldest_locked_at': oldest_locked_at,
+        'oldest_lock_age': _get_age(now, oldest_locked_at),
+        'content_types': content_types,
+    }
+
+
+def get_lock_stats(refresh=False):
+    """Returns the lock statistics, which are cached for STATS_CACHE_TIMEOUT seconds."""
+    cache = caches[CACHE_ALIAS]
+    key = "%s:stats" % CACHE_KEY_PREFIX
+    stats = None if refresh else cache.get(key)
+    if stats is None:
+        stats = compute_lock_stats()
+        cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def serialize_lock_stats(stats):
+    """Returns a copy of the lock statistics that can be serialized as JSON."""
+    def serialize(data):
+        return dict(
+            (key, datetime.datetime.strftime(value, DATEFORMAT)
+             if isinstance(value, datetime.datetime) else value)
+            for key, value in data.items())
+    serialized = serialize(stats)
+    serialized['content_types'] = [serialize(c) for c in stats['content_types']]
+    return serialized
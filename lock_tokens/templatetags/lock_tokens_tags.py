@@ -7,7 +7,7 @@ except ImportError:
     from django.core.urlresolvers import reverse
 from django.template import Library
 
-from lock_tokens.settings import API_CSRF_EXEMPT
+from lock_tokens.settings import API_BATCH_MAX_OPERATIONS, API_CSRF_EXEMPT
 
 register = Library()
 
@@ -21,7 +21,8 @@ def lock_tokens_api_client():
     base_api_url = reverse('lock-tokens:list-view', args=[randomstring, randomstring, 1]).replace(
         '%(randstring)s/%(randstring)s/1/' % {'randstring': randomstring}, '')
 
-    context = {'csrf': True, 'base_api_url': base_api_url}
+    context = {'csrf': True, 'base_api_url': base_api_url,
+               'batch_max_operations': API_BATCH_MAX_OPERATIONS}
     if API_CSRF_EXEMPT:
         context['csrf'] = False
     else:
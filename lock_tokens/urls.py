@@ -1,11 +1,12 @@
 from django.conf.urls import url
 
-from lock_tokens.views import LockTokenDetailView, LockTokenListView
+from lock_tokens.views import LockTokenBatchView, LockTokenDetailView, LockTokenListView
 
 
 app_name = 'lock_tokens'
 
 urlpatterns = [
+    url(r'^batch/$', LockTokenBatchView.as_view(), name='batch-view'),
     url(r'^(?P<app_label>\w+)/(?P<model>\w+)/(?P<object_id>\d+)/$',
         LockTokenListView.as_view(), name='list-view'),
     url(r'^(?P<app_label>\w+)/(?P<model>\w+)/(?P<object_id>\d+)/(?P<token>\w+)/$',
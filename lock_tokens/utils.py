@@ -1,63 +1,167 @@
-import datetime
 import sys
-import threading
+import uuid
+import warnings
 
+from django.core.exceptions import ImproperlyConfigured
 from django.utils import timezone
 
-from lock_tokens.settings import TIMEOUT
+from lock_tokens import metrics
+from lock_tokens.exceptions import LockExpiredWarning, NoLockWarning
+from lock_tokens.settings import OBJECT_EXISTENCE_CHECK, TIMEOUT
 
 
 LESS_THAN_PYTHON3 = sys.version_info[0] < 3
 
-
-def get_oldest_valid_tokens_datetime():
-    return timezone.now() - datetime.timedelta(seconds=TIMEOUT)
-
-
-class _LoopThread(threading.Thread):
-
-    LOOP_TIME = max(TIMEOUT - 1, 1)
-
-    def __init__(self, lock_token):
-        self.lock_token = lock_token
-        self.stop = threading.Event()
-        super(_LoopThread, self).__init__(target=self.loop)
-
-    def loop(self):
-        def renew(myself):
-            try:
-                myself.lock_token.renew()
-            except:
-                myself.stop.set()
-
-        renew(self)
-        while not self.stop.wait(self.LOOP_TIME):
-            renew(self)
-
-    def terminate(self):
-        self.stop.set()
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    def sync_to_async(func, **kwargs):
+        raise ImproperlyConfigured("The asynchronous API of lock_tokens requires "
+                                   "Django 3.0 or later.")
+
+
+def check_ttl(ttl):
+    """Returns ttl, a lock lifetime in seconds, or None for the default lifetime.
+    Raises ValueError if it is not positive."""
+    if ttl is not None and ttl <= 0:
+        raise ValueError("The lock lifetime must be a positive number of seconds, not %r."
+                         % (ttl,))
+    return ttl
+
+
+def get_lock_timeout(model):
+    """Returns the default lifetime in seconds of the locks on the instances of model:
+    its lock_timeout attribute if set, the TIMEOUT setting otherwise."""
+    return getattr(model, 'lock_timeout', None) or TIMEOUT
+
+
+def parse_token(token_str):
+    """Returns the UUID whose hex form is token_str, or None if token_str is not a 32
+    characters hex string."""
+    try:
+        if len(token_str) != 32:
+            return None
+        return uuid.UUID(hex=token_str)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def get_contenttype_lock_timeout(contenttype_id):
+    from django.contrib.contenttypes.models import ContentType
+    return get_lock_timeout(ContentType.objects.get_for_id(contenttype_id).model_class())
+
+
+def check_lock_token(lock_token, token, now=None):
+    """Returns True if token is the token string of lock_token (which may be None when
+    there is no lock), warning if there is no lock or if the lock has expired."""
+    if lock_token is None:
+        warnings.warn("This object is not locked.", NoLockWarning)
+        return False
+    if token == lock_token.token_str:
+        if lock_token.has_expired(now):
+            warnings.warn("Lock has expired", LockExpiredWarning)
+        return True
+    return False
+
+
+def get_lock_statuses(lock_tokens_by_object):
+    now = timezone.now()
+    return dict(
+        (obj, lock_token is not None and not lock_token.has_expired(now))
+        for obj, lock_token in lock_tokens_by_object.items()
+    )
+
+
+def check_lock_tokens(lock_tokens_by_object, tokens_by_object):
+    now = timezone.now()
+    return dict(
+        (obj, check_lock_token(lock_token, tokens_by_object[obj], now))
+        for obj, lock_token in lock_tokens_by_object.items()
+    )
+
+
+EXISTENCE_CHECK_NONE = 'none'
+EXISTENCE_CHECK_EXISTS = 'exists'
+EXISTENCE_CHECK_FETCH = 'fetch'
+
+
+def get_object_to_lock(model, object_id, existence_check=None):
+    """Returns an instance of model with the given id, to be used for locking.
+
+    Depending on existence_check (which defaults to the OBJECT_EXISTENCE_CHECK setting),
+    the object is not looked up at all ('none'), its existence is checked without
+    fetching its row ('exists'), or it is fully fetched ('fetch'). In the first two
+    cases, the returned instance only has its id set. Raises model.DoesNotExist if the
+    object does not exist.
+    """
+    existence_check = existence_check or OBJECT_EXISTENCE_CHECK
+    if existence_check == EXISTENCE_CHECK_FETCH:
+        return model._default_manager.get(id=object_id)
+    if existence_check == EXISTENCE_CHECK_EXISTS:
+        if not model._default_manager.filter(id=object_id).exists():
+            raise model.DoesNotExist("%s matching query does not exist." %
+                                     model._meta.object_name)
+    elif existence_check != EXISTENCE_CHECK_NONE:
+        raise ValueError("Unknown object existence check: %s" % existence_check)
+    return model(id=object_id)
+
+
+def get_lock_token_to_hold(obj, token=None):
+    """Returns the lock token to renew in order to hold a lock on obj, which is locked
+    if no token is given. Raises AlreadyLockedError if obj cannot be locked because of
+    the lock of an ancestor or descendant."""
+    from lock_tokens import hierarchy
+    from lock_tokens.backends import get_backend
+    from lock_tokens.models import LockToken
+    from lock_tokens.registry import registry
+    from lock_tokens.signing import check_token
+
+    if token is not None:
+        contenttype = registry.get_contenttype(type(obj))
+        token_str = check_token(token, contenttype, obj.id, allow_expired=True)
+        # The token of a holder of a shared lock is renewed through the shared lock
+        shared_token = get_backend().get_shared_token(contenttype, obj.id, token_str)
+        if shared_token is not None:
+            return shared_token
+        # Otherwise, no need to fetch the lock token, it is renewed by its token string
+        return LockToken(locked_object_content_type=contenttype, locked_object_id=obj.id,
+                         token_str=token_str)
+    if hierarchy.is_hierarchical(type(obj)):
+        hierarchy.check_can_lock(type(obj), obj.id, obj)
+    return get_backend().get_or_create_for_object(obj)[0]
 
 
 class LockHolder(object):
-    def __init__(self, obj):
-        self._obj = obj
-        self._thread = None
+    """Holds a lock on an object, by renewing its lock token with the shared renewal
+    scheduler between calls to start and stop."""
 
-    def _init(self):
-        from lock_tokens.models import LockToken
-
-        lock_token, _ = LockToken.objects.get_or_create_for_object(self._obj)
-        self._thread = _LoopThread(lock_token)
+    def __init__(self, obj, token=None):
+        self._obj = obj
+        self._token = token
+        self._lock_token = None
+        self._entry = None
+        self._started = None
 
     def start(self):
-        if not self._thread:
-            self._init()
-        self._thread.start()
+        from lock_tokens.scheduler import get_scheduler
+
+        if not self._lock_token:
+            self._lock_token = get_lock_token_to_hold(self._obj, self._token)
+        if self._entry is None:
+            self._entry = get_scheduler().add(self._lock_token)
+            self._started = metrics.start_timer()
+            metrics.inc('lock_tokens_holds_total',
+                        self._lock_token.locked_object_content_type_id)
 
     def stop(self):
-        if self._thread:
-            self._thread.terminate()
-            self._thread.join()
+        from lock_tokens.scheduler import get_scheduler
+
+        if self._entry is not None:
+            get_scheduler().remove(self._entry)
+            self._entry = None
+            metrics.observe_since('lock_tokens_hold_seconds', self._started,
+                                  self._lock_token.locked_object_content_type_id,
+                                  buckets=metrics.HOLD_BUCKETS)
 
     def __del__(self):
         self.stop()
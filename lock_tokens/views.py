@@ -1,58 +1,179 @@
-from django.contrib.contenttypes.models import ContentType
+import functools
+import json
+
 from django.core.exceptions import PermissionDenied
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
-from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens import hierarchy, metrics, signing
+from lock_tokens.backends import get_backend
+from lock_tokens.exceptions import AlreadyLockedError, InvalidToken
 from lock_tokens.models import LockToken
-from lock_tokens.settings import API_CSRF_EXEMPT
+from lock_tokens.registry import registry
+from lock_tokens.settings import API_BATCH_MAX_OPERATIONS, API_CSRF_EXEMPT
+from lock_tokens.utils import get_object_to_lock
+from lock_tokens.waiters import notify_released
 
 
 def lock_tokens_csrf_exempt(view):
     return csrf_exempt(view) if API_CSRF_EXEMPT else view
 
 
+def parse_ttl(value):
+    """Returns the lock lifetime in seconds given in an API request, or None if there is
+    none. Raises ValueError if it is not a positive integer."""
+    if value is None:
+        return None
+    ttl = int(value)
+    if ttl <= 0:
+        raise ValueError("The lock lifetime must be positive.")
+    return ttl
+
+
+def parse_shared(value):
+    """Returns whether a shared lock is asked for in an API request. Raises ValueError
+    if the value is not a boolean, as a JSON value or a query string parameter."""
+    if value is None:
+        return False
+    if value in (True, 1, '1', 'true'):
+        return True
+    if value in (False, 0, '0', 'false'):
+        return False
+    raise ValueError("The shared parameter must be a boolean.")
+
+
+def track_request(handler):
+    """Records the number of requests handled by a view method by status code, and
+    their duration."""
+    @functools.wraps(handler)
+    def wrapped(self, request, *args, **kwargs):
+        contenttype = None
+        if metrics.is_enabled() and 'app_label' in kwargs and 'model' in kwargs:
+            model = registry.get_model(kwargs['app_label'], kwargs['model'])
+            if model is not None:
+                contenttype = registry.get_contenttype(model)
+        with metrics.track('lock_tokens_api_requests', contenttype,
+                           errors=((Http404, 404), (PermissionDenied, 403)),
+                           view=type(self).__name__, method=request.method) as tracker:
+            response = handler(self, request, *args, **kwargs)
+            tracker.result = response.status_code
+        return response
+    return wrapped
+
+
+def metrics_view(request):
+    """Renders the metrics kept by the in-process registry in the Prometheus text
+    format."""
+    sink = metrics.get_sink()
+    if not isinstance(sink, metrics.MetricsRegistry):
+        raise Http404("The lock metrics are not kept in the process.")
+    return HttpResponse(sink.render(), content_type='text/plain; version=0.0.4')
+
+
 class LockTokenBaseView(View):
 
+    # How the existence of the object to lock is checked, see get_object_to_lock.
+    # Defaults to the OBJECT_EXISTENCE_CHECK setting.
+    existence_check = None
+
     @method_decorator(lock_tokens_csrf_exempt)
     def dispatch(self, *args, **kwargs):
         return super(LockTokenBaseView, self).dispatch(*args, **kwargs)
 
+    def get_model_or_404(self, app_label, model):
+        model_class = registry.get_model(app_label, model)
+        if model_class is None:
+            raise Http404("There is no lockable model named %s with app_label %s" % (
+                model, app_label))
+        return model_class
+
     def get_contenttype_or_404(self, app_label, model):
-        try:
-            return ContentType.objects.get(app_label=app_label, model=model)
-        except ContentType.DoesNotExist:
-            raise Http404("There is no model named %s with app_label %s" % (model,
-                                                                            app_label))
+        return registry.get_contenttype(self.get_model_or_404(app_label, model))
 
     def get_object_or_404(self, app_label, model, object_id):
-        contenttype = self.get_contenttype_or_404(app_label, model)
+        model_class = self.get_model_or_404(app_label, model)
         try:
-            return contenttype.get_object_for_this_type(id=object_id)
-        except contenttype.model_class().DoesNotExist:
+            return get_object_to_lock(model_class, object_id, self.existence_check)
+        except model_class.DoesNotExist:
             raise Http404("The object with id %s does not exist" % object_id)
 
-    def get_valid_lock_token_or_error(self, app_label, model, object_id, token, allow_expired=True):
+    def get_valid_lock_token_or_error(self, app_label, model, object_id, token, allow_expired=True,
+                                      allow_expired_token=True):
         contenttype = self.get_contenttype_or_404(app_label, model)
         try:
-            lock_token = LockToken.objects.get_for_contenttype_and_id(contenttype,
-                                                                      object_id,
-                                                                      allow_expired)
+            # Rejects the forged, mismatched and (unless allow_expired_token is True)
+            # expired signed tokens without any query
+            token = signing.check_token(token, contenttype, object_id, allow_expired_token)
+        except InvalidToken:
+            raise PermissionDenied("Wrong token.")
+        try:
+            lock_token = get_backend().get_for_contenttype_and_id(contenttype,
+                                                                  object_id,
+                                                                  allow_expired)
         except LockToken.DoesNotExist:
             raise Http404("No valid token for this resource.")
+        if lock_token.shared:
+            # The token may be the one of a holder of the shared lock
+            lock_token = get_backend().get_shared_token(contenttype, object_id,
+                                                        token) or lock_token
+            if not allow_expired and lock_token.has_expired():
+                raise Http404("No valid token for this resource.")
         if not token == lock_token.token_str:
             raise PermissionDenied("Wrong token.")
         return lock_token
 
+    def create_lock_token(self, app_label, model, object_id, ttl=None, shared=False):
+        obj = self.get_object_or_404(app_label, model, object_id)
+        if hierarchy.is_hierarchical(type(obj)):
+            hierarchy.check_can_lock(type(obj), obj.id, obj)
+        if shared:
+            return get_backend().create_shared_for_object(obj, ttl)
+        return get_backend().create_for_object(obj, ttl)
+
+    def renew_lock_token(self, app_label, model, object_id, token, ttl=None):
+        contenttype = self.get_contenttype_or_404(app_label, model)
+        try:
+            token_str = signing.check_token(token, contenttype, object_id, allow_expired=True)
+            return get_backend().renew_token(contenttype, object_id, token_str, ttl)
+        except InvalidToken:
+            # Raises the appropriate HTTP error
+            lock_token = self.get_valid_lock_token_or_error(app_label, model,
+                                                            object_id, token)
+            lock_token.renew(ttl)
+            return lock_token
+
+    def release_lock_token(self, app_label, model, object_id, token):
+        contenttype = self.get_contenttype_or_404(app_label, model)
+        try:
+            token_str = signing.check_token(token, contenttype, object_id, allow_expired=True)
+            released = get_backend().release_token(contenttype, object_id, token_str)
+        except InvalidToken:
+            released = False
+        if not released:
+            # Raises the appropriate HTTP error
+            lock_token = self.get_valid_lock_token_or_error(app_label, model,
+                                                            object_id, token)
+            lock_token.release()
+        notify_released(contenttype.id, object_id)
+
 
 class LockTokenListView(LockTokenBaseView):
 
+    @track_request
     def post(self, request, app_label, model, object_id):
-        obj = self.get_object_or_404(app_label, model, object_id)
         try:
-            lock_token = LockToken.objects.create(locked_object=obj)
+            ttl = parse_ttl(request.GET.get('ttl'))
+        except ValueError:
+            return JsonResponse({}, status=400, reason="Invalid ttl")
+        try:
+            shared = parse_shared(request.GET.get('shared'))
+        except ValueError:
+            return JsonResponse({}, status=400, reason="Invalid shared parameter")
+        try:
+            lock_token = self.create_lock_token(app_label, model, object_id, ttl,
+                                                shared=shared)
         except AlreadyLockedError:
             return JsonResponse({}, status=409, reason="This resource is "
                                 "already locked")
@@ -61,19 +182,84 @@ class LockTokenListView(LockTokenBaseView):
 
 class LockTokenDetailView(LockTokenBaseView):
 
+    @track_request
     def get(self, request, app_label, model, object_id, token):
         lock_token = self.get_valid_lock_token_or_error(app_label, model, object_id,
-                                                        token)
+                                                        token, allow_expired_token=False)
         return JsonResponse(lock_token.serialize())
 
+    @track_request
     def patch(self, request, app_label, model, object_id, token):
-        lock_token = self.get_valid_lock_token_or_error(app_label, model, object_id,
-                                                        token)
-        lock_token.renew()
+        try:
+            ttl = parse_ttl(request.GET.get('ttl'))
+        except ValueError:
+            return JsonResponse({}, status=400, reason="Invalid ttl")
+        lock_token = self.renew_lock_token(app_label, model, object_id, token, ttl)
         return JsonResponse(lock_token.serialize())
 
+    @track_request
     def delete(self, request, app_label, model, object_id, token):
-        lock_token = self.get_valid_lock_token_or_error(app_label, model, object_id,
-                                                        token)
-        lock_token.delete()
+        self.release_lock_token(app_label, model, object_id, token)
         return JsonResponse({}, status=204)
+
+
+class LockTokenBatchView(LockTokenBaseView):
+    """Handles several lock operations in a single request.
+
+    The request body is a JSON object with an "operations" list. Each operation is an
+    object with an "action" ("lock", "get", "renew" or "release"), "app_label",
+    "model", "object_id" and, except for "lock", "token" keys. "lock" and "renew"
+    operations may also have a "ttl" key, the lifetime of the lock in seconds, and
+    "lock" operations a "shared" key, to take a shared lock instead of an exclusive
+    one. The response contains a "results" list with, for each operation, the HTTP
+    status it would have had on its own and the same data as the corresponding
+    single-operation endpoint.
+    """
+
+    def perform_operation(self, operation):
+        try:
+            action = operation['action']
+            keys = ['app_label', 'model', 'object_id']
+            if action != 'lock':
+                keys.append('token')
+            args = [str(operation[key]) for key in keys]
+            ttl = parse_ttl(operation.get('ttl'))
+            shared = parse_shared(operation.get('shared'))
+        except (KeyError, TypeError, ValueError):
+            return 400, {'error': "Invalid operation."}
+        if not args[2].isdigit() or action not in ('lock', 'get', 'renew', 'release'):
+            return 400, {'error': "Invalid operation."}
+
+        try:
+            if action == 'lock':
+                return 201, self.create_lock_token(*args, ttl=ttl,
+                                                   shared=shared).serialize()
+            if action == 'get':
+                return 200, self.get_valid_lock_token_or_error(
+                    *args, allow_expired_token=False).serialize()
+            if action == 'renew':
+                return 200, self.renew_lock_token(*args, ttl=ttl).serialize()
+            self.release_lock_token(*args)
+            return 204, {}
+        except AlreadyLockedError:
+            return 409, {'error': "This resource is already locked."}
+        except Http404 as e:
+            return 404, {'error': str(e)}
+        except PermissionDenied as e:
+            return 403, {'error': str(e)}
+
+    @track_request
+    def post(self, request):
+        try:
+            operations = json.loads(request.body.decode('utf-8'))['operations']
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({}, status=400, reason="Invalid request body")
+        if not isinstance(operations, list) or len(operations) > API_BATCH_MAX_OPERATIONS:
+            return JsonResponse({}, status=400, reason="Invalid operation list")
+
+        results = []
+        for operation in operations:
+            status, data = self.perform_operation(operation)
+            data['status'] = status
+            results.append(data)
+        return JsonResponse({'results': results})
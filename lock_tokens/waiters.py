@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+
+from lock_tokens.exceptions import AlreadyLockedError
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# Delays between two attempts to lock an object, before jitter
+INITIAL_DELAY = 0.05
+MAX_DELAY = 2.0
+
+
+class LockWaiters(object):
+    """Lets the threads waiting for an object to be unlocked sleep until it is unlocked
+    in the process (or until their timeout).
+
+    Each waited object has a release counter, that waiters read before trying to lock
+    the object, so that a release that happens between a failed attempt and the wait
+    is not missed.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._waiters = {}
+        self._releases = {}
+
+    def register(self, key):
+        """Starts watching the releases of the object, and returns the current release
+        count, to be given to wait."""
+        with self._condition:
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+            return self._releases.get(key, 0)
+
+    def unregister(self, key):
+        with self._condition:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                self._releases.pop(key, None)
+
+    def notify(self, key):
+        if key not in self._waiters:
+            # Nobody is waiting for this object
+            return
+        with self._condition:
+            if key in self._waiters:
+                self._releases[key] = self._releases.get(key, 0) + 1
+                self._condition.notify_all()
+
+    def wait(self, key, releases, timeout):
+        """Waits until the object is released or the timeout expires. Returns whether
+        the object has been released."""
+        deadline = _clock() + timeout
+        with self._condition:
+            while self._releases.get(key, 0) == releases:
+                remaining = deadline - _clock()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+
+waiters = LockWaiters()
+
+
+def notify_released(contenttype_id, object_id):
+    """Wakes up the threads of the process waiting to lock the object."""
+    waiters.notify((contenttype_id, int(object_id)))
+
+
+def wait_for_lock(acquire, contenttype_id, object_id, timeout):
+    """Calls acquire until it does not raise AlreadyLockedError, for at most timeout
+    seconds, and returns its result. Between two attempts, waits with a jittered
+    exponential backoff, or until the object is unlocked in the process."""
+    key = (contenttype_id, int(object_id))
+    deadline = _clock() + timeout
+    delay = INITIAL_DELAY
+    while True:
+        releases = waiters.register(key)
+        try:
+            try:
+                return acquire()
+            except AlreadyLockedError:
+                remaining = deadline - _clock()
+                if remaining <= 0:
+                    raise
+            waiters.wait(key, releases, min(delay * random.uniform(0.5, 1), remaining))
+        finally:
+            waiters.unregister(key)
+        delay = min(delay * 2, MAX_DELAY)
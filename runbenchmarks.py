@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+"""Runs the lock benchmarks, and writes their results as JSON.
+
+Example::
+
+    python runbenchmarks.py --sizes 1000,100000 --threads 1,4 --output results.json
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import django
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Runs the lock benchmarks.")
+    parser.add_argument('--sizes', type=parse_int_list, default=[1000, 10000, 100000],
+                        help="Comma-separated numbers of lock tokens in the lock table "
+                             "(default: 1000,10000,100000).")
+    parser.add_argument('--threads', type=parse_int_list, default=[1, 4],
+                        help="Comma-separated numbers of threads (default: 1,4).")
+    parser.add_argument('--operations', type=int, default=200,
+                        help="Number of operations per thread (default: 200).")
+    parser.add_argument('--expired-ratio', type=float, default=0.2,
+                        help="Ratio of expired lock tokens in the lock table "
+                             "(default: 0.2).")
+    parser.add_argument('--benchmarks',
+                        help="Comma-separated names of the benchmarks to run "
+                             "(default: all).")
+    parser.add_argument('--output', help="File to write the results to (default: "
+                                         "standard output).")
+    args = parser.parse_args(argv)
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    django.setup()
+    from django.db import connection
+    from benchmarks.lock_benchmarks import run_benchmarks
+
+    def progress(result):
+        print("%(benchmark)s size=%(size)s threads=%(threads)s: %(ops_per_sec).1f ops/s"
+              % result, file=sys.stderr)
+
+    results = run_benchmarks(
+        args.sizes, args.threads, args.operations, args.expired_ratio,
+        names=args.benchmarks.split(',') if args.benchmarks else None,
+        progress=progress)
+    output = {
+        'meta': {
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': connection.Database.sqlite_version,
+            'operations': args.operations,
+            'expired_ratio': args.expired_ratio,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,7 +1,8 @@
 from __future__ import absolute_import
 
 from django.contrib import admin
-from lock_tokens.admin import LockableModelAdmin
+from lock_tokens.admin import LockableModelAdmin, LockTokenAdmin
+from lock_tokens.models import LockToken
 
 from tests.models import RegularModel
 
@@ -10,3 +11,4 @@ class RegularModelAdmin(LockableModelAdmin):
   pass
 
 admin.site.register(RegularModel, RegularModelAdmin)
+admin.site.register(LockToken, LockTokenAdmin)
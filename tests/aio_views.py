@@ -0,0 +1,18 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+from django.http import HttpResponse
+
+from tests.models import TestModel
+
+from lock_tokens.aio import aholds_lock_on_object, alocks_object
+
+
+@alocks_object(TestModel, lambda request, object_id: object_id)
+async def test_async_view_1(request, object_id):
+    return HttpResponse('OK')
+
+
+@aholds_lock_on_object(TestModel, lambda request, object_id: object_id)
+async def test_async_view_2(request, object_id):
+    return HttpResponse('OK')
@@ -12,3 +12,26 @@ class TestModel(LockableModel):
 class RegularModel(models.Model):
     """Test model that does not inherit LockableModel"""
     name = models.CharField(max_length=32)
+
+
+class TestParentModel(LockableModel):
+    """Test model whose locks cover the TestChildModel instances"""
+    name = models.CharField(max_length=32)
+
+
+class TestChildModel(LockableModel):
+    """Test model with a lock parent"""
+    lock_parent = 'parent'
+
+    parent = models.ForeignKey(TestParentModel, on_delete=models.CASCADE,
+                               related_name='children')
+    name = models.CharField(max_length=32)
+
+
+class TestGrandChildModel(LockableModel):
+    """Test model with two levels of lock ancestors"""
+    lock_parent = 'parent'
+
+    parent = models.ForeignKey(TestChildModel, on_delete=models.CASCADE,
+                               related_name='children')
+    name = models.CharField(max_length=32)
@@ -1,13 +1,15 @@
 # -*- coding: utf-8
 from __future__ import absolute_import
 
+from django.contrib import admin
 from django.contrib.auth.models import User
-from django.test import Client, TransactionTestCase
+from django.test import Client, RequestFactory, TransactionTestCase
 try:
   from django.core.urlresolvers import reverse
 except ImportError:
   from django.urls import reverse
 
+from lock_tokens.admin import LockStatusFilter
 from lock_tokens.models import LockableModel
 from lock_tokens.sessions import check_for_session
 
@@ -55,3 +57,24 @@ class LockableModelAdminTestCase(TransactionTestCase):
         self.obj.refresh_from_db()
         self.assertEqual(self.obj.name, 'new name')
         self.assertFalse(LockableModel.is_locked(self.obj))
+
+    def test_admin_lock_status(self):
+        other_obj = RegularModel.objects.create(name='other test instance')
+        LockableModel.lock(self.obj)
+        model_admin = admin.site._registry[RegularModel]
+        request = RequestFactory().get('/')
+        request.user = self.user1
+
+        self.assertIn('lock_status', model_admin.get_list_display(request))
+        self.assertIn(LockStatusFilter, model_admin.get_list_filter(request))
+        with self.assertNumQueries(1):
+            statuses = dict((obj, model_admin.lock_status(obj))
+                            for obj in model_admin.get_queryset(request))
+        self.assertEqual(statuses, {self.obj: True, other_obj: False})
+
+        for value, expected in (('1', [self.obj]), ('0', [other_obj])):
+            lock_filter = LockStatusFilter(request, {'locked': value}, RegularModel,
+                                           model_admin)
+            self.assertEqual(
+                list(lock_filter.queryset(request, model_admin.get_queryset(request))),
+                expected)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import OperationalError
+from django.test import AsyncClient, TransactionTestCase
+from django.urls import reverse
+from django.utils.encoding import force_text
+
+from tests.models import RegularModel, TestModel
+
+from lock_tokens.aio import AsyncLockHolder, lock_object
+from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.models import LockableModel, LockToken
+
+
+class AsyncAPITestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.test_model_instance = TestModel.objects.create(name='test async')
+        self.regular_model_instance = RegularModel.objects.create(name='test async')
+
+    def test_locking_scenario(self):
+        obj = self.test_model_instance
+
+        @async_to_sync
+        async def scenario():
+            token = await obj.alock()
+            self.assertTrue(await obj.ais_locked())
+            self.assertTrue(await obj.acheck_lock_token(token['token']))
+            with self.assertRaises(AlreadyLockedError):
+                await obj.alock()
+            await obj.aunlock(token['token'])
+            self.assertFalse(await LockableModel.ais_locked(obj))
+
+            tokens = await LockableModel.alock_many([obj, self.regular_model_instance])
+            self.assertEqual(len(tokens), 2)
+            lock_token = await LockToken.objects.aget_for_object(obj)
+            self.assertEqual(lock_token.token_str, tokens[0]['token'])
+
+        scenario()
+
+    def test_context_manager(self):
+        obj = self.regular_model_instance
+
+        @async_to_sync
+        async def scenario():
+            async with lock_object(obj) as token:
+                self.assertTrue(await LockableModel.acheck_lock_token(obj,
+                                                                      token['token']))
+            self.assertFalse(await LockableModel.ais_locked(obj))
+
+        scenario()
+
+    def test_lock_holder(self):
+        obj = self.test_model_instance
+
+        @async_to_sync
+        async def scenario():
+            holder = AsyncLockHolder(obj, interval=0.1)
+            await holder.start()
+            lock_token = await LockToken.objects.aget_for_object(obj)
+            await asyncio.sleep(0.35)
+            await holder.stop()
+            renewed_lock_token = await LockToken.objects.aget_for_object(obj)
+            self.assertGreater(renewed_lock_token.locked_at, lock_token.locked_at)
+
+        scenario()
+
+    def test_lock_holder_errors(self):
+        obj = self.test_model_instance
+
+        @async_to_sync
+        async def scenario():
+            holder = AsyncLockHolder(obj, interval=0.05)
+            await holder.start()
+            with mock.patch('lock_tokens.backends.orm.ORMBackend.renew',
+                            side_effect=OperationalError) as renew:
+                with self.assertLogs('lock_tokens.aio', 'ERROR'):
+                    await asyncio.sleep(0.2)
+            # The holder stops renewing the lock, and stopping it does not raise
+            self.assertEqual(renew.call_count, 1)
+            await holder.stop()
+
+        scenario()
+
+    def test_views(self):
+        client = AsyncClient()
+        base_url = reverse('lock-tokens-async:list-view', args=(
+            'tests', 'testmodel', self.test_model_instance.id))
+
+        @async_to_sync
+        async def scenario():
+            r = await client.post(base_url)
+            self.assertEqual(r.status_code, 201)
+            token = json.loads(force_text(r.content))['token']
+            r = await client.post(base_url)
+            self.assertEqual(r.status_code, 409)
+            r = await client.patch(base_url + token + '/')
+            self.assertEqual(r.status_code, 200)
+            r = await client.get(base_url + 'wrongtoken/')
+            self.assertEqual(r.status_code, 403)
+            r = await client.delete(base_url + token + '/')
+            self.assertEqual(r.status_code, 204)
+
+            # Async view decorators
+            url = reverse('async-view-that-locks-object',
+                          args=(self.test_model_instance.id,))
+            r = await client.get(url)
+            self.assertEqual(r.status_code, 200)
+            self.assertTrue(await self.test_model_instance.ais_locked())
+            url = reverse('async-view-that-unlocks-object',
+                          args=(self.test_model_instance.id,))
+            r = await client.get(url)
+            self.assertEqual(r.status_code, 200)
+            self.assertFalse(await self.test_model_instance.ais_locked())
+
+        scenario()
@@ -3,6 +3,10 @@ from __future__ import absolute_import, unicode_literals
 
 import json
 import time
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 try:
     from django.urls import reverse
@@ -13,7 +17,12 @@ from django.test.client import Client
 from django.utils.encoding import force_text
 
 import six
-from tests.models import TestModel
+from tests.models import RegularModel, TestModel
+
+from lock_tokens.models import LockToken
+from lock_tokens.registry import registry
+from lock_tokens.utils import get_object_to_lock
+from lock_tokens.views import LockTokenListView
 
 
 class APITestCase(TransactionTestCase):
@@ -87,3 +96,104 @@ class APITestCase(TransactionTestCase):
         r = self.client.delete(base_url + token_dict['token'] + '/')
         self.assertEqual(r.status_code, 404, "API should return HTTP 403 when "
                          "trying to access an unexisting or outdated lock")
+
+    def test_only_lockable_models(self):
+        obj = RegularModel.objects.create(name='test api')
+        self.client = Client()
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'regularmodel',
+                                                          obj.id])
+        with mock.patch.dict(registry._models, clear=True):
+            r = self.client.post(base_url)
+        self.assertEqual(r.status_code, 404, "The API should return HTTP 404 for "
+                         "models that are not lockable")
+
+        # Models handled by a LockableModelAdmin are lockable
+        r = self.client.post(base_url)
+        self.assertEqual(r.status_code, 201)
+
+        r = self.client.post(reverse('lock-tokens:list-view', args=['auth', 'user', 1]))
+        self.assertEqual(r.status_code, 404)
+
+    def test_renew_query(self):
+        obj = TestModel.objects.create(name='test api')
+        self.client = Client()
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                          obj.id])
+        token_dict = json.loads(force_text(self.client.post(base_url).content))
+        # The content type is resolved without any query
+        with self.assertNumQueries(1):
+            r = self.client.patch(base_url + token_dict['token'] + '/')
+        self.assertEqual(r.status_code, 200)
+
+    def test_lock_ttl(self):
+        obj = TestModel.objects.create(name='test api')
+        self.client = Client()
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                          obj.id])
+        self.assertEqual(self.client.post(base_url + '?ttl=0').status_code, 400)
+        self.assertEqual(self.client.post(base_url + '?ttl=abc').status_code, 400)
+        token_dict = json.loads(force_text(self.client.post(base_url + '?ttl=30').content))
+        lock_token = LockToken.objects.get(token_str=token_dict['token'])
+        self.assertEqual(lock_token.get_ttl(), 30)
+        r = self.client.patch(base_url + token_dict['token'] + '/?ttl=60')
+        self.assertEqual(r.status_code, 200)
+        lock_token = LockToken.objects.get(token_str=token_dict['token'])
+        self.assertEqual(lock_token.get_ttl(), 60)
+
+    def test_object_existence_check(self):
+        self.client = Client()
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel', 1000])
+        r = self.client.post(base_url)
+        self.assertEqual(r.status_code, 404, "The API should return HTTP 404 when "
+                         "the object does not exist")
+
+        obj = TestModel.objects.create(name='test api')
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel', obj.id])
+        for existence_check in ('none', 'exists', 'fetch'):
+            with mock.patch.object(LockTokenListView, 'existence_check', existence_check):
+                with self.assertNumQueries(0 if existence_check == 'none' else 1):
+                    get_object_to_lock(TestModel, obj.id, existence_check)
+                r = self.client.post(base_url)
+                self.assertEqual(r.status_code, 201)
+                token_dict = json.loads(force_text(r.content))
+                self.client.delete(base_url + token_dict['token'] + '/')
+
+    def test_batch(self):
+        obj1 = TestModel.objects.create(name='test api 1')
+        obj2 = TestModel.objects.create(name='test api 2')
+        self.client = Client()
+        batch_url = reverse('lock-tokens:batch-view')
+
+        def batch(operations):
+            r = self.client.post(batch_url, json.dumps({'operations': operations}),
+                                 content_type='application/json')
+            self.assertEqual(r.status_code, 200)
+            return json.loads(force_text(r.content))['results']
+
+        def operation(action, obj, token=None):
+            op = {'action': action, 'app_label': 'tests', 'model': 'testmodel',
+                  'object_id': obj.id}
+            if token is not None:
+                op['token'] = token
+            return op
+
+        results = batch([operation('lock', obj1), operation('lock', obj2),
+                         operation('lock', obj1)])
+        self.assertEqual([result['status'] for result in results], [201, 201, 409])
+        token1, token2 = results[0]['token'], results[1]['token']
+
+        results = batch([operation('renew', obj1, token1), operation('get', obj2, token2),
+                         operation('renew', obj2, token1), operation('unknown', obj1)])
+        self.assertEqual([result['status'] for result in results], [200, 200, 403, 400])
+        self.assertEqual(results[0]['token'], token1)
+        self.assertIn('expires', results[0])
+
+        results = batch([operation('release', obj1, token1),
+                         operation('release', obj2, token2),
+                         operation('release', obj2, token2)])
+        self.assertEqual([result['status'] for result in results], [204, 204, 404])
+        self.assertFalse(obj1.is_locked())
+        self.assertFalse(obj2.is_locked())
+
+        r = self.client.post(batch_url, 'invalid', content_type='application/json')
+        self.assertEqual(r.status_code, 400)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+import json
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+from django.utils.encoding import force_text
+
+from tests.models import RegularModel, TestModel
+
+from lock_tokens.backends.cache import CacheBackend
+from lock_tokens.exceptions import (
+    AlreadyLockedError,
+    InvalidToken,
+    UnlockForbiddenError
+)
+from lock_tokens.models import LockableModel, LockToken
+from lock_tokens.settings import TIMEOUT
+
+
+class CacheBackendTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CacheBackend()
+        patcher = mock.patch('lock_tokens.backends._backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.test_model_instance = TestModel.objects.create(name='test cache backend')
+        self.regular_model_instance = RegularModel.objects.create(name='test cache backend')
+        ContentType.objects.get_for_models(TestModel, RegularModel)
+
+    def expire(self, obj):
+        contenttype_id = ContentType.objects.get_for_model(obj).id
+        record_key = self.backend._get_record_key(contenttype_id, obj.id)
+        record = cache.get(record_key)
+        record['locked_at'] -= datetime.timedelta(seconds=TIMEOUT + 1)
+        record['expires_at'] -= datetime.timedelta(seconds=TIMEOUT + 1)
+        cache.set(record_key, record, None)
+        cache.delete(self.backend._get_lease_key(contenttype_id, obj.id))
+
+    def test_locking_scenario(self):
+        with self.assertNumQueries(0):
+            token_dict = self.test_model_instance.lock()
+            self.assertTrue(self.test_model_instance.is_locked())
+            with self.assertRaises(AlreadyLockedError):
+                self.test_model_instance.lock()
+            with self.assertRaises(UnlockForbiddenError):
+                self.test_model_instance.unlock('wrong_token')
+            with self.assertRaises(InvalidToken):
+                self.test_model_instance.lock(token='wrong_token')
+            new_token_dict = self.test_model_instance.lock(token=token_dict['token'])
+            self.assertEqual(token_dict['token'], new_token_dict['token'])
+            self.test_model_instance.unlock(token_dict['token'])
+            self.assertFalse(self.test_model_instance.is_locked())
+        self.assertEqual(LockToken.objects.count(), 0, "The cache backend should not "
+                         "store lock tokens in the database")
+
+    def test_expired_lock(self):
+        token_dict = LockableModel.lock(self.regular_model_instance)
+        self.expire(self.regular_model_instance)
+        self.assertFalse(LockableModel.is_locked(self.regular_model_instance))
+        # The expired token is still valid as long as nobody else locks the object
+        self.assertTrue(LockableModel.check_lock_token(self.regular_model_instance,
+                                                       token_dict['token']))
+        LockableModel.lock(self.regular_model_instance, token_dict['token'])
+        self.assertTrue(LockableModel.is_locked(self.regular_model_instance))
+
+        self.expire(self.regular_model_instance)
+        new_token_dict = LockableModel.lock(self.regular_model_instance)
+        self.assertNotEqual(token_dict['token'], new_token_dict['token'])
+        self.assertFalse(LockableModel.check_lock_token(self.regular_model_instance,
+                                                        token_dict['token']))
+        with self.assertRaises(InvalidToken):
+            LockableModel.lock(self.regular_model_instance, token_dict['token'])
+
+    def test_record_timeout(self):
+        record_key = self.backend._get_record_key(
+            ContentType.objects.get_for_model(TestModel).id, self.test_model_instance.id)
+
+        def get_record_timeout():
+            timeouts = [call[0][2] for call in cache_set.call_args_list
+                        if call[0][0] == record_key]
+            cache_set.reset_mock()
+            return timeouts[-1]
+
+        with mock.patch.object(self.backend.cache, 'set',
+                               wraps=self.backend.cache.set) as cache_set:
+            with mock.patch('lock_tokens.backends.cache.CACHE_RECORD_TIMEOUT_MARGIN', 600):
+                token = self.test_model_instance.lock(ttl=60)['token']
+                self.assertIn(get_record_timeout(), (659, 660))
+                # Renewals push the expiration of the record back
+                self.test_model_instance.lock(token, ttl=120)
+                self.assertIn(get_record_timeout(), (719, 720))
+
+    def test_lock_many(self):
+        other_instance = TestModel.objects.create(name='other test cache backend')
+        token_dict = self.test_model_instance.lock()
+        with self.assertRaises(AlreadyLockedError) as cm:
+            LockableModel.lock_many([other_instance, self.test_model_instance,
+                                     self.regular_model_instance])
+        self.assertEqual(cm.exception.locked_objects, [self.test_model_instance])
+        self.assertEqual(LockableModel.is_locked_many([other_instance,
+                                                       self.regular_model_instance]),
+                         {other_instance: False, self.regular_model_instance: False})
+
+        self.test_model_instance.unlock(token_dict['token'])
+        token_dicts = LockableModel.lock_many([other_instance, self.test_model_instance])
+        self.assertEqual(LockableModel.check_lock_tokens_many({
+            other_instance: token_dicts[0]['token'],
+            self.test_model_instance: token_dicts[0]['token'],
+        }), {other_instance: True, self.test_model_instance: False})
+
+    def test_api(self):
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                          self.test_model_instance.id])
+        r = self.client.post(base_url)
+        self.assertEqual(r.status_code, 201)
+        token_dict = json.loads(force_text(r.content))
+        r = self.client.post(base_url)
+        self.assertEqual(r.status_code, 409)
+        r = self.client.patch(base_url + token_dict['token'] + '/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(force_text(r.content))['token'], token_dict['token'])
+        r = self.client.delete(base_url + token_dict['token'] + '/')
+        self.assertEqual(r.status_code, 204)
+        r = self.client.get(base_url + token_dict['token'] + '/')
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(LockToken.objects.count(), 0)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+import six
+
+from tests.models import TestModel
+
+from lock_tokens.models import LockToken
+
+
+class RemoveExpiredLocksTestCase(TransactionTestCase):
+
+    def setUp(self):
+        objs = [TestModel.objects.create(name='test %d' % i) for i in range(5)]
+        lock_tokens = [LockToken.objects.create(locked_object=obj) for obj in objs]
+        self.valid_token = lock_tokens[0]
+        LockToken.objects.exclude(id=self.valid_token.id).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=60))
+
+    def call_command(self, *args):
+        out = six.StringIO()
+        call_command('remove_expired_locks', *args, stdout=out)
+        return out.getvalue()
+
+    def test_remove_expired_locks(self):
+        out = self.call_command('--dry-run')
+        self.assertIn('4 expired tokens would be removed', out)
+        self.assertEqual(LockToken.objects.count(), 5)
+
+        out = self.call_command('--older-than', '120')
+        self.assertIn('Successfully removed 0 expired tokens', out)
+
+        out = self.call_command('--batch-size', '3')
+        self.assertIn('Batch 1: removed 3 tokens', out)
+        self.assertIn('Batch 2: removed 1 tokens', out)
+        self.assertIn('Successfully removed 4 expired tokens', out)
+        self.assertEqual(list(LockToken.objects.all()), [self.valid_token])
+
+    def test_options(self):
+        with self.assertRaises(CommandError):
+            self.call_command('--older-than', '-1')
+        out = self.call_command('--batch-size', '1', '--max-runtime', '0.0001')
+        self.assertIn('Maximum runtime reached', out)
+        self.assertEqual(LockToken.objects.count(), 4)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase
+
+from tests.models import TestChildModel, TestGrandChildModel, TestParentModel
+
+from lock_tokens import hierarchy
+from lock_tokens.backends import get_backend
+from lock_tokens.decorators import holds_lock_on_object
+from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.models import LockableModel, LockToken
+from lock_tokens.sessions import (
+    SESSION_KEY,
+    check_for_session,
+    lock_for_session,
+    unlock_for_session
+)
+from lock_tokens.utils import get_lock_token_to_hold
+
+
+class HierarchicalLockTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.parent = TestParentModel.objects.create(name='parent')
+        self.children = [TestChildModel.objects.create(parent=self.parent, name='child')
+                         for i in range(3)]
+        self.grandchild = TestGrandChildModel.objects.create(parent=self.children[0],
+                                                             name='grandchild')
+        # Fill the content type cache
+        ContentType.objects.get_for_models(TestParentModel, TestChildModel,
+                                           TestGrandChildModel)
+
+    def test_parent_lock_covers_children(self):
+        child = self.children[0]
+        token = self.parent.lock()['token']
+
+        # Checks on a child consult its own lock and its ancestors' in a single query
+        with self.assertNumQueries(1):
+            self.assertTrue(child.is_locked())
+        with self.assertNumQueries(1):
+            self.assertTrue(child.check_lock_token(token))
+        self.assertFalse(child.check_lock_token('wrong_token'))
+        # The ids of the further ancestors are fetched with one more query
+        with self.assertNumQueries(2):
+            self.assertTrue(self.grandchild.check_lock_token(token))
+        self.assertTrue(TestGrandChildModel.is_locked_by_id(self.grandchild.id))
+
+        with self.assertRaises(AlreadyLockedError):
+            child.lock()
+        with self.assertRaises(AlreadyLockedError):
+            self.grandchild.lock()
+
+        # Locking a child with the token of its parent renews the parent lock
+        self.assertEqual(child.lock(token)['token'], token)
+        self.assertEqual(LockToken.objects.count(), 1)
+
+        self.parent.unlock(token)
+        self.assertFalse(child.is_locked())
+        self.assertFalse(child.check_lock_token(token))
+
+    def test_locked_descendants(self):
+        self.grandchild.lock()
+        with self.assertRaises(AlreadyLockedError):
+            self.parent.lock()
+        with self.assertRaises(AlreadyLockedError):
+            self.children[0].lock()
+        self.children[1].lock()
+
+        with self.assertRaises(AlreadyLockedError) as cm:
+            LockableModel.lock_many([self.parent])
+        self.assertEqual(cm.exception.locked_objects, [self.parent])
+
+    def test_querysets(self):
+        token = self.parent.lock()['token']
+        with self.assertNumQueries(1):
+            self.assertEqual(len(TestGrandChildModel.objects.locked()), 1)
+        self.assertEqual(TestChildModel.objects.locked().count(), 3)
+        self.assertFalse(TestChildModel.objects.unlocked().exists())
+        self.assertFalse(TestGrandChildModel.objects.unlocked().exists())
+        with self.assertNumQueries(1):
+            grandchild = TestGrandChildModel.objects.with_lock_status().get()
+        self.assertTrue(grandchild.locked)
+        self.assertIsNone(grandchild.lock_expires_at)
+        self.assertEqual(TestChildModel.objects.claim(), [])
+        self.parent.unlock(token)
+
+        self.assertEqual(TestChildModel.objects.unlocked().count(), 3)
+        self.assertFalse(TestGrandChildModel.objects.with_lock_status().get().locked)
+
+        # Claim skips the objects with locked descendants
+        self.grandchild.lock()
+        self.assertEqual(TestParentModel.objects.claim(), [])
+        claimed = TestChildModel.objects.claim(n=3)
+        self.assertEqual(set(obj for obj, _ in claimed), set(self.children[1:]))
+
+    def test_blocked_objects(self):
+        self.grandchild.lock()
+        other_parent = TestParentModel.objects.create(name='other parent')
+        objs = self.children + [self.parent, other_parent]
+        # The number of queries does not depend on the number of objects
+        with self.assertNumQueries(7):
+            self.assertEqual(hierarchy.get_blocked_objects(objs),
+                             [self.children[0], self.parent])
+
+    def test_lock_many_escalation(self):
+        with mock.patch('lock_tokens.hierarchy.ESCALATION_THRESHOLD', 2):
+            tokens = LockableModel.lock_many(self.children)
+        self.assertEqual(len(set(token['token'] for token in tokens)), 1)
+        lock_token = LockToken.objects.get()
+        self.assertEqual(lock_token.locked_object_id, self.parent.id)
+        self.assertTrue(self.grandchild.check_lock_token(tokens[0]['token']))
+
+        # Below the threshold, each child is locked
+        self.parent.unlock(tokens[0]['token'])
+        tokens = LockableModel.lock_many(self.children)
+        self.assertEqual(LockToken.objects.count(), 3)
+
+    def test_session_escalation(self):
+        session = SessionStore()
+        child_contenttype_id = str(ContentType.objects.get_for_model(TestChildModel).id)
+        parent_contenttype_id = str(ContentType.objects.get_for_model(TestParentModel).id)
+        with mock.patch('lock_tokens.sessions.ESCALATION_THRESHOLD', 2):
+            for child in self.children[:2]:
+                lock_for_session(child, session)
+            self.assertEqual(len(session[SESSION_KEY][child_contenttype_id]), 2)
+
+            # The third child lock is escalated into a parent lock
+            lock_for_session(self.children[2], session)
+        self.assertEqual(list(session[SESSION_KEY].keys()), [parent_contenttype_id])
+        lock_token = LockToken.objects.get()
+        self.assertEqual(lock_token.locked_object_id, self.parent.id)
+        self.assertEqual(session[SESSION_KEY][parent_contenttype_id],
+                         {str(self.parent.id): lock_token.token_str})
+
+        for child in self.children:
+            self.assertTrue(check_for_session(child, session))
+        self.assertTrue(check_for_session(self.grandchild, session))
+        self.assertFalse(check_for_session(self.children[0], SessionStore()))
+
+        # Locking a covered child renews the parent lock
+        lock_for_session(self.children[0], session)
+        self.assertEqual(LockToken.objects.count(), 1)
+        unlock_for_session(self.children[0], session)
+        self.assertTrue(self.children[0].is_locked())
+
+    def test_escalation_blocked(self):
+        session = SessionStore()
+        other_child = TestChildModel.objects.create(parent=self.parent, name='other child')
+        other_child.lock()
+        with mock.patch('lock_tokens.sessions.ESCALATION_THRESHOLD', 2):
+            for child in self.children:
+                lock_for_session(child, session)
+        # The parent cannot be locked, the session keeps the child locks
+        self.assertEqual(LockToken.objects.count(), 4)
+        for child in self.children:
+            self.assertTrue(check_for_session(child, session))
+
+    def test_escalation_atomic(self):
+        lock_tokens = [get_backend().create_for_object(child) for child in self.children]
+        with mock.patch('lock_tokens.backends.orm.ORMBackend.release_many',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                hierarchy.escalate(self.parent, lock_tokens)
+        # The parent lock is rolled back with the release of the child locks
+        self.assertEqual(LockToken.objects.count(), 3)
+        self.assertFalse(self.parent.is_locked())
+
+    def test_hold_lock_covered_by_ancestor(self):
+        session = SessionStore()
+        lock_for_session(self.parent, session)
+        parent_lock_token = LockToken.objects.get()
+        request = RequestFactory().get('/')
+        request.session = session
+        child = self.children[0]
+        view = holds_lock_on_object(TestChildModel, lambda request: child.id)(
+            lambda request: HttpResponse())
+
+        # The lock on the parent is held, no lock is created on the child
+        self.assertEqual(view(request).status_code, 200)
+        self.assertEqual(list(LockToken.objects.all()), [parent_lock_token])
+        self.assertTrue(child.is_locked())
+
+        with self.assertRaises(AlreadyLockedError):
+            get_lock_token_to_hold(child)
+        self.assertEqual(LockToken.objects.count(), 1)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import json
+import os
+import subprocess
+import unittest
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+from django.test import TransactionTestCase
+from django.utils.encoding import force_text
+
+import lock_tokens
+
+JS_CLIENT_PATH = os.path.join(os.path.dirname(lock_tokens.__file__), 'static', 'lock_tokens',
+                              'js', 'lock_tokens.js')
+
+# Runs the client with a fake XMLHttpRequest that answers every operation of the batch
+# requests with a success status, and prints the number of operations of each request
+# and the number of callbacks called
+FAKE_REQUEST_SCRIPT = """
+var fs = require('fs');
+var vm = require('vm');
+var requests = [];
+var FakeRequest = function () {};
+FakeRequest.prototype.open = function (method) { this.method = method; };
+FakeRequest.prototype.setRequestHeader = function () {};
+FakeRequest.prototype.send = function (body) {
+  var operations = body ? JSON.parse(body).operations : null;
+  requests.push(operations ? operations.length : 1);
+  this.readyState = 4;
+  this.status = this.method === 'DELETE' ? 204 : 200;
+  this.responseText = JSON.stringify(operations ? {results: operations.map(function (o) {
+    return {status: o.action === 'release' ? 204 : 200, token: o.token,
+            expires: '2100-01-01T00:00:00Z'};
+  })} : {token: 'token', expires: '2100-01-01T00:00:00Z'});
+  this.onreadystatechange();
+};
+var context = {XMLHttpRequest: FakeRequest, setTimeout: setTimeout, console: console};
+vm.createContext(context);
+vm.runInContext(fs.readFileSync(process.argv[1], 'utf8'), context);
+var called = 0;
+"""
+
+RENEW_SCRIPT = FAKE_REQUEST_SCRIPT + """
+var client = new context.lock_tokens.APIClient('/lock_tokens/', null, null, true,
+                                               Number(process.argv[2]) || undefined);
+for (var i = 0; i < Number(process.argv[3]); i++) {
+  client.renew_lock_token('tests', 'testmodel', i, 'token' + i, function () { called++; });
+}
+setTimeout(function () {
+  console.log(JSON.stringify({requests: requests, called: called}));
+}, 10);
+"""
+
+# Releases all the locks with synchronous calls, as when the page is unloading, and
+# prints the requests sent before clear_all_locks returns
+CLEAR_SCRIPT = FAKE_REQUEST_SCRIPT + """
+var LT = new context.lock_tokens.LockTokens({
+  batch_max_operations: Number(process.argv[2]) || undefined});
+for (var i = 0; i < Number(process.argv[3]); i++) {
+  LT.add_token_to_registry_(new context.lock_tokens.Token(
+    'tests', 'testmodel', i, 'token' + i, '2100-01-01T00:00:00Z'), 'tests', 'testmodel', i);
+}
+LT.api_client_.async_call_ = false;
+LT.clear_all_locks(function () { called++; });
+console.log(JSON.stringify({requests: requests, called: called,
+                            left: Object.keys(LT.registry_).length}));
+"""
+
+
+@unittest.skipUnless(which('node'), "node is not installed")
+class JSClientTestCase(TransactionTestCase):
+
+    def run_script(self, script, batch_max_operations, n):
+        output = subprocess.check_output(['node', '-e', script, JS_CLIENT_PATH,
+                                          str(batch_max_operations), str(n)])
+        return json.loads(force_text(output))
+
+    def run_renewals(self, batch_max_operations, n):
+        return self.run_script(RENEW_SCRIPT, batch_max_operations, n)
+
+    def test_batch_chunks(self):
+        # Defaults to the default API_BATCH_MAX_OPERATIONS
+        self.assertEqual(self.run_renewals(0, 250), {'requests': [100, 100, 50],
+                                                     'called': 250})
+        self.assertEqual(self.run_renewals(10, 21), {'requests': [10, 10, 1],
+                                                     'called': 21})
+        self.assertEqual(self.run_renewals(0, 100), {'requests': [100], 'called': 100})
+
+    def test_synchronous_clear_all_locks(self):
+        # The releases are sent in batch requests before clear_all_locks returns
+        self.assertEqual(self.run_script(CLEAR_SCRIPT, 10, 25),
+                         {'requests': [10, 10, 5], 'called': 1, 'left': 0})
+        self.assertEqual(self.run_script(CLEAR_SCRIPT, 0, 1),
+                         {'requests': [1], 'called': 1, 'left': 0})
@@ -0,0 +1,104 @@
+# -*- coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import warnings
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+from django.test.client import Client
+from django.utils.encoding import force_text
+
+from tests.models import TestModel
+
+from lock_tokens import metrics
+from lock_tokens.exceptions import AlreadyLockedError, UnlockForbiddenError
+from lock_tokens.models import LockToken
+from lock_tokens.utils import LockHolder
+
+
+CONTENT_TYPE = 'tests.testmodel'
+
+
+class MetricsTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+        metrics.set_sink(self.registry)
+        self.obj = TestModel.objects.create(name='test metrics')
+
+    def tearDown(self):
+        metrics.set_sink(None)
+
+    def test_lock_metrics(self):
+        token = self.obj.lock()['token']
+        self.obj.lock(token)
+        with self.assertRaises(AlreadyLockedError):
+            self.obj.lock()
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_acquire_total', content_type=CONTENT_TYPE, result='created'), 1)
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_acquire_total', content_type=CONTENT_TYPE, result='renewed'), 1)
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_acquire_total', content_type=CONTENT_TYPE,
+            result='already_locked'), 1)
+        self.assertEqual(self.registry.get_histogram(
+            'lock_tokens_acquire_seconds', content_type=CONTENT_TYPE)[0], 3)
+
+        LockToken.objects.get_for_object(self.obj).renew()
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_renew_total', content_type=CONTENT_TYPE, result='ok'), 1)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.assertTrue(self.obj.check_lock_token(token))
+            with self.assertRaises(UnlockForbiddenError):
+                self.obj.unlock('wrong_token')
+            self.obj.unlock(token)
+            self.assertFalse(self.obj.check_lock_token(token))
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_checks_total', content_type=CONTENT_TYPE, result='valid'), 1)
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_warnings_total', content_type=CONTENT_TYPE, warning='no_lock'), 1)
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_release_total', content_type=CONTENT_TYPE, result='ok'), 1)
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_release_total', content_type=CONTENT_TYPE,
+            result='forbidden'), 1)
+
+    def test_lock_holder_metrics(self):
+        lock_holder = LockHolder(self.obj)
+        lock_holder.start()
+        lock_holder.stop()
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_holds_total', content_type=CONTENT_TYPE), 1)
+        self.assertEqual(self.registry.get_histogram(
+            'lock_tokens_hold_seconds', content_type=CONTENT_TYPE)[0], 1)
+
+    def test_api_metrics(self):
+        client = Client()
+        client.post(reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                           self.obj.id]))
+        client.get(reverse('lock-tokens:detail-view', args=['tests', 'testmodel',
+                                                            self.obj.id, 'wrong']))
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_api_requests_total', content_type=CONTENT_TYPE,
+            view='LockTokenListView', method='POST', result='201'), 1)
+        self.assertEqual(self.registry.get_counter(
+            'lock_tokens_api_requests_total', content_type=CONTENT_TYPE,
+            view='LockTokenDetailView', method='GET', result='403'), 1)
+
+        r = client.get(reverse('lock-tokens-metrics'))
+        self.assertEqual(r.status_code, 200)
+        content = force_text(r.content)
+        self.assertIn('# TYPE lock_tokens_api_requests_total counter', content)
+        self.assertIn('lock_tokens_api_requests_total{content_type="tests.testmodel",'
+                      'method="POST",result="201",view="LockTokenListView"} 1', content)
+        self.assertIn('lock_tokens_api_requests_seconds_bucket{content_type='
+                      '"tests.testmodel",method="POST",view="LockTokenListView",'
+                      'le="+Inf"} 1', content)
+
+        metrics.set_sink(None)
+        self.assertEqual(client.get(reverse('lock-tokens-metrics')).status_code, 404)
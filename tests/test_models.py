@@ -3,13 +3,25 @@ from __future__ import absolute_import
 
 import datetime
 import time
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import TransactionTestCase
+from django.utils import timezone
 
 from tests.models import RegularModel, TestModel
 
-from lock_tokens.exceptions import AlreadyLockedError, UnlockForbiddenError
-from lock_tokens.models import LockableModel, LockToken
+from lock_tokens.exceptions import (
+    AlreadyLockedError,
+    InvalidToken,
+    UnlockForbiddenError
+)
+from lock_tokens.managers import supports_upsert
+from lock_tokens.models import LockableModel, LockToken, get_random_token
 from lock_tokens.settings import TIMEOUT
 
 
@@ -97,6 +109,7 @@ class LockableModelTestCase(TransactionTestCase):
         lock_token = LockableModel._lock(self.test_model_instance)
         lock_token.locked_at = lock_token.locked_at - \
             datetime.timedelta(seconds=TIMEOUT + 1)
+        lock_token.expires_at -= datetime.timedelta(seconds=TIMEOUT + 1)
         lock_token.save()
         # Now we have an expired lock token attached to the test model instance
 
@@ -110,4 +123,301 @@ class LockableModelTestCase(TransactionTestCase):
                             "new token string should not be equal to the expired token one")
         # We check that the expired lock token has been correctly removed in db
         with self.assertRaises(LockToken.DoesNotExist):
-            LockToken.objects.get(id=lock_token.id)
+            LockToken.objects.get(token_str=lock_token.token_str)
+
+    def test_lock_many(self):
+        other_instance = TestModel.objects.create(name='other test LockableModel')
+        objs = [self.test_model_instance, other_instance, self.regular_model_instance]
+        ContentType.objects.get_for_models(TestModel, RegularModel)
+
+        # The number of queries depends on the number of content types, not objects
+        with self.assertNumQueries(9):
+            token_dicts = LockableModel.lock_many(objs)
+        self.assertEqual(len(token_dicts), 3, "There should be one token per object")
+        self.assertEqual(len(set(t['token'] for t in token_dicts)), 3, "Each object "
+                         "should have its own token")
+        for obj, token_dict in zip(objs, token_dicts):
+            self.assertTrue(LockableModel.is_locked(obj))
+            self.assertTrue(LockableModel.check_lock_token(obj, token_dict['token']))
+
+        # Unlock with the tokens
+        for obj, token_dict in zip(objs, token_dicts):
+            LockableModel.unlock(obj, token_dict['token'])
+        self.assertEqual(LockToken.objects.count(), 0)
+
+    def test_lock_many_all_or_nothing(self):
+        other_instance = TestModel.objects.create(name='other test LockableModel')
+        expired_token = LockableModel._lock(self.regular_model_instance)
+        expired_token.locked_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.expires_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.save()
+        token_dict = self.test_model_instance.lock()
+
+        with self.assertRaises(AlreadyLockedError) as cm:
+            TestModel.lock_many([other_instance, self.test_model_instance,
+                                 self.regular_model_instance])
+        self.assertEqual(cm.exception.locked_objects, [self.test_model_instance],
+                         "The error should list the objects that are already locked")
+        self.assertFalse(other_instance.is_locked(), "No lock should be left held "
+                         "when lock_many fails")
+        self.assertTrue(LockToken.objects.filter(id=expired_token.id).exists())
+
+        # Expired locks do not prevent locking
+        self.test_model_instance.unlock(token_dict['token'])
+        TestModel.lock_many([other_instance, self.test_model_instance,
+                             self.regular_model_instance])
+        self.assertFalse(LockToken.objects.filter(id=expired_token.id).exists())
+        self.assertTrue(LockableModel.is_locked(self.regular_model_instance))
+
+    def test_bulk_lock_status(self):
+        other_instance = TestModel.objects.create(name='other test LockableModel')
+        expired_instance = TestModel.objects.create(name='expired test LockableModel')
+        objs = [self.test_model_instance, other_instance, expired_instance,
+                self.regular_model_instance]
+        token_dict = self.test_model_instance.lock()
+        regular_token_dict = LockableModel.lock(self.regular_model_instance)
+        expired_token = LockableModel._lock(expired_instance)
+        expired_token.locked_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.expires_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.save()
+        ContentType.objects.get_for_models(TestModel, RegularModel)
+
+        # One query per content type
+        with self.assertNumQueries(2):
+            statuses = LockableModel.is_locked_many(objs)
+        self.assertEqual(statuses, {
+            self.test_model_instance: True,
+            other_instance: False,
+            expired_instance: False,
+            self.regular_model_instance: True,
+        })
+
+        with self.assertNumQueries(2):
+            checks = TestModel.check_lock_tokens_many({
+                self.test_model_instance: token_dict['token'],
+                other_instance: token_dict['token'],
+                expired_instance: expired_token.token_str,
+                self.regular_model_instance: 'wrong_token',
+            })
+        self.assertEqual(checks, {
+            self.test_model_instance: True,
+            other_instance: False,
+            expired_instance: True,
+            self.regular_model_instance: False,
+        })
+        self.assertTrue(LockToken.objects.check_lock_tokens_many({
+            self.regular_model_instance: regular_token_dict['token']
+        })[self.regular_model_instance])
+
+    def test_lock_status_queryset(self):
+        other_instance = TestModel.objects.create(name='other test LockableModel')
+        expired_instance = TestModel.objects.create(name='expired test LockableModel')
+        self.test_model_instance.lock()
+        expired_token = LockableModel._lock(expired_instance)
+        expired_token.locked_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.expires_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.save()
+        LockableModel.lock(self.regular_model_instance)
+        ContentType.objects.get_for_model(TestModel)
+
+        with self.assertNumQueries(1):
+            statuses = dict((obj, (obj.locked, obj.lock_expires_at))
+                            for obj in TestModel.objects.with_lock_status())
+        self.assertEqual(statuses, {
+            self.test_model_instance: (True, LockToken.objects.get_for_object(
+                self.test_model_instance).expires_at),
+            other_instance: (False, None),
+            expired_instance: (False, expired_token.expires_at),
+        })
+        with self.assertNumQueries(1):
+            self.assertEqual(list(TestModel.objects.locked()), [self.test_model_instance])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(TestModel.objects.unlocked().order_by('id')),
+                             [other_instance, expired_instance])
+        self.assertEqual(
+            list(TestModel.objects.with_lock_status().order_by('-locked', 'id')),
+            [self.test_model_instance, other_instance, expired_instance])
+
+    def test_claim(self):
+        other_instance = TestModel.objects.create(name='other test LockableModel')
+        expired_instance = TestModel.objects.create(name='expired test LockableModel')
+        self.test_model_instance.lock()
+        expired_token = LockableModel._lock(expired_instance)
+        expired_token.locked_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.expires_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.save()
+
+        claimed = TestModel.objects.claim(n=5, ttl=60)
+        self.assertEqual(set(obj for obj, token in claimed),
+                         set([other_instance, expired_instance]))
+        for obj, token in claimed:
+            self.assertTrue(obj.check_lock_token(token['token']))
+            self.assertEqual(LockToken.objects.get_for_object(obj).get_ttl(), 60)
+        self.assertEqual(TestModel.objects.claim(), [])
+
+        # The objects locked between the selection and the locking are skipped
+        for obj, token in claimed:
+            obj.unlock(token['token'])
+        queryset = TestModel.objects.filter(id__in=[self.test_model_instance.id,
+                                                    other_instance.id])
+        with mock.patch('lock_tokens.managers.filter_locked',
+                        side_effect=lambda queryset, locked: queryset):
+            claimed = TestModel.objects.claim(queryset, n=2)
+        self.assertEqual([obj for obj, token in claimed], [other_instance])
+
+    def test_single_statement_lock(self):
+        if not supports_upsert(connection):
+            self.skipTest("The database does not support INSERT ... ON CONFLICT")
+        ContentType.objects.get_for_model(TestModel)
+        with self.assertNumQueries(1):
+            lock_token, created = LockToken.objects.get_or_create_for_object(
+                self.test_model_instance)
+        self.assertTrue(created)
+        self.assertEqual(LockToken.objects.get(pk=lock_token.pk).token_str,
+                         lock_token.token_str)
+        self.assertFalse(lock_token.has_expired())
+
+        # A valid lock is not replaced
+        same_lock_token, created = LockToken.objects.get_or_create_for_object(
+            self.test_model_instance)
+        self.assertFalse(created)
+        self.assertEqual(same_lock_token.token_str, lock_token.token_str)
+
+        # An expired lock is replaced within the same statement
+        LockToken.objects.filter(pk=lock_token.pk).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        with self.assertNumQueries(1):
+            new_lock_token, created = LockToken.objects.get_or_create_for_object(
+                self.test_model_instance)
+        self.assertTrue(created)
+        self.assertNotEqual(new_lock_token.token_str, lock_token.token_str)
+        self.assertEqual(LockToken.objects.get().token_str, new_lock_token.token_str)
+
+    def test_token_keyed_renew_and_unlock(self):
+        token_dict = self.test_model_instance.lock()
+        ContentType.objects.get_for_model(TestModel)
+
+        # Renewing and unlocking are single conditional statements
+        time.sleep(1)
+        with self.assertNumQueries(1):
+            new_token_dict = self.test_model_instance.lock(token=token_dict['token'])
+        self.assertEqual(new_token_dict['token'], token_dict['token'])
+        self.assertNotEqual(new_token_dict['expires'], token_dict['expires'])
+        lock_token = LockToken.objects.get()
+        self.assertEqual(lock_token.serialize(), new_token_dict)
+
+        # The token may also be the one of a holder of a shared lock (each DELETE
+        # statement is run in a transaction, hence the BEGIN queries with SQLite)
+        with self.assertNumQueries(4):
+            with self.assertRaises(UnlockForbiddenError):
+                self.test_model_instance.unlock(get_random_token())
+        with self.assertNumQueries(2):
+            self.test_model_instance.unlock(token_dict['token'])
+        self.assertFalse(LockToken.objects.exists())
+
+        # A released token cannot be renewed anymore
+        with self.assertRaises(InvalidToken):
+            lock_token.renew()
+        self.assertFalse(LockToken.objects.exists())
+
+    def test_lock_ttl(self):
+        def get_lock_token(obj):
+            return LockToken.objects.get_for_object(obj)
+
+        def get_ttl(obj):
+            lock_token = get_lock_token(obj)
+            return (lock_token.expires_at - lock_token.locked_at).total_seconds()
+
+        # Default lifetime
+        token_dict = self.test_model_instance.lock()
+        self.assertEqual(get_ttl(self.test_model_instance), TIMEOUT)
+        self.assertEqual(get_lock_token(self.test_model_instance).serialize(), token_dict)
+
+        # Lifetime given on locking and renewing
+        token_dict = self.test_model_instance.lock(token_dict['token'], ttl=30)
+        self.assertEqual(get_ttl(self.test_model_instance), 30)
+        LockableModel.lock(self.regular_model_instance, ttl=20)
+        self.assertEqual(get_ttl(self.regular_model_instance), 20)
+
+        # Lifetime of the model
+        with mock.patch.object(TestModel, 'lock_timeout', 10):
+            self.test_model_instance.lock(token_dict['token'])
+            self.assertEqual(get_ttl(self.test_model_instance), 10)
+            other_instance = TestModel.objects.create(name='other test LockableModel')
+            TestModel.lock_many([other_instance])
+            self.assertEqual(get_ttl(other_instance), 10)
+            lock_token = LockToken.objects.create(
+                locked_object=TestModel.objects.create(name='created test LockableModel'))
+            self.assertEqual(lock_token.get_ttl(), 10)
+        self.test_model_instance.unlock(token_dict['token'])
+        lock_token = LockToken.objects.create(locked_object=self.test_model_instance,
+                                              ttl=5)
+        self.assertEqual(lock_token.get_ttl(), 5)
+
+        # Non-positive lifetimes are rejected rather than replaced by the default one
+        for ttl in (0, -1):
+            with self.assertRaises(ValueError):
+                LockableModel.lock(RegularModel.objects.create(name='other test'), ttl=ttl)
+            with self.assertRaises(ValueError):
+                self.test_model_instance.lock(lock_token.token_str, ttl=ttl)
+            with self.assertRaises(ValueError):
+                TestModel.lock_many([TestModel.objects.create(name='other test')], ttl=ttl)
+        self.assertEqual(get_lock_token(self.test_model_instance).get_ttl(), 5)
+
+        # Expiration is checked against expires_at
+        LockToken.objects.filter(locked_object_id=self.regular_model_instance.id).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertFalse(LockableModel.is_locked(self.regular_model_instance))
+
+    def test_token_uuid(self):
+        other_instance = TestModel.objects.create(name='other test LockableModel')
+        self.test_model_instance.lock()
+        LockableModel.lock_many([other_instance, self.regular_model_instance])
+        LockToken.objects.create(
+            locked_object=TestModel.objects.create(name='created test LockableModel'))
+        for lock_token in LockToken.objects.all():
+            self.assertEqual(lock_token.token_uuid.hex, lock_token.token_str)
+
+    def test_uuid_token_lookups(self):
+        token_dict = self.test_model_instance.lock()
+        new_token_dict = self.test_model_instance.lock(token_dict['token'], ttl=30)
+        self.assertEqual(new_token_dict['token'], token_dict['token'])
+        self.assertEqual(LockToken.objects.get().get_ttl(), 30)
+        self.assertTrue(self.test_model_instance.check_lock_token(token_dict['token']))
+        self.assertEqual(LockableModel.check_lock_tokens_many(
+            {self.test_model_instance: token_dict['token']}),
+            {self.test_model_instance: True})
+
+        # Tokens that are not hex UUIDs are rejected without any query
+        with self.assertNumQueries(0):
+            with self.assertRaises(UnlockForbiddenError):
+                self.test_model_instance.unlock('wrong_token')
+        with self.assertRaises(InvalidToken):
+            self.test_model_instance.lock(get_random_token())
+        self.test_model_instance.unlock(token_dict['token'])
+        self.assertFalse(LockToken.objects.exists())
+
+    def test_locking_by_id(self):
+        object_id = self.test_model_instance.id
+        token_dict = TestModel.lock_by_id(object_id)
+        self.assertTrue(self.test_model_instance.is_locked())
+        self.assertTrue(TestModel.is_locked_by_id(object_id))
+        self.assertTrue(TestModel.check_lock_token_by_id(object_id, token_dict['token']))
+        self.assertFalse(TestModel.check_lock_token_by_id(object_id, 'wrong_token'))
+        with self.assertRaises(AlreadyLockedError):
+            TestModel.lock_by_id(object_id)
+        with self.assertRaises(UnlockForbiddenError):
+            TestModel.unlock_by_id(object_id, 'wrong_token')
+        new_token_dict = TestModel.lock_by_id(object_id, token=token_dict['token'])
+        self.assertEqual(new_token_dict['token'], token_dict['token'])
+        TestModel.unlock_by_id(object_id, token_dict['token'])
+        self.assertFalse(TestModel.is_locked_by_id(object_id))
+
+        # On other models, the model must be given
+        object_id = self.regular_model_instance.id
+        with self.assertRaises(TypeError):
+            LockableModel.lock_by_id(object_id)
+        token_dict = LockableModel.lock_by_id(object_id, model=RegularModel)
+        self.assertTrue(LockableModel.is_locked(self.regular_model_instance))
+        LockableModel.unlock_by_id(object_id, token_dict['token'], model=RegularModel)
+        self.assertFalse(LockableModel.is_locked_by_id(object_id, model=RegularModel))
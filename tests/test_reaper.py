@@ -0,0 +1,77 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.apps import apps
+from django.core.signals import request_started
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from tests.models import TestModel
+
+from lock_tokens.models import LockToken
+from lock_tokens.reaper import Reaper
+from lock_tokens.stats import compute_lock_stats
+
+
+class ReaperTestCase(TransactionTestCase):
+
+    @mock.patch('lock_tokens.settings.REAPER_ENABLED', True)
+    @mock.patch('lock_tokens.reaper.Reaper.ensure_started')
+    def test_started_on_request(self, ensure_started):
+        self.addCleanup(request_started.disconnect, dispatch_uid='lock_tokens_start_reaper')
+        apps.get_app_config('lock_tokens').ready()
+        self.assertFalse(ensure_started.called)
+        request_started.send(sender=None)
+        self.assertTrue(ensure_started.called)
+
+    def create_expired_tokens(self, n):
+        objs = [TestModel.objects.create(name='test %d' % i) for i in range(n)]
+        for obj in objs:
+            LockToken.objects.create(locked_object=obj)
+        LockToken.objects.filter(locked_object_id__in=[obj.id for obj in objs]).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=60))
+
+    def test_leader_election(self):
+        reaper = Reaper(batch_size=10, min_interval=1, max_interval=8)
+        other_reaper = Reaper(batch_size=10, min_interval=1, max_interval=8)
+        self.create_expired_tokens(3)
+
+        self.assertEqual(reaper.run_once(), 3)
+        self.assertIsNone(other_reaper.run_once())
+        self.assertFalse(other_reaper.stats()['is_leader'])
+        self.assertEqual(other_reaper.interval, 8)
+
+        # The leader keeps its lock
+        self.assertEqual(reaper.run_once(), 0)
+        stats = reaper.stats()
+        self.assertTrue(stats['is_leader'])
+        self.assertEqual(stats['total_reclaimed'], 3)
+        self.assertEqual(stats['last_reclaimed'], 0)
+        self.assertIsNotNone(stats['last_run'])
+        self.assertEqual(LockToken.objects.count(), 1)
+
+        # The lock token of the leader expires after twice the maximum interval, and is
+        # not counted in the lock statistics
+        self.assertEqual(LockToken.objects.get().get_ttl(), 16)
+        self.assertEqual(compute_lock_stats()['total'], 0)
+
+    def test_adaptive_interval(self):
+        reaper = Reaper(batch_size=2, min_interval=1, max_interval=8)
+        reaper.max_batches = 2
+        reaper.interval = 4
+        self.create_expired_tokens(5)
+
+        # Many expired tokens: run more often
+        self.assertEqual(reaper.run_once(), 4)
+        self.assertEqual(reaper.interval, 2)
+        self.assertEqual(reaper.run_once(), 1)
+        self.assertEqual(reaper.interval, 2)
+        # No expired tokens: back off
+        self.assertEqual(reaper.run_once(), 0)
+        self.assertEqual(reaper.interval, 4)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.test import TransactionTestCase
+
+from tests.models import TestModel
+
+from lock_tokens.models import LockToken
+from lock_tokens.scheduler import RenewalScheduler
+
+
+class RenewalSchedulerTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.objs = [TestModel.objects.create(name='test %d' % i) for i in range(3)]
+        # Renewals are run by hand instead of from the scheduler thread
+        patcher = mock.patch.object(RenewalScheduler, '_start_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = RenewalScheduler(interval=60)
+
+    def test_batched_renewals(self):
+        lock_tokens = [LockToken.objects.create(locked_object=obj) for obj in self.objs]
+        entries = [self.scheduler.add(lock_token) for lock_token in lock_tokens]
+        self.assertEqual(self.scheduler.stats()['held'], 3)
+
+        # All the lock tokens are due, they are renewed with a single UPDATE
+        with self.assertNumQueries(1):
+            delay = self.scheduler.renew_due()
+        self.assertGreater(delay, 50)
+        self.assertEqual(self.scheduler.stats()['renewals'], 3)
+        locked_at = LockToken.objects.get(id=lock_tokens[0].id).locked_at
+        self.assertTrue(all(lock_token.locked_at == locked_at
+                            for lock_token in lock_tokens))
+
+        # Nothing is due until the next interval
+        with self.assertNumQueries(0):
+            self.scheduler.renew_due()
+
+        # Lost locks are not held anymore
+        lock_tokens[0].delete()
+        self.scheduler.remove(entries[1])
+        self.scheduler.renew_due(self.scheduler._heap[0][0] + 61)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats['held'], 1)
+        self.assertEqual(stats['failures'], 1)
+        self.assertGreater(stats['max_lag'], 60)
+
+    def test_fork_safety(self):
+        self.scheduler.add(LockToken.objects.create(locked_object=self.objs[0]))
+        with mock.patch('os.getpid', return_value=-1):
+            # A forked process does not hold its parent's locks
+            self.assertEqual(self.scheduler.stats()['held'], 0)
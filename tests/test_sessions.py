@@ -12,8 +12,12 @@ from django.test.client import Client
 from tests.models import TestModel
 
 from lock_tokens.exceptions import AlreadyLockedError, UnlockForbiddenError
+from lock_tokens.models import LockToken
 from lock_tokens.sessions import (
+    SESSION_KEY,
     check_for_session,
+    get_session_key,
+    get_session_token,
     lock_for_session,
     unlock_for_session
 )
@@ -55,6 +59,43 @@ class SessionLockingTestCase(TransactionTestCase):
         self.assertFalse(check_for_session(
             self.test_model_instance, other_session))
 
+    def test_session_storage(self):
+        other_instance = TestModel.objects.create(name='other test sessions')
+        session = SessionStore()
+        lock_for_session(self.test_model_instance, session)
+        lock_for_session(other_instance, session)
+        token = get_session_token(self.test_model_instance, session)
+        self.assertEqual(len(session.keys()), 1)
+        self.assertEqual(len(list(session[SESSION_KEY].values())[0]), 2)
+
+        # Renewing a lock does not modify the session
+        session.modified = False
+        lock_for_session(self.test_model_instance, session)
+        self.assertFalse(session.modified)
+        self.assertEqual(get_session_token(self.test_model_instance, session), token)
+
+        # The tokens of the locks released elsewhere are pruned when a token changes
+        other_instance.unlock(get_session_token(other_instance, session))
+        third_instance = TestModel.objects.create(name='third test sessions')
+        lock_for_session(third_instance, session)
+        self.assertTrue(session.modified)
+        self.assertIsNone(get_session_token(other_instance, session))
+        self.assertEqual(get_session_token(self.test_model_instance, session), token)
+
+        unlock_for_session(self.test_model_instance, session)
+        unlock_for_session(third_instance, session)
+        self.assertEqual(session[SESSION_KEY], {})
+
+    def test_legacy_session_key(self):
+        session = SessionStore()
+        token = self.test_model_instance.lock()['token']
+        session[get_session_key(self.test_model_instance)] = token
+        self.assertTrue(check_for_session(self.test_model_instance, session))
+        self.assertNotIn(get_session_key(self.test_model_instance), session)
+        self.assertEqual(get_session_token(self.test_model_instance, session), token)
+        unlock_for_session(self.test_model_instance, session)
+        self.assertFalse(LockToken.objects.exists())
+
     def test_view_decorators(self):
         c = Client()
 
@@ -0,0 +1,180 @@
+# -*- coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import json
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.contrib.sessions.backends.db import SessionStore
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+from django.test.client import Client
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from tests.models import TestModel
+
+from lock_tokens.exceptions import AlreadyLockedError, UnlockForbiddenError
+from lock_tokens.models import LockableModel, LockToken, SharedLockToken
+from lock_tokens.scheduler import RenewalScheduler
+from lock_tokens.sessions import check_for_session, lock_for_session, unlock_for_session
+from lock_tokens.settings import TIMEOUT
+from lock_tokens.utils import LockHolder
+
+
+class SharedLockTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.test_model_instance = TestModel.objects.create(name='test shared locks')
+
+    def test_shared_locking_scenario(self):
+        obj = self.test_model_instance
+        token_dict1 = obj.lock(shared=True)
+        token_dict2 = obj.lock(shared=True)
+        self.assertNotEqual(token_dict1['token'], token_dict2['token'])
+        self.assertTrue(obj.is_locked())
+        self.assertTrue(obj.check_lock_token(token_dict1['token']))
+        self.assertTrue(obj.check_lock_token(token_dict2['token']))
+        self.assertFalse(obj.check_lock_token('wrong_token'))
+        self.assertEqual(
+            LockableModel.check_lock_tokens_many({obj: token_dict2['token']}), {obj: True})
+        self.assertEqual(LockToken.objects.get().shared, True)
+        self.assertEqual(SharedLockToken.objects.count(), 2)
+
+        # Shared locks exclude exclusive locks
+        with self.assertRaises(AlreadyLockedError):
+            obj.lock()
+
+        # Holders renew their own token
+        renewed = obj.lock(token_dict1['token'], ttl=TIMEOUT * 2)
+        self.assertEqual(renewed['token'], token_dict1['token'])
+        self.assertEqual(LockToken.objects.get().expires_at,
+                         SharedLockToken.objects.get(token_str=renewed['token']).expires_at)
+
+        # The shared lock is kept until its last holder releases it
+        obj.unlock(token_dict1['token'])
+        self.assertTrue(obj.is_locked())
+        self.assertFalse(obj.check_lock_token(token_dict1['token']))
+        with self.assertRaises(UnlockForbiddenError):
+            obj.unlock(token_dict1['token'])
+        self.assertEqual(LockToken.objects.get().expires_at,
+                         SharedLockToken.objects.get().expires_at)
+        obj.unlock(token_dict2['token'])
+        self.assertFalse(obj.is_locked())
+        self.assertFalse(LockToken.objects.exists())
+
+        # Exclusive locks exclude shared locks
+        obj.lock()
+        with self.assertRaises(AlreadyLockedError):
+            obj.lock(shared=True)
+
+    def test_expired_shared_lock(self):
+        obj = self.test_model_instance
+        token_dict = obj.lock(shared=True)
+        expired_at = timezone.now() - datetime.timedelta(seconds=1)
+        LockToken.objects.update(expires_at=expired_at)
+        SharedLockToken.objects.update(expires_at=expired_at)
+        self.assertFalse(obj.is_locked())
+
+        # The expired holder token is valid until the object is locked exclusively
+        self.assertTrue(obj.check_lock_token(token_dict['token']))
+        obj.lock()
+        self.assertFalse(obj.check_lock_token(token_dict['token']))
+
+        # Expired shared lock tokens are removed with the expired lock tokens
+        self.assertEqual(LockToken.objects.delete_expired_batch(timezone.now(), 10), 1)
+        self.assertFalse(SharedLockToken.objects.exists())
+
+    @mock.patch.object(RenewalScheduler, '_start_thread')
+    def test_lock_holder(self, start_thread):
+        obj = self.test_model_instance
+        token = obj.lock(shared=True)['token']
+        other_token = obj.lock(shared=True)['token']
+        scheduler = RenewalScheduler()
+        with mock.patch('lock_tokens.scheduler.get_scheduler', return_value=scheduler):
+            lock_holder = LockHolder(obj, token)
+            lock_holder.start()
+            self.assertIsInstance(lock_holder._lock_token, SharedLockToken)
+
+            # The holder token is renewed after its lifetime, and extends the shared lock
+            expired_at = timezone.now() - datetime.timedelta(seconds=1)
+            LockToken.objects.update(expires_at=expired_at)
+            SharedLockToken.objects.update(expires_at=expired_at)
+            self.assertFalse(obj.is_locked())
+            scheduler.renew_due()
+            self.assertEqual(scheduler.stats()['failures'], 0)
+            self.assertTrue(obj.is_locked())
+            self.assertGreater(SharedLockToken.objects.get(token_str=token).expires_at,
+                               timezone.now())
+            self.assertLess(SharedLockToken.objects.get(token_str=other_token).expires_at,
+                            timezone.now())
+            lock_holder.stop()
+
+    def test_api(self):
+        client = Client()
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                          self.test_model_instance.id])
+        r = client.post(base_url + '?shared=1')
+        self.assertEqual(r.status_code, 201)
+        token1 = json.loads(force_text(r.content))['token']
+        r = client.post(base_url + '?shared=1')
+        self.assertEqual(r.status_code, 201)
+        token2 = json.loads(force_text(r.content))['token']
+        self.assertEqual(client.post(base_url).status_code, 409)
+
+        r = client.get(base_url + token1 + '/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(force_text(r.content))['token'], token1)
+        self.assertEqual(client.get(base_url + 'wrong_token/').status_code, 403)
+        self.assertEqual(client.patch(base_url + token2 + '/').status_code, 200)
+
+        self.assertEqual(client.delete(base_url + token1 + '/').status_code, 204)
+        self.assertEqual(client.get(base_url + token1 + '/').status_code, 403)
+        self.assertEqual(client.delete(base_url + token2 + '/').status_code, 204)
+        self.assertFalse(self.test_model_instance.is_locked())
+
+        r = client.post(reverse('lock-tokens:batch-view'), json.dumps({'operations': [
+            {'action': 'lock', 'app_label': 'tests', 'model': 'testmodel',
+             'object_id': self.test_model_instance.id, 'shared': True},
+        ] * 2}), content_type='application/json')
+        self.assertEqual([result['status'] for result in json.loads(
+            force_text(r.content))['results']], [201, 201])
+
+        # Only boolean values are accepted
+        self.assertEqual(client.post(base_url + '?shared=yes').status_code, 400)
+        self.assertEqual(client.post(base_url + '?shared=false').status_code, 409)
+        r = client.post(reverse('lock-tokens:batch-view'), json.dumps({'operations': [
+            {'action': 'lock', 'app_label': 'tests', 'model': 'testmodel',
+             'object_id': self.test_model_instance.id, 'shared': shared}
+            for shared in ('1', 'false', False, 0, 'no', 2, None)
+        ]}), content_type='application/json')
+        self.assertEqual([result['status'] for result in json.loads(
+            force_text(r.content))['results']], [201, 409, 409, 409, 400, 400, 409])
+
+    def test_sessions(self):
+        obj = self.test_model_instance
+        session = SessionStore()
+        other_session = SessionStore()
+        lock_for_session(obj, session, shared=True)
+        lock_for_session(obj, other_session, shared=True)
+        self.assertTrue(check_for_session(obj, session))
+        self.assertTrue(check_for_session(obj, other_session))
+        with self.assertRaises(AlreadyLockedError):
+            lock_for_session(obj, SessionStore())
+
+        # Locking again renews the token of the session
+        token = session['_lock_tokens']
+        lock_for_session(obj, session, shared=True)
+        self.assertEqual(session['_lock_tokens'], token)
+
+        unlock_for_session(obj, session)
+        self.assertFalse(check_for_session(obj, session))
+        self.assertTrue(check_for_session(obj, other_session))
+        unlock_for_session(obj, other_session)
+        self.assertFalse(obj.is_locked())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+import json
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TransactionTestCase
+from django.test.client import Client
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from tests.models import TestChildModel, TestModel, TestParentModel
+
+from lock_tokens import signing
+from lock_tokens.exceptions import UnlockForbiddenError
+from lock_tokens.models import LockToken
+from lock_tokens.scheduler import RenewalScheduler
+from lock_tokens.sessions import (
+    SESSION_KEY,
+    check_for_session,
+    get_held_session_lock,
+    lock_for_session,
+)
+from lock_tokens.utils import LockHolder
+
+
+@mock.patch('lock_tokens.signing.SIGNED_TOKENS', True)
+class SignedTokensTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.obj = TestModel.objects.create(name='signed')
+        self.other_obj = TestModel.objects.create(name='other')
+        # Fill the content type cache
+        ContentType.objects.get_for_models(TestModel, TestParentModel, TestChildModel)
+
+    def test_sign_token(self):
+        token = self.obj.lock()['token']
+        lock_token = LockToken.objects.get()
+        signed_token = signing.unsign_token(token)
+        self.assertEqual(signed_token.token_str, lock_token.token_str)
+        self.assertEqual(signed_token.contenttype_id,
+                         lock_token.locked_object_content_type_id)
+        self.assertEqual(signed_token.object_id, str(self.obj.id))
+        self.assertEqual(signing.get_token_str(token), lock_token.token_str)
+
+        self.assertIsNone(signing.unsign_token(token[:-1] + 'x'))
+        self.assertIsNone(signing.unsign_token(
+            token.replace('_%s_' % self.obj.id, '_%s_' % self.other_obj.id, 1)))
+        self.assertIsNone(signing.unsign_token(lock_token.token_str))
+        self.assertIsNone(signing.unsign_token(None))
+
+    def test_check_lock_token(self):
+        token = self.obj.lock()['token']
+        lock_token = LockToken.objects.get()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.obj.check_lock_token(token))
+
+        lock_token.expires_at = lock_token.locked_at - datetime.timedelta(seconds=1)
+        expired_token = signing.sign_token(lock_token)
+        # Forged, mismatched and expired tokens are rejected without any query
+        with self.assertNumQueries(0):
+            self.assertFalse(self.obj.check_lock_token(token[:-1] + 'x'))
+            self.assertFalse(self.obj.check_lock_token(lock_token.token_str))
+            self.assertFalse(self.other_obj.check_lock_token(token))
+            self.assertFalse(self.obj.check_lock_token(expired_token))
+            self.assertEqual(TestModel.check_lock_tokens_many({self.other_obj: token}),
+                             {self.other_obj: False})
+
+        # Valid tokens are still checked against the lock tokens
+        with self.assertRaises(UnlockForbiddenError):
+            self.other_obj.unlock(token)
+        self.obj.unlock(token)
+        self.assertFalse(self.obj.check_lock_token(token))
+
+    def test_renew(self):
+        token = self.obj.lock(ttl=60)['token']
+        renewed_token = self.obj.lock(token, ttl=120)['token']
+        self.assertNotEqual(renewed_token, token)
+        self.assertEqual(signing.get_token_str(renewed_token), signing.get_token_str(token))
+        self.assertGreater(signing.unsign_token(renewed_token).expires_at,
+                           signing.unsign_token(token).expires_at)
+        self.assertTrue(self.obj.check_lock_token(token))
+        self.assertTrue(self.obj.check_lock_token(renewed_token))
+        self.assertEqual(LockToken.objects.count(), 1)
+
+    def test_ancestor_token(self):
+        parent = TestParentModel.objects.create(name='parent')
+        child = TestChildModel.objects.create(parent=parent, name='child')
+        token = parent.lock()['token']
+        self.assertTrue(child.check_lock_token(token))
+        other_token = self.obj.lock()['token']
+        with self.assertNumQueries(0):
+            self.assertFalse(child.check_lock_token(other_token))
+
+    def test_api(self):
+        client = Client()
+        token = self.obj.lock()['token']
+        base_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                          self.obj.id])
+        other_url = reverse('lock-tokens:list-view', args=['tests', 'testmodel',
+                                                           self.other_obj.id])
+        r = client.get(base_url + token + '/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(client.get(other_url + token + '/').status_code, 403)
+        self.assertEqual(client.delete(other_url + token + '/').status_code, 403)
+
+        r = client.patch(base_url + token + '/')
+        self.assertEqual(r.status_code, 200)
+        renewed_token = json.loads(force_text(r.content))['token']
+        self.assertEqual(client.delete(base_url + renewed_token + '/').status_code, 204)
+        self.assertFalse(LockToken.objects.exists())
+
+    def test_session(self):
+        session = SessionStore()
+        lock_for_session(self.obj, session, ttl=60)
+        contenttype_id = str(ContentType.objects.get_for_model(TestModel).id)
+        token = session[SESSION_KEY][contenttype_id][str(self.obj.id)]
+        self.assertEqual(signing.get_token_str(token), LockToken.objects.get().token_str)
+        self.assertTrue(check_for_session(self.obj, session))
+
+        # The session keeps the token carrying the last expiration time of the lock
+        lock_for_session(self.obj, session, ttl=120)
+        self.assertNotEqual(session[SESSION_KEY][contenttype_id][str(self.obj.id)], token)
+        self.assertTrue(check_for_session(self.obj, session))
+        self.assertFalse(check_for_session(self.other_obj, session))
+
+    @mock.patch.object(RenewalScheduler, '_start_thread')
+    def test_session_lock_holder(self, start_thread):
+        session = SessionStore()
+        lock_for_session(self.obj, session, ttl=60)
+        scheduler = RenewalScheduler()
+        with mock.patch('lock_tokens.scheduler.get_scheduler', return_value=scheduler):
+            lock_holder = LockHolder(*get_held_session_lock(self.obj, session))
+            lock_holder.start()
+            # The lock is held past the expiration time of the token of the session
+            later = timezone.now() + datetime.timedelta(seconds=120)
+            with mock.patch('django.utils.timezone.now', return_value=later):
+                scheduler.renew_due()
+                self.assertEqual(scheduler.stats()['failures'], 0)
+                self.assertGreater(LockToken.objects.get().expires_at, later)
+                self.assertTrue(check_for_session(self.obj, session))
+            lock_holder.stop()
+
+        # The token of the session is still checked against the lock
+        LockToken.objects.all().delete()
+        self.assertFalse(check_for_session(self.obj, session))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TransactionTestCase
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+from django.utils import timezone
+
+import six
+
+from tests.models import TestChildModel, TestModel, TestParentModel
+
+from lock_tokens import hierarchy, metrics, state_cache
+from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.models import LockableModel, LockToken
+from lock_tokens.settings import STATE_CACHE_INVALIDATION_TIMEOUT
+
+
+@mock.patch('lock_tokens.state_cache.STATE_CACHE_ENABLED', True)
+# Changed objects are not cached again until their invalidated marker expires
+@mock.patch('lock_tokens.state_cache.STATE_CACHE_INVALIDATION_TIMEOUT', 0)
+class StateCacheTestCase(TransactionTestCase):
+
+    def setUp(self):
+        state_cache.get_cache().clear()
+        state_cache.reset_counters()
+        self.obj = TestModel.objects.create(name='cached')
+        # Fill the content type cache
+        ContentType.objects.get_for_models(TestModel, TestParentModel, TestChildModel)
+
+    def test_read_through(self):
+        registry = metrics.MetricsRegistry()
+        metrics.set_sink(registry)
+        try:
+            token = self.obj.lock()['token']
+            with self.assertNumQueries(1):
+                self.assertTrue(self.obj.is_locked())
+            with self.assertNumQueries(0):
+                self.assertTrue(self.obj.is_locked())
+                self.assertTrue(self.obj.check_lock_token(token))
+                self.assertEqual(LockToken.objects.get_for_object(self.obj).token_str,
+                                 token)
+        finally:
+            metrics.set_sink(None)
+        self.assertEqual(state_cache.get_counters(), {'hits': 3, 'misses': 1})
+        self.assertEqual(registry.get_counter('lock_tokens_state_cache_lookups_total',
+                                              content_type='tests.testmodel',
+                                              result='hit'), 3)
+
+    def test_negative_results(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(self.obj.is_locked())
+        with self.assertNumQueries(0):
+            self.assertFalse(self.obj.is_locked())
+            with self.assertRaises(LockToken.DoesNotExist):
+                LockToken.objects.get_for_object(self.obj)
+
+        state_cache.get_cache().clear()
+        with mock.patch('lock_tokens.state_cache.STATE_CACHE_NEGATIVE_TIMEOUT', 0):
+            self.assertFalse(self.obj.is_locked())
+            with self.assertNumQueries(1):
+                self.assertFalse(self.obj.is_locked())
+
+    def test_invalidation(self):
+        self.assertFalse(self.obj.is_locked())
+        token = self.obj.lock(ttl=60)['token']
+        self.assertTrue(self.obj.is_locked())
+
+        expires_at = LockToken.objects.get_for_object(self.obj).expires_at
+        self.obj.lock(token, ttl=120)
+        self.assertGreater(LockToken.objects.get_for_object(self.obj).expires_at,
+                           expires_at)
+
+        self.obj.unlock(token)
+        self.assertFalse(self.obj.is_locked())
+        LockableModel.lock_many([self.obj])
+        self.assertTrue(self.obj.is_locked())
+
+        # Expired lock tokens removed by the reaper (the update made outside of
+        # lock_tokens is not seen through the cache)
+        LockToken.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertTrue(self.obj.is_locked())
+        LockToken.objects.delete_expired_batch(timezone.now(), 10)
+        with self.assertRaises(LockToken.DoesNotExist):
+            LockToken.objects.get_for_object(self.obj)
+
+    def test_release_paths(self):
+        def lock():
+            token = self.obj.lock()['token']
+            # Cached
+            self.assertTrue(self.obj.is_locked())
+            self.assertTrue(self.obj.is_locked())
+            return token
+
+        self.obj.unlock(lock())
+        self.assertFalse(self.obj.is_locked())
+
+        LockToken.objects.release_many([lock()])
+        self.assertFalse(self.obj.is_locked())
+
+        lock()
+        LockToken.objects.get().delete()
+        self.assertFalse(self.obj.is_locked())
+
+        lock()
+        LockToken.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        call_command('remove_expired_locks', stdout=six.StringIO())
+        self.assertFalse(self.obj.is_locked())
+
+        lock()
+        user = User.objects.create(username='user', is_staff=True, is_superuser=True)
+        user.set_password('test')
+        user.save()
+        client = Client()
+        self.assertTrue(client.login(username=user.username, password='test'))
+        r = client.post(reverse('admin:lock_tokens_locktoken_changelist'), {
+            'action': 'delete_selected', '_selected_action': [LockToken.objects.get().pk],
+            'post': 'yes'})
+        self.assertEqual(r.status_code, 302)
+        self.assertFalse(LockToken.objects.exists())
+        self.assertFalse(self.obj.is_locked())
+
+    def test_lookup_race(self):
+        contenttype = ContentType.objects.get_for_model(TestModel)
+        key = (contenttype, self.obj.id)
+        with mock.patch('lock_tokens.state_cache.STATE_CACHE_INVALIDATION_TIMEOUT',
+                        STATE_CACHE_INVALIDATION_TIMEOUT):
+            token = self.obj.lock()['token']
+            # A lookup reads the lock token, which is released before it caches it
+            self.assertEqual(state_cache.get(*key), (False, None))
+            lock_token = LockToken.objects.get()
+            self.obj.unlock(token)
+            state_cache.set_many({key: lock_token})
+            self.assertFalse(self.obj.is_locked())
+            # Recently changed objects are not cached
+            with self.assertNumQueries(1):
+                self.assertFalse(self.obj.is_locked())
+
+        # The entries are invalidated again when the transaction commits
+        token = self.obj.lock()['token']
+        self.assertTrue(self.obj.is_locked())
+        with transaction.atomic():
+            self.obj.unlock(token)
+            lock_token = LockToken(locked_object=self.obj, token_str=token,
+                                   expires_at=timezone.now() + datetime.timedelta(hours=1))
+            state_cache.set_many({key: lock_token})
+            self.assertTrue(self.obj.is_locked())
+        self.assertFalse(self.obj.is_locked())
+
+    def test_shared_locks(self):
+        token = self.obj.lock(shared=True)['token']
+        other_token = self.obj.lock(shared=True)['token']
+        self.assertTrue(self.obj.is_locked())
+        self.obj.unlock(token)
+        self.assertTrue(self.obj.is_locked())
+        self.obj.unlock(other_token)
+        self.assertFalse(self.obj.is_locked())
+
+    def test_hierarchy(self):
+        parent = TestParentModel.objects.create(name='parent')
+        child = TestChildModel.objects.create(parent=parent, name='child')
+        self.assertFalse(child.is_locked())
+        with self.assertNumQueries(0):
+            self.assertFalse(child.is_locked())
+        token = parent.lock()['token']
+        self.assertTrue(child.is_locked())
+        with self.assertNumQueries(0):
+            self.assertTrue(child.is_locked())
+        parent.unlock(token)
+        self.assertFalse(child.is_locked())
+
+    def test_lock_decisions_bypass_cache(self):
+        parent = TestParentModel.objects.create(name='parent')
+        child = TestChildModel.objects.create(parent=parent, name='child')
+        self.assertFalse(child.is_locked())
+        # A lock token created by other means is not seen by the cached lookups, but
+        # the lookups that decide whether an object can be locked do not use the cache
+        LockToken.objects.bulk_create([LockToken(
+            locked_object=parent, expires_at=timezone.now() + datetime.timedelta(hours=1))])
+        self.assertFalse(child.is_locked())
+        with self.assertRaises(AlreadyLockedError):
+            child.lock()
+        self.assertEqual(hierarchy.get_blocked_objects([child]), [child])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import Client, TransactionTestCase
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+from tests.models import RegularModel, TestModel
+
+from lock_tokens.models import LockableModel, LockToken
+from lock_tokens.settings import TIMEOUT
+from lock_tokens.stats import get_lock_stats
+
+
+class LockStatsTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.instances = [TestModel.objects.create(name='test stats %d' % i)
+                          for i in range(3)]
+        self.regular_instance = RegularModel.objects.create(name='test stats')
+        for instance in self.instances:
+            instance.lock()
+        expired_token = LockableModel._lock(self.regular_instance)
+        expired_token.locked_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.expires_at -= datetime.timedelta(seconds=TIMEOUT + 1)
+        expired_token.save()
+        LockToken.objects.filter(pk=expired_token.pk).update(created=expired_token.locked_at)
+        self.expired_token = expired_token
+
+    def test_lock_stats(self):
+        with self.assertNumQueries(1):
+            stats = get_lock_stats()
+        self.assertEqual((stats['total'], stats['active'], stats['expired']), (4, 3, 1))
+        self.assertEqual(stats['oldest_locked_at'], self.expired_token.locked_at)
+        self.assertGreaterEqual(stats['oldest_lock_age'], TIMEOUT)
+        self.assertEqual(
+            [(c['id'], c['active'], c['expired']) for c in stats['content_types']],
+            [(ContentType.objects.get_for_model(TestModel).id, 3, 0),
+             (ContentType.objects.get_for_model(RegularModel).id, 0, 1)])
+
+        # The statistics are cached
+        LockableModel.lock(RegularModel.objects.create(name='other test stats'))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_lock_stats()['total'], 4)
+        self.assertEqual(get_lock_stats(refresh=True)['total'], 5)
+
+    def test_renewed_lock_age(self):
+        created = self.expired_token.locked_at - datetime.timedelta(hours=1)
+        instance = TestModel.objects.create(name='renewed test stats')
+        token = instance.lock()['token']
+        LockToken.objects.filter(locked_object_id=instance.id,
+                                 locked_object_content_type=ContentType.objects.get_for_model(
+                                     TestModel)).update(created=created)
+        # A lock that has just been renewed is still the oldest one
+        instance.lock(token)
+        stats = get_lock_stats(refresh=True)
+        self.assertEqual(stats['oldest_locked_at'], created)
+        self.assertGreaterEqual(stats['oldest_lock_age'], TIMEOUT + 3600)
+        self.assertEqual(stats['content_types'][0]['oldest_locked_at'], created)
+
+    def test_admin_views(self):
+        user = User.objects.create(username='user', is_staff=True, is_superuser=True)
+        user.set_password('test')
+        user.save()
+        client = Client()
+        self.assertTrue(client.login(username=user.username, password='test'))
+
+        r = client.get(reverse('admin:lock_tokens_locktoken_stats'))
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, '3 active locks, 1 expired lock.')
+
+        r = client.get(reverse('admin:lock_tokens_locktoken_stats_json'))
+        self.assertEqual(r.status_code, 200)
+        stats = json.loads(r.content.decode('utf-8'))
+        self.assertEqual((stats['total'], stats['active'], stats['expired']), (4, 3, 1))
+        self.assertEqual(len(stats['content_types']), 2)
+
+        # Content type filter lookups are served from the cached statistics
+        r = client.get(reverse('admin:lock_tokens_locktoken_changelist'))
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, '?contenttype=%d' %
+                            ContentType.objects.get_for_model(RegularModel).id)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8
+from __future__ import absolute_import
+
+import threading
+import time
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TransactionTestCase
+
+from tests.models import TestModel
+
+from lock_tokens.exceptions import AlreadyLockedError
+from lock_tokens.sessions import lock_for_session
+from lock_tokens.waiters import notify_released, wait_for_lock
+
+
+class WaitForLockTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.obj = TestModel.objects.create(name='test waiters')
+
+    def test_wake_up_on_release(self):
+        released = threading.Event()
+
+        def acquire():
+            if not released.is_set():
+                raise AlreadyLockedError
+            return 'token'
+
+        def release():
+            released.set()
+            notify_released(1, self.obj.id)
+
+        timer = threading.Timer(0.1, release)
+        started = time.time()
+        timer.start()
+        # Without the wake-up, the second attempt would be made after 5 seconds
+        with mock.patch('lock_tokens.waiters.INITIAL_DELAY', 10):
+            self.assertEqual(wait_for_lock(acquire, 1, self.obj.id, 20), 'token')
+        timer.join()
+        self.assertLess(time.time() - started, 3)
+
+    def test_lock_wait(self):
+        token = self.obj.lock()['token']
+        started = time.time()
+        with self.assertRaises(AlreadyLockedError):
+            self.obj.lock(wait=0.3)
+        self.assertGreaterEqual(time.time() - started, 0.3)
+        with self.assertRaises(AlreadyLockedError):
+            lock_for_session(self.obj, SessionStore(), wait=0.1)
+
+        with mock.patch('lock_tokens.models.notify_released') as notify:
+            self.obj.unlock(token)
+        notify.assert_called_once_with(ContentType.objects.get_for_model(TestModel).id,
+                                       self.obj.id)
+        self.assertTrue(self.obj.check_lock_token(self.obj.lock(wait=1)['token']))
@@ -1,7 +1,24 @@
 # -*- coding: utf-8
 from __future__ import absolute_import
 
+import django
+
 from tests.test_admin import *
 from tests.test_api import *
+from tests.test_backends import *
+from tests.test_commands import *
+from tests.test_hierarchy import *
+from tests.test_js_client import *
+from tests.test_metrics import *
 from tests.test_models import *
+from tests.test_reaper import *
+from tests.test_scheduler import *
 from tests.test_sessions import *
+from tests.test_shared_locks import *
+from tests.test_signed_tokens import *
+from tests.test_state_cache import *
+from tests.test_stats import *
+from tests.test_waiters import *
+
+if django.VERSION >= (3, 1):
+    from tests.test_aio import *
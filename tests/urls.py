@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+import django
 from django.conf.urls import include, url
 from django.contrib import admin
 
 from tests import views
 
 import lock_tokens.urls
+from lock_tokens.views import metrics_view
 
 urlpatterns = [
     url(r'^lock-tokens/', include(lock_tokens.urls, namespace='lock-tokens')),
@@ -16,4 +18,18 @@ urlpatterns = [
     url(r'^test3/(?P<object_id>\d+)/$', views.test_view_3,
         name='view-that-unlocks-object'),
     url(r'^admin/', admin.site.urls),
+    url(r'^metrics/$', metrics_view, name='lock-tokens-metrics'),
 ]
+
+if django.VERSION >= (3, 1):
+    from tests import aio_views
+    import lock_tokens.aio_urls
+
+    urlpatterns += [
+        url(r'^lock-tokens-async/', include(lock_tokens.aio_urls,
+                                            namespace='lock-tokens-async')),
+        url(r'^async-test1/(?P<object_id>\d+)/$', aio_views.test_async_view_1,
+            name='async-view-that-locks-object'),
+        url(r'^async-test2/(?P<object_id>\d+)/$', aio_views.test_async_view_2,
+            name='async-view-that-unlocks-object'),
+    ]